@@ -1,77 +1,393 @@
 """
 Elasticsearch Storage - Zapis i odczyt logow
 Kompatybilny z ES 7.x i 8.x
+Oparty o AsyncElasticsearch - zapytania nie blokuja event loopa FastAPI.
+Klient jest zwiazany z event loopem aplikacji; writer kolektora dziala w tym
+samym loopie i wspoldzieli pule polaczen.
 """
 
+import asyncio
+import hashlib
+import json
 import logging
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
+import random
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import date, datetime, timedelta
+from typing import Dict, Any, List, Optional, Set, Tuple, Union
+
+from es_query import (STATS_TERMS, auto_interval, auto_interval_minutes, build_rollup_source,
+                      build_search, build_stats, total_hits)
 
 logger = logging.getLogger(__name__)
 
+# Statusy pozycji/zapytan bulk odrzuconych trwale (np. blad mapowania) - do dead-letter.
+# Pozostale 4xx/5xx (429, 401/403 przy rotacji hasel, cluster_block_exception przy
+# przekroczonym disk watermark, 404, 500) sa przejsciowe i ponawiane, a po
+# wyczerpaniu prob wracaja do spoola.
+PERMANENT_STATUSES = {400}
+
+# daily - index na dzien zdarzenia ({prefix}-YYYY.MM.DD), retencja przez RetentionJob
+# ilm   - zapis przez alias {prefix}-write, rollover wg rozmiaru/liczby dokumentow (ILM)
+INDEX_MODES = ('daily', 'ilm')
+
+# Domyslna polityka ILM (elasticsearch.ilm w config.yaml nadpisuje pojedyncze klucze)
+ILM_DEFAULTS: Dict[str, Any] = {
+    "rollover_max_primary_shard_size": "30gb",
+    "rollover_max_docs": None,
+    "rollover_max_age": "30d",  # gorny limit - cichy strumien tez kiedys sie zrolluje
+    "warm_min_age": "2d",
+    "warm_force_merge_segments": 1,
+    "warm_read_only": True,
+    "warm_replicas": None,
+}
+
+
+# Mapowanie dokumentow logow (szablon indeksow)
+INDEX_MAPPINGS: Dict[str, Any] = {
+    "properties": {
+        "timestamp": {"type": "date"},
+        "severity": {"type": "keyword"},
+        "level": {"type": "keyword"},
+        "source": {"type": "keyword"},
+        "source_type": {"type": "keyword"},
+        "event_type": {"type": "keyword"},
+        "operation": {"type": "keyword"},
+        "message": {"type": "text"},
+        "raw": {"type": "text"},
+        "database": {"type": "keyword"},
+        "table_name": {"type": "keyword"},
+        "user": {"type": "keyword"},
+        "duration_ms": {"type": "long"},
+        "docs_examined": {"type": "long"},
+        "docs_returned": {"type": "long"},
+        "collected_at": {"type": "date"}
+    }
+}
+
+# standard - message i raw jako text, dodatkowe pola mapowane dynamicznie
+# lean     - pelny tekst tylko w message, raw tylko w _source, bez dynamicznego
+#            mapowania, kodek best_compression, bez zdublowanych pol
+MAPPING_PROFILES = ('standard', 'lean')
+
+LEAN_MAPPINGS: Dict[str, Any] = {
+    # Nieznane pola (context z frontendu itp.) zostaja w _source, ale nie
+    # dostaja mapowania - wczesniej kazde pole tekstowe dostawalo text + .keyword
+    "dynamic": False,
+    "properties": {
+        "timestamp": {"type": "date"},
+        "severity": {"type": "keyword"},
+        "source": {"type": "keyword"},
+        "source_type": {"type": "keyword"},
+        "event_type": {"type": "keyword"},
+        # Wyniki sortowane po timestamp - score (i normy) niepotrzebne
+        "message": {"type": "text", "norms": False},
+        "raw": {"type": "text", "index": False},
+        "database": {"type": "keyword"},
+        "table_name": {"type": "keyword"},
+        "user": {"type": "keyword"},
+        "component": {"type": "keyword"},
+        "affected_rows": {"type": "long"},
+        "duration_ms": {"type": "long"},
+        "docs_examined": {"type": "long"},
+        "docs_returned": {"type": "long"},
+        "collected_at": {"type": "date"},
+        "context": {"type": "object", "enabled": False},
+    }
+}
+
+# Profil lean: pole zdublowane -> pole docelowe (wartosc przenoszona, gdy docelowego brak)
+LEAN_ALIASES = {"level": "severity", "operation": "event_type"}
+
+
+def document_id(log: Dict[str, Any], position: Optional[str] = None) -> str:
+    """Deterministyczne _id: zrodlo + pozycja w zrodle + hash tresci.
+
+    Ten sam log zebrany ponownie (restart, replay spoola, sync-to-es) dostaje
+    to samo _id, a zapis operacja `create` nie tworzy duplikatu. Bez pozycji
+    (np. logi frontendu) zastepuje ja timestamp.
+    """
+    key = "\x1f".join((
+        str(log.get("source", "")),
+        str(position if position is not None else log.get("timestamp", "")),
+        str(log.get("raw") or log.get("message") or ""),
+    ))
+    return hashlib.sha1(key.encode("utf-8", errors="ignore")).hexdigest()
+
+
+def parse_timestamp(value: Any) -> Optional[datetime]:
+    """Timestamp loga (ISO string albo datetime) jako czas lokalny bez strefy;
+    None gdy nieczytelny"""
+    if isinstance(value, datetime):
+        parsed = value
+    elif isinstance(value, str) and value:
+        try:
+            parsed = datetime.fromisoformat(value.strip().replace('Z', '+00:00').replace(' ', 'T', 1))
+        except ValueError:
+            return None
+    else:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+
+# Rollup: wymiary, po ktorych liczone sa wstepnie zagregowane dokumenty
+ROLLUP_DIMENSIONS = ["source", "source_type", "severity", "event_type", "table_name", "user"]
+ROLLUP_GRANULARITIES = {"1m": timedelta(minutes=1), "1h": timedelta(hours=1)}
+ROLLUP_CHUNKS = {"1m": timedelta(hours=6), "1h": timedelta(days=7)}  # zakres jednej agregacji composite
+ROLLUP_PAGE_SIZE = 1000  # kubelkow composite na strone
+ROLLUP_DELAY = timedelta(minutes=1)  # logi w drodze (writer, spool) - kubelek zamykany z opoznieniem
+ROLLUP_LOOKBACK = {"1m": 10, "1h": 2}  # tyle ostatnich kubelkow liczonych ponownie (spoznione logi)
+
+ROLLUP_MAPPINGS: Dict[str, Any] = {
+    "dynamic": False,
+    "properties": {
+        "timestamp": {"type": "date"},
+        "granularity": {"type": "keyword"},
+        "count": {"type": "long"},
+        **{field: {"type": "keyword"} for field in ROLLUP_DIMENSIONS},
+    }
+}
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def floor_time(value: datetime, step: timedelta) -> datetime:
+    """Poczatek kubelka `step` (wyrownanie jak fixed_interval w ES)"""
+    return EPOCH + (value - EPOCH) // step * step
+
+
+@dataclass
+class BulkResult:
+    """Wynik bulk_index"""
+    saved: int = 0
+    retried: int = 0
+    dead_lettered: int = 0
+    duplicates: int = 0  # juz w ES (409 przy create) - liczone tez w saved
+    retryable: List[Dict[str, Any]] = field(default_factory=list)  # do ponowienia pozniej (spool)
+
 
 class ElasticsearchStorage:
     """Klasa do obslugi Elasticsearch"""
 
-    def __init__(self, hosts: List[str], index_prefix: str = "logs"):
+    def __init__(
+            self,
+            hosts: List[str],
+            index_prefix: str = "logs",
+            failure_threshold: int = 3,
+            connections_per_node: int = 10,
+            request_timeout: float = 10,
+            max_retries: int = 3,
+            node_class: Optional[str] = None,
+            bulk_max_attempts: int = 5,
+            bulk_backoff: float = 0.5,
+            bulk_backoff_max: float = 10.0,
+            dead_letter: Optional[Any] = None,
+            number_of_shards: int = 1,
+            number_of_replicas: Optional[int] = None,
+            refresh_interval: str = "5s",
+            route_max_past_days: int = 365,
+            route_max_future_hours: float = 24,
+            search_max_indices: int = 60,
+            index_mode: str = "daily",
+            retention_days: Optional[int] = 30,
+            ilm: Optional[Dict[str, Any]] = None,
+            rollup_enabled: bool = False,
+            rollup_raw_max_hours: float = 24,
+            rollup_minute_days: int = 7,
+            rollup_backfill_days: Optional[int] = None,
+            mapping_profile: str = "standard"
+    ):
         self.hosts = hosts
         self.index_prefix = index_prefix
+        self.connections_per_node = connections_per_node
+        self.request_timeout = request_timeout
+        self.max_retries = max_retries
+        self.node_class = node_class
+        self.bulk_max_attempts = bulk_max_attempts
+        self.bulk_backoff = bulk_backoff
+        self.bulk_backoff_max = bulk_backoff_max
+        self.dead_letter = dead_letter
+        self.bulk_errors: Dict[str, int] = {}
+        self.number_of_shards = number_of_shards
+        self.number_of_replicas = number_of_replicas
+        self.refresh_interval = refresh_interval
+        self.template_installed = False
+        self.route_max_past_days = route_max_past_days
+        self.route_max_future_hours = route_max_future_hours
+        self.search_max_indices = search_max_indices
+        self.clamped_timestamps = 0
+        self.duplicates = 0
+        if index_mode not in INDEX_MODES:
+            raise ValueError(f"Nieznany index_mode: {index_mode} (dozwolone: {', '.join(INDEX_MODES)})")
+        self.index_mode = index_mode
+        self.retention_days = retention_days
+        self.ilm = {**ILM_DEFAULTS, **(ilm or {})}
+        self._write_alias_ready = False
+        if mapping_profile not in MAPPING_PROFILES:
+            raise ValueError(f"Nieznany mapping_profile: {mapping_profile} "
+                             f"(dozwolone: {', '.join(MAPPING_PROFILES)})")
+        self.mapping_profile = mapping_profile
+        self.text_fields = ["message"] if mapping_profile == 'lean' else None
+
+        # Rollup: dla kazdej ziarnistosci [najstarszy kubelek, koniec ostatniego policzonego)
+        self.rollup_enabled = rollup_enabled
+        self.rollup_raw_max_hours = rollup_raw_max_hours
+        self.rollup_minute_days = rollup_minute_days
+        self.rollup_backfill_days = rollup_backfill_days or retention_days or 30
+        self.rollup_earliest: Dict[str, datetime] = {}
+        self.rollup_watermarks: Dict[str, datetime] = {}
+        self.rollup_late: Dict[str, datetime] = {}  # najstarszy log zapisany po policzeniu jego kubelka
+        self.rollup_docs_written = 0
+        self._rollup_state_loaded = False
+        self._known_indices: Set[str] = set()
+        self._known_day: Optional[date] = None
         self.es = None
         self.is_connected = False
+        self.version: Optional[str] = None
 
-    async def connect(self) -> bool:
-        """Polacz z Elasticsearch"""
-        try:
-            from elasticsearch import Elasticsearch
-
-            # Dla ES 8.x - wylacz weryfikacje SSL i dodaj timeout
-            self.es = Elasticsearch(
-                self.hosts,
-                verify_certs=False,
-                ssl_show_warn=False,
-                request_timeout=10,
-                retry_on_timeout=True,
-                max_retries=3
-            )
+        # Stan polaczenia wynika z faktycznych wynikow zapytan
+        self.failure_threshold = failure_threshold
+        self.consecutive_failures = 0
+        self.last_success_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.connects = 0
+        self.disconnects = 0
+        self.last_transition: Optional[str] = None
+        self.transitions: deque = deque(maxlen=20)
+        self._state_lock = threading.Lock()
 
-            # Test polaczenia z lepszym error handling
-            try:
-                info = self.es.info()
-                print(f"[ES] Polaczono z Elasticsearch {info.get('version', {}).get('number', 'unknown')}")
-                self.is_connected = True
-                logger.info("Polaczono z Elasticsearch")
-                return True
-            except Exception as ping_error:
-                print(f"[ES] Blad ping: {type(ping_error).__name__}: {ping_error}")
+    def _create_client(self):
+        """Utworz klienta (bez polaczenia - transport laczy sie leniwie)"""
+        from elasticsearch import AsyncElasticsearch
 
-                # Sprobuj ponownie z innymi ustawieniami
-                try:
-                    # Moze ES wymaga basic auth?
-                    health = self.es.cluster.health(request_timeout=5)
-                    if health:
-                        print(f"[ES] Cluster health: {health.get('status', 'unknown')}")
-                        self.is_connected = True
-                        return True
-                except Exception as health_error:
-                    print(f"[ES] Blad cluster.health: {type(health_error).__name__}: {health_error}")
-
-                logger.warning("Elasticsearch nie odpowiada")
-                return False
+        options: Dict[str, Any] = {}
+        if self.node_class:
+            options["node_class"] = self.node_class
+
+        # Dla ES 8.x - wylacz weryfikacje SSL i dodaj timeout
+        self.es = AsyncElasticsearch(
+            self.hosts,
+            verify_certs=False,
+            ssl_show_warn=False,
+            request_timeout=self.request_timeout,
+            retry_on_timeout=True,
+            max_retries=self.max_retries,
+            connections_per_node=self.connections_per_node,
+            **options
+        )
 
+    async def ping(self, timeout: float = 5) -> bool:
+        """Sprawdz czy ES odpowiada (bez zmiany stanu)"""
+        try:
+            if self.es is None:
+                self._create_client()
+            client = self.es.options(request_timeout=timeout, max_retries=0)
         except ImportError as e:
             print(f"[ES] Brak biblioteki elasticsearch: {e}")
             print("[ES] Zainstaluj: pip install elasticsearch>=8.0.0")
-            logger.error(f"Brak biblioteki elasticsearch: {e}")
+            self.last_error = str(e)
             return False
         except Exception as e:
-            print(f"[ES] Blad polaczenia: {type(e).__name__}: {e}")
-            logger.error(f"Blad polaczenia z ES: {e}")
+            self.last_error = f"{type(e).__name__}: {e}"
             return False
 
+        try:
+            info = await client.info()
+            self.version = info.get('version', {}).get('number', 'unknown')
+            return True
+        except Exception as ping_error:
+            self.last_error = f"{type(ping_error).__name__}: {ping_error}"
+
+        # Sprobuj ponownie z innymi ustawieniami (np. brak uprawnien do info)
+        try:
+            health = await client.cluster.health()
+            if health:
+                return True
+        except Exception as health_error:
+            self.last_error = f"{type(health_error).__name__}: {health_error}"
+        return False
+
+    async def connect(self) -> bool:
+        """Polacz z Elasticsearch"""
+        if await self.ping():
+            self.mark_connected("connect")
+            print(f"[ES] Polaczono z Elasticsearch {self.version or 'unknown'}")
+            await self.setup_indices()
+            logger.info("Polaczono z Elasticsearch")
+            return True
+        print(f"[ES] Blad polaczenia: {self.last_error}")
+        logger.warning("Elasticsearch nie odpowiada")
+        return False
+
+    # --- Stan polaczenia ---
+
+    def mark_connected(self, reason: str):
+        with self._state_lock:
+            self.consecutive_failures = 0
+            self.last_success_at = time.monotonic()
+            if self.is_connected:
+                return
+            self.is_connected = True
+            self.connects += 1
+            self._record_transition(True, reason)
+        print(f"[ES] Stan: polaczony ({reason})")
+
+    def mark_disconnected(self, reason: str):
+        with self._state_lock:
+            if not self.is_connected:
+                return
+            self.is_connected = False
+            self.disconnects += 1
+            self._record_transition(False, reason)
+        print(f"[ES] Stan: rozlaczony ({reason})")
+
+    def _record_transition(self, connected: bool, reason: str):
+        self.last_transition = datetime.now().isoformat()
+        self.transitions.append({"connected": connected, "at": self.last_transition, "reason": reason})
+
+    def record_success(self):
+        """Zapytanie do ES sie powiodlo"""
+        with self._state_lock:
+            self.consecutive_failures = 0
+            self.last_success_at = time.monotonic()
+
+    def record_failure(self, error: Exception):
+        """Zapytanie do ES sie nie powiodlo - blad transportu rozlacza od razu,
+        pozostale dopiero po failure_threshold kolejnych bledach"""
+        from elasticsearch import TransportError
+
+        with self._state_lock:
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            failures = self.consecutive_failures
+        if isinstance(error, TransportError):
+            self.mark_disconnected(f"blad transportu: {type(error).__name__}")
+        elif failures >= self.failure_threshold:
+            self.mark_disconnected(f"{failures} kolejnych bledow")
+
+    def connection_metrics(self) -> Dict[str, Any]:
+        with self._state_lock:
+            return {
+                "connected": self.is_connected,
+                "version": self.version,
+                "connects": self.connects,
+                "disconnects": self.disconnects,
+                "consecutive_failures": self.consecutive_failures,
+                "last_error": self.last_error,
+                "last_transition": self.last_transition,
+                "seconds_since_success": round(time.monotonic() - self.last_success_at, 1)
+                if self.last_success_at is not None else None,
+                "transitions": list(self.transitions),
+            }
+
     async def disconnect(self):
         """Rozlacz"""
         if self.es:
-            self.es.close()
+            await self.es.close()
             self.is_connected = False
 
     def _get_index_name(self, date: Optional[datetime] = None) -> str:
@@ -80,38 +396,199 @@ class ElasticsearchStorage:
             date = datetime.now()
         return f"{self.index_prefix}-{date.strftime('%Y.%m.%d')}"
 
-    async def _ensure_index(self):
-        """Upewnij sie ze index istnieje"""
-        index_name = self._get_index_name()
-        if not self.es.indices.exists(index=index_name):
-            self.es.indices.create(
-                index=index_name,
-                body={
-                    "mappings": {
-                        "properties": {
-                            "timestamp": {"type": "date"},
-                            "severity": {"type": "keyword"},
-                            "level": {"type": "keyword"},
-                            "source": {"type": "keyword"},
-                            "source_type": {"type": "keyword"},
-                            "event_type": {"type": "keyword"},
-                            "operation": {"type": "keyword"},
-                            "message": {"type": "text"},
-                            "raw": {"type": "text"},
-                            "database": {"type": "keyword"},
-                            "table_name": {"type": "keyword"},
-                            "user": {"type": "keyword"},
-                            "collected_at": {"type": "date"}
-                        }
-                    }
-                }
+    def _event_time(self, log: Dict[str, Any], now: Optional[datetime] = None) -> datetime:
+        """Czas zdarzenia do wyboru indeksu (czas lokalny, bez strefy).
+
+        Timestamp nieczytelny albo spoza okna [now - route_max_past_days,
+        now + route_max_future_hours] (np. 1970 z pustej kolumny, zly zegar
+        zrodla) zastepuje collected_at / czas biezacy - zeby pojedyncze
+        bledne logi nie tworzyly indeksow z odleglych dat.
+        """
+        now = now or datetime.now()
+        event_time = parse_timestamp(log.get("timestamp"))
+        if event_time is not None:
+            if (now - timedelta(days=self.route_max_past_days) <= event_time
+                    <= now + timedelta(hours=self.route_max_future_hours)):
+                return event_time
+        self.clamped_timestamps += 1
+        collected = parse_timestamp(log.get("collected_at"))
+        return collected if collected is not None and collected <= now else now
+
+    def _indices_for_range(self, start_time: Optional[datetime] = None,
+                           end_time: Optional[datetime] = None) -> str:
+        """Indeksy dzienne nachodzace na zakres czasu (z cache istniejacych
+        indeksow, gdy jest wczytany); bez start_time - ostatnie 7 dni"""
+        if self.index_mode == 'ilm':
+            # Indeksy po rolloverze nie maja daty w nazwie - ES pomija shardy
+            # spoza zakresu sam (faza can_match po min/max timestamp)
+            return f"{self.index_prefix}-*"
+        end = parse_timestamp(end_time) or datetime.now()
+        start = parse_timestamp(start_time) or (end - timedelta(days=6))
+        if start > end:
+            return ""
+        days = (end.date() - start.date()).days + 1
+        if days > self.search_max_indices:
+            return f"{self.index_prefix}-*"
+
+        indices = [self._get_index_name(start + timedelta(days=i)) for i in range(days)]
+        if self._known_indices:
+            # Dzisiejszy index zostaje zawsze - cache moze nie znac jeszcze
+            # indeksu utworzonego z szablonu przez innego klienta
+            today = self._get_index_name()
+            indices = [name for name in indices if name in self._known_indices or name == today]
+        return ",".join(indices)
+
+    def _template_name(self) -> str:
+        return f"{self.index_prefix}-template"
+
+    def _mappings(self) -> Dict[str, Any]:
+        return LEAN_MAPPINGS if self.mapping_profile == 'lean' else INDEX_MAPPINGS
+
+    def _prepare_doc(self, log: Dict[str, Any]) -> Dict[str, Any]:
+        """Dokument do zapisu, bez _id (idzie w akcji bulk). Profil lean pomija
+        zdublowane pola (na kopii - ten sam slownik lezy w buforze w pamieci);
+        raw rowny message nie jest zapisywany i wraca przy odczycie."""
+        if self.mapping_profile != 'lean':
+            return {key: value for key, value in log.items() if key != "_id"} if "_id" in log else log
+        doc = {key: value for key, value in log.items() if key not in LEAN_ALIASES and key != "_id"}
+        for alias, target in LEAN_ALIASES.items():
+            if log.get(alias) and not doc.get(target):
+                doc[target] = log[alias]
+        if "raw" in doc and doc["raw"] == doc.get("message"):
+            del doc["raw"]
+        return doc
+
+    def _index_template(self) -> Dict[str, Any]:
+        """Szablon composable dla indeksow {prefix}-* (ES tworzy je sam przy zapisie)"""
+        settings: Dict[str, Any] = {
+            "number_of_shards": self.number_of_shards,
+            "refresh_interval": self.refresh_interval,
+        }
+        if self.mapping_profile == 'lean':
+            settings["codec"] = "best_compression"
+        if self.number_of_replicas is not None:
+            settings["number_of_replicas"] = self.number_of_replicas
+        if self.index_mode == 'ilm':
+            settings["index.lifecycle.name"] = self._policy_name()
+            settings["index.lifecycle.rollover_alias"] = self._write_alias()
+        return {
+            "index_patterns": [f"{self.index_prefix}-*"],
+            "priority": 200,
+            "template": {"settings": settings, "mappings": self._mappings()},
+            "_meta": {"managed_by": "log-manager"},
+        }
+
+    def _policy_name(self) -> str:
+        return f"{self.index_prefix}-policy"
+
+    def _write_alias(self) -> str:
+        return f"{self.index_prefix}-write"
+
+    def _ilm_policy(self) -> Dict[str, Any]:
+        """Polityka ILM: hot (rollover) -> warm (force-merge, read-only, mniej replik) -> delete"""
+        ilm = self.ilm
+        rollover = {
+            key: ilm[f"rollover_{key}"]
+            for key in ("max_primary_shard_size", "max_docs", "max_age")
+            if ilm.get(f"rollover_{key}")
+        }
+        phases: Dict[str, Any] = {"hot": {"min_age": "0ms", "actions": {"rollover": rollover}}}
+
+        warm: Dict[str, Any] = {}
+        if ilm.get("warm_force_merge_segments"):
+            warm["forcemerge"] = {"max_num_segments": int(ilm["warm_force_merge_segments"])}
+        if ilm.get("warm_read_only"):
+            warm["readonly"] = {}
+        if ilm.get("warm_replicas") is not None:
+            warm["allocate"] = {"number_of_replicas": int(ilm["warm_replicas"])}
+        if warm:
+            phases["warm"] = {"min_age": ilm["warm_min_age"], "actions": warm}
+
+        if self.retention_days:
+            # Wiek liczony od rolloveru - index jest usuwany gdy jego najnowsze logi maja retention_days
+            phases["delete"] = {"min_age": f"{int(self.retention_days)}d", "actions": {"delete": {}}}
+        return {"phases": phases}
+
+    async def _ensure_write_alias(self):
+        """Tryb ILM: utworz pierwszy index z aliasem zapisu, jesli go nie ma"""
+        if self._write_alias_ready:
+            return
+        from elasticsearch import ApiError
+
+        alias = self._write_alias()
+        if not await self.es.indices.exists_alias(name=alias):
+            try:
+                await self.es.indices.create(
+                    index=f"{self.index_prefix}-000001",
+                    aliases={alias: {"is_write_index": True}}
+                )
+                logger.info(f"Utworzono index zapisu {self.index_prefix}-000001 (alias {alias})")
+            except ApiError as e:
+                # Rownolegly start innej instancji - wystarczy, ze alias juz jest
+                if e.status_code != 400 or not await self.es.indices.exists_alias(name=alias):
+                    raise
+        self._write_alias_ready = True
+
+    async def setup_indices(self) -> bool:
+        """Po polaczeniu: zainstaluj szablon indeksow i wczytaj liste indeksow"""
+        if self.index_mode == 'ilm':
+            try:
+                await self.es.ilm.put_lifecycle(name=self._policy_name(), policy=self._ilm_policy())
+                logger.info(f"Zainstalowano polityke ILM: {self._policy_name()}")
+            except Exception as e:
+                print(f"[ES] Nie mozna zainstalowac polityki ILM ({e})")
+        try:
+            await self.es.indices.put_index_template(name=self._template_name(), **self._index_template())
+            self.template_installed = True
+            logger.info(f"Zainstalowano szablon indeksow: {self._template_name()}")
+        except Exception as e:
+            self.template_installed = False
+            print(f"[ES] Nie mozna zainstalowac szablonu indeksow ({e}) - indeksy beda tworzone recznie")
+        if self.index_mode == 'ilm':
+            self._write_alias_ready = False
+            try:
+                await self._ensure_write_alias()
+            except Exception as e:
+                print(f"[ES] Nie mozna utworzyc aliasu zapisu {self._write_alias()} ({e})")
+        await self.refresh_known_indices()
+        return self.template_installed
+
+    async def refresh_known_indices(self):
+        """Odswiez cache istniejacych indeksow (przy polaczeniu i zmianie dnia)"""
+        self._known_day = datetime.now().date()
+        try:
+            response = await self.es.indices.get_alias(
+                index=f"{self.index_prefix}-*", allow_no_indices=True, ignore_unavailable=True
             )
-            logger.info(f"Utworzono index: {index_name}")
+            self._known_indices = set(response.keys())
+        except Exception as e:
+            logger.warning(f"Nie mozna pobrac listy indeksow: {e}")
+            self._known_indices = set()
+
+    async def _ensure_index(self, index_name: Optional[str] = None):
+        """Upewnij sie ze index istnieje - bez zapytania, gdy jest w cache
+        albo gdy ES utworzy go sam z szablonu"""
+        index_name = index_name or self._get_index_name()
+        if self._known_day != datetime.now().date():
+            await self.refresh_known_indices()
+        if index_name in self._known_indices:
+            return
+
+        if not self.template_installed:
+            # Bez szablonu (np. brak uprawnien) - utworz index z mapowaniem
+            if not await self.es.indices.exists(index=index_name):
+                await self.es.indices.create(
+                    index=index_name,
+                    body={"settings": self._index_template()["template"]["settings"], "mappings": self._mappings()}
+                )
+                logger.info(f"Utworzono index: {index_name}")
+        self._known_indices.add(index_name)
 
     async def save_log(self, log_entry: Dict[str, Any]) -> bool:
         """Zapisz pojedynczy log"""
         if not self.is_connected:
             return False
+        from elasticsearch import ApiError
 
         try:
             if "timestamp" in log_entry:
@@ -120,10 +597,23 @@ class ElasticsearchStorage:
             else:
                 log_entry["timestamp"] = datetime.now().isoformat()
 
-            await self._ensure_index()
-            self.es.index(index=self._get_index_name(), document=log_entry)
+            if self.index_mode == 'ilm':
+                index_name = self._write_alias()
+                await self._ensure_write_alias()
+            else:
+                index_name = self._get_index_name(self._event_time(log_entry))
+                await self._ensure_index(index_name)
+            try:
+                await self.es.create(index=index_name, id=log_entry.get("_id") or document_id(log_entry),
+                                     document=self._prepare_doc(log_entry))
+            except ApiError as e:
+                if e.status_code != 409:
+                    raise
+                self.duplicates += 1  # juz zapisany - ponowienie nie tworzy duplikatu
+            self.record_success()
             return True
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"Blad zapisu do ES: {e}")
             return False
 
@@ -133,29 +623,210 @@ class ElasticsearchStorage:
             return 0
 
         try:
-            await self._ensure_index()
-            index_name = self._get_index_name()
-
-            operations = []
-            for log in logs:
-                if "timestamp" in log and isinstance(log["timestamp"], datetime):
-                    log["timestamp"] = log["timestamp"].isoformat()
-                elif "timestamp" not in log:
-                    log["timestamp"] = datetime.now().isoformat()
-
-                operations.append({"index": {"_index": index_name}})
-                operations.append(log)
-
-            if operations:
-                result = self.es.bulk(operations=operations)
-                saved = sum(1 for item in result["items"] if item["index"]["status"] in [200, 201])
-                logger.info(f"Zapisano {saved}/{len(logs)} logow do ES")
-                return saved
-            return 0
+            result = await self.bulk_index(logs)
+            return result.saved
         except Exception as e:
             logger.error(f"Blad bulk zapisu do ES: {e}")
             return 0
 
+    async def bulk_index(self, logs: List[Dict[str, Any]]) -> BulkResult:
+        """Bulk z ponawianiem tylko odrzuconych pozycji.
+
+        Operacje `create` z deterministycznym _id (document_id) - 409 oznacza,
+        ze dokument juz jest w ES (ponowienie, replay), i liczy sie jako zapisany.
+
+        Bledy przejsciowe (4xx poza 400, 5xx) sa ponawiane z backoffem, 413 dzieli
+        zapytanie na polowy, trwale bledy (400, np. mapowanie) ida do dead-letter.
+        Blad transportu jest rzucany dalej - writer odklada wtedy partie do spoola.
+        """
+        result = BulkResult()
+        if not logs:
+            return result
+
+        # Index wg daty zdarzenia - jedna partia moze trafic do kilku indeksow
+        now = datetime.now()
+        items = []
+        for log in logs:
+            if "timestamp" in log and isinstance(log["timestamp"], datetime):
+                log["timestamp"] = log["timestamp"].isoformat()
+            elif "timestamp" not in log:
+                log["timestamp"] = now.isoformat()
+            if self.rollup_watermarks:
+                self._note_late_log(log["timestamp"])
+            if self.index_mode == 'ilm':
+                index_name = self._write_alias()
+            else:
+                index_name = self._get_index_name(self._event_time(log, now))
+            action = {"create": {"_index": index_name, "_id": log.get("_id") or document_id(log)}}
+            items.append((action, self._prepare_doc(log)))
+
+        try:
+            if self.index_mode == 'ilm':
+                await self._ensure_write_alias()
+            else:
+                for index_name in sorted({action["create"]["_index"] for action, _ in items}):
+                    await self._ensure_index(index_name)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+
+        pending = items
+        for attempt in range(self.bulk_max_attempts):
+            if attempt:
+                result.retried += len(pending)
+                delay = min(self.bulk_backoff_max, self.bulk_backoff * (2 ** (attempt - 1)))
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            pending = await self._bulk_pass(pending, result)
+            if not pending:
+                break
+
+        # Limit prob wyczerpany - zwroc do spoola, nie gub
+        result.retryable = [self._with_id(action, doc) for action, doc in pending]
+        if pending:
+            self._count_error('retry_exhausted', len(pending))
+        logger.info(f"Zapisano {result.saved}/{len(logs)} logow do ES")
+        return result
+
+    async def _bulk_pass(self, items: List[Tuple[Dict[str, Any], Dict[str, Any]]],
+                         result: BulkResult) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Jedno podejscie; zwraca pozycje do ponowienia"""
+        from elasticsearch import ApiError
+
+        operations = []
+        for action, doc in items:
+            operations.append(action)
+            operations.append(doc)
+
+        try:
+            response = await self.es.bulk(operations=operations)
+        except ApiError as e:
+            self.record_success()  # ES odpowiedzial - polaczenie dziala
+            if e.status_code == 413:
+                self._count_error('request_too_large')
+                if len(items) == 1:
+                    self._dead_letter(self._with_id(*items[0]), 413, 'request_too_large', str(e), result)
+                    return []
+                # Za duze zapytanie - podziel na polowy
+                middle = len(items) // 2
+                retry = await self._bulk_pass(items[:middle], result)
+                return retry + await self._bulk_pass(items[middle:], result)
+            self._count_error(f'http_{e.status_code}')
+            if e.status_code not in PERMANENT_STATUSES:
+                return items
+            # Zapytanie odrzucone w calosci jako bledne (400) - ponawianie nic nie da
+            for action, doc in items:
+                self._dead_letter(self._with_id(action, doc), e.status_code, f'http_{e.status_code}', str(e), result)
+            return []
+        except Exception as e:
+            self.record_failure(e)
+            self._count_error('transport')
+            raise
+        self.record_success()
+
+        if not response.get("errors"):
+            result.saved += len(items)
+            return []
+
+        retry = []
+        for (action, doc), item in zip(items, response["items"]):
+            outcome = next(iter(item.values()))
+            status = outcome.get("status", 0)
+            if 200 <= status < 300:
+                result.saved += 1
+                continue
+            if status == 409:
+                result.saved += 1
+                result.duplicates += 1
+                self.duplicates += 1
+                continue
+            error = outcome.get("error") or {}
+            error_type = error.get("type", f"http_{status}") if isinstance(error, dict) else str(error)
+            self._count_error(error_type)
+            if status not in PERMANENT_STATUSES:
+                retry.append((action, doc))
+            else:
+                reason = error.get("reason", "") if isinstance(error, dict) else str(error)
+                self._dead_letter(self._with_id(action, doc), status, error_type, reason, result)
+        return retry
+
+    @staticmethod
+    def _with_id(action: Dict[str, Any], doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Dokument z _id z akcji - ponowienie (spool, dead-letter) zachowuje id"""
+        return {**doc, "_id": action["create"]["_id"]}
+
+    def _count_error(self, error_type: str, count: int = 1):
+        with self._state_lock:
+            self.bulk_errors[error_type] = self.bulk_errors.get(error_type, 0) + count
+
+    def _dead_letter(self, doc: Dict[str, Any], status: Optional[int], error_type: str, reason: str,
+                     result: BulkResult):
+        result.dead_lettered += 1
+        if self.dead_letter is not None:
+            try:
+                self.dead_letter.add(doc, status, error_type, reason)
+            except Exception as e:
+                print(f"[ES] Nie mozna zapisac dead-letter: {e}")
+        logger.warning(f"Dokument odrzucony przez ES ({status} {error_type}): {reason}")
+
+    def bulk_metrics(self) -> Dict[str, Any]:
+        with self._state_lock:
+            errors = dict(self.bulk_errors)
+        return {
+            "errors": errors,
+            "dead_lettered": self.dead_letter.count if self.dead_letter is not None else None,
+            "clamped_timestamps": self.clamped_timestamps,
+            "duplicates": self.duplicates,
+        }
+
+    async def search(
+            self,
+            query: Optional[str] = None,
+            filters: Optional[Dict[str, Any]] = None,
+            start_time: Optional[datetime] = None,
+            end_time: Optional[datetime] = None,
+            ids: Optional[List[str]] = None,
+            size: int = 100,
+            offset: int = 0,
+            source_fields: Optional[List[str]] = None,
+            track_total_hits: Union[bool, int] = False,
+            index: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Wspolna sciezka wyszukiwania: builder z es_query + indeksy z zakresu czasu.
+
+        Zwraca {"logs": [...], "total": {"value", "relation"} | None}; blad
+        zapytania jest rzucany dalej (po aktualizacji stanu polaczenia).
+        """
+        empty: Dict[str, Any] = {"logs": [], "total": None}
+        if not self.is_connected:
+            return empty
+
+        # Tylko indeksy dzienne z zakresu czasu (bez zakresu - ostatnie 7 dni)
+        index_pattern = index or self._indices_for_range(start_time, end_time)
+        if not index_pattern:
+            return empty
+
+        body = build_search(
+            query=query, filters=filters, start_time=start_time, end_time=end_time, ids=ids,
+            size=size, offset=offset, source_fields=source_fields, track_total_hits=track_total_hits,
+            text_fields=self.text_fields
+        )
+        try:
+            result = await self.es.search(index=index_pattern, body=body,
+                                          ignore_unavailable=True, allow_no_indices=True)
+        except Exception as e:
+            self.record_failure(e)
+            raise
+        self.record_success()
+        logs = []
+        for hit in result["hits"]["hits"]:
+            log = hit.get("_source", {})
+            if (self.mapping_profile == 'lean' and "raw" not in log and "message" in log
+                    and (not source_fields or "raw" in source_fields)):
+                log["raw"] = log["message"]  # raw rowny message nie jest zapisywany
+            log["_id"] = hit.get("_id")
+            logs.append(log)
+        return {"logs": logs, "total": total_hits(result)}
+
     async def search_logs(
             self,
             query: Optional[str] = None,
@@ -164,131 +835,329 @@ class ElasticsearchStorage:
             operation: Optional[str] = None,
             start_time: Optional[datetime] = None,
             end_time: Optional[datetime] = None,
-            limit: int = 100
+            limit: int = 100,
+            source_fields: Optional[List[str]] = None
     ) -> List[Dict[str, Any]]:
         """Szukaj logow"""
-        if not self.is_connected:
+        try:
+            result = await self.search(
+                query=query,
+                filters={"severity": level, "source": source, "event_type": operation},
+                start_time=start_time,
+                end_time=end_time,
+                size=limit,
+                source_fields=source_fields
+            )
+            return result["logs"]
+        except Exception as e:
+            logger.error(f"Blad wyszukiwania w ES: {e}")
             return []
 
+    async def get_log_by_id(self, log_id: str) -> Optional[Dict[str, Any]]:
+        """Pojedynczy log po _id (we wszystkich indeksach prefiksu)"""
+        result = await self.search(ids=[log_id], size=1, index=f"{self.index_prefix}-*")
+        return result["logs"][0] if result["logs"] else None
+
+    async def get_stats(self, hours: Optional[float] = 24) -> Dict[str, Any]:
+        """Statystyki z ES za ostatnie `hours` godzin (None - caly zakres).
+
+        Zapytania size 0: liczniki terms oraz date_histogram (interwal
+        dobierany do okna) z podzialem na severity i event_type. Dluzsze
+        okna czytaja indeks rollup do jego watermarku, a surowe logi tylko
+        dla koncowki, ktorej rollup jeszcze nie policzyl.
+        """
+        if not self.is_connected:
+            return {}
+
+        end_time = datetime.now()
+        start_time = end_time - timedelta(hours=hours) if hours else None
+        interval = auto_interval(hours) if hours else None
+        granularity = self._rollup_granularity(hours, start_time, interval)
         try:
-            from elasticsearch import NotFoundError
+            parts = []
+            raw_start = start_time
+            if granularity:
+                raw_start = self.rollup_watermarks[granularity]
+                result = await self.es.search(
+                    index=self._rollup_index(),
+                    body=build_stats(start_time, raw_start, interval, granularity=granularity),
+                    ignore_unavailable=True, allow_no_indices=True
+                )
+                parts.append(result)
 
-            # Buduj query
-            must = []
+            index_pattern = (self._indices_for_range(raw_start, end_time)
+                             if raw_start else f"{self.index_prefix}-*")
+            if index_pattern:
+                result = await self.es.search(
+                    index=index_pattern, body=build_stats(raw_start, end_time, interval),
+                    ignore_unavailable=True, allow_no_indices=True
+                )
+                parts.append(result)
+            self.record_success()
+        except Exception as e:
+            self.record_failure(e)
+            logger.error(f"Blad statystyk ES: {e}")
+            return {}
+        if not parts:
+            return {}
 
-            if query:
-                must.append({"multi_match": {"query": query, "fields": ["message", "raw", "*"]}})
+        stats = self._merge_stats(parts)
+        stats.update({
+            "hours": hours,
+            "interval": interval,
+            "rollup": {"granularity": granularity, "until": raw_start.isoformat()} if granularity else None,
+        })
+        return stats
 
-            if level:
-                must.append({"term": {"severity": level}})
+    def _rollup_granularity(self, hours: Optional[float], start_time: Optional[datetime],
+                            interval: Optional[str]) -> Optional[str]:
+        """Rollup dla okna: 1h gdy os czasu ma kubelki >= 1h, inaczej 1m;
+        None - okno krotkie albo rollup nie pokrywa jego poczatku.
 
-            if source:
-                must.append({"term": {"source": source}})
+        Logi zapisane po policzeniu ich kubelka (replay spoola, sync-to-es
+        starych danych) trafiaja do rollupu dopiero w nastepnym przebiegu
+        rollup(); do tego czasu okna z rollupu ich nie licza."""
+        if not self.rollup_enabled or not hours or hours <= self.rollup_raw_max_hours or not interval:
+            return None
+        granularity = "1h" if auto_interval_minutes(interval) >= 60 else "1m"
+        earliest = self.rollup_earliest.get(granularity)
+        watermark = self.rollup_watermarks.get(granularity)
+        if earliest is None or watermark is None or earliest > start_time or watermark <= start_time:
+            return None
+        return granularity
 
-            if operation:
-                must.append({"term": {"operation": operation}})
+    @staticmethod
+    def _merge_stats(parts: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Zsumuj odpowiedzi build_stats (surowe: doc_count, rollup: suma count)"""
 
-            if start_time or end_time:
-                time_range = {}
-                if start_time:
-                    time_range["gte"] = start_time.isoformat()
-                if end_time:
-                    time_range["lte"] = end_time.isoformat()
-                must.append({"range": {"timestamp": time_range}})
+        def count(bucket: Dict[str, Any]) -> int:
+            return int(bucket["logs"]["value"]) if "logs" in bucket else bucket["doc_count"]
 
-            body = {
-                "query": {"bool": {"must": must}} if must else {"match_all": {}},
-                "sort": [{"timestamp": {"order": "desc"}}],
-                "size": limit
-            }
+        def add_buckets(target: Dict[str, int], agg: Dict[str, Any]):
+            for bucket in agg.get("buckets", []):
+                target[bucket["key"]] = target.get(bucket["key"], 0) + count(bucket)
 
-            # Szukaj w ostatnich 7 dniach
-            indices = []
-            for i in range(7):
-                date = datetime.now() - timedelta(days=i)
-                indices.append(self._get_index_name(date))
+        total = 0
+        totals: Dict[str, Dict[str, int]] = {name: {} for name in STATS_TERMS}
+        timeline: Dict[Any, Dict[str, Any]] = {}
+        for result in parts:
+            aggs = result.get("aggregations", {})
+            if "total" in aggs:
+                total += int(aggs["total"].get("value") or 0)
+            else:
+                total += (total_hits(result) or {}).get("value", 0)
+            for name in STATS_TERMS:
+                add_buckets(totals[name], aggs.get(name, {}))
+            for bucket in aggs.get("timeline", {}).get("buckets", []):
+                point = timeline.setdefault(bucket["key"], {
+                    "timestamp": bucket.get("key_as_string", bucket["key"]),
+                    "count": 0, "by_severity": {}, "by_event_type": {},
+                })
+                point["count"] += count(bucket)
+                add_buckets(point["by_severity"], bucket.get("by_severity", {}))
+                add_buckets(point["by_event_type"], bucket.get("by_event_type", {}))
 
-            index_pattern = ",".join(indices)
+        points = [timeline[key] for key in sorted(timeline)]
+        return {
+            "total_logs": total,
+            "total": total,
+            "by_severity": totals["by_severity"],
+            "by_level": totals["by_severity"],
+            "by_source": totals["by_source"],
+            "by_source_type": totals["by_source_type"],
+            "by_event_type": totals["by_event_type"],
+            "by_operation": totals["by_event_type"],
+            "timeline": [{"timestamp": p["timestamp"], "count": p["count"]} for p in points],
+            "level_timeline": [{"timestamp": p["timestamp"], **p["by_severity"]} for p in points],
+            "operation_timeline": [{"timestamp": p["timestamp"], **p["by_event_type"]} for p in points],
+        }
 
-            try:
-                result = self.es.search(index=index_pattern, body=body)
-                return [hit["_source"] for hit in result["hits"]["hits"]]
-            except NotFoundError:
-                # Index nie istnieje - to OK
-                return []
+    # --- Rollup ---
 
-        except Exception as e:
-            logger.error(f"Blad wyszukiwania w ES: {e}")
-            return []
+    def _rollup_index(self) -> str:
+        # Poza wzorcem {prefix}-* - wyszukiwanie i statystyki surowych logow go nie widza
+        return f"{self.index_prefix}_rollup"
 
-    async def get_stats(self) -> Dict[str, Any]:
-        """Statystyki z ES"""
-        if not self.is_connected:
-            return {}
+    async def _load_rollup_state(self):
+        """Zakres policzonych kubelkow z indeksu rollup (raz, po starcie)"""
+        if self._rollup_state_loaded:
+            return
+        if not await self.es.indices.exists(index=self._rollup_index()):
+            await self.es.indices.create(
+                index=self._rollup_index(),
+                body={"settings": {"number_of_shards": 1, **({"number_of_replicas": self.number_of_replicas}
+                                   if self.number_of_replicas is not None else {})},
+                      "mappings": ROLLUP_MAPPINGS}
+            )
+            logger.info(f"Utworzono index rollup: {self._rollup_index()}")
+        else:
+            result = await self.es.search(index=self._rollup_index(), body={
+                "size": 0,
+                "aggs": {"by_granularity": {"terms": {"field": "granularity"}, "aggs": {
+                    "earliest": {"min": {"field": "timestamp"}},
+                    "latest": {"max": {"field": "timestamp"}},
+                }}},
+            })
+            for bucket in result.get("aggregations", {}).get("by_granularity", {}).get("buckets", []):
+                granularity = bucket["key"]
+                if granularity not in ROLLUP_GRANULARITIES or bucket["latest"].get("value") is None:
+                    continue
+                self.rollup_earliest[granularity] = EPOCH + timedelta(milliseconds=bucket["earliest"]["value"])
+                self.rollup_watermarks[granularity] = (EPOCH + timedelta(milliseconds=bucket["latest"]["value"])
+                                                       + ROLLUP_GRANULARITIES[granularity])
+        self._rollup_state_loaded = True
 
+    def _note_late_log(self, timestamp: Any):
+        """Log starszy niz kubelki liczone ponownie (ROLLUP_LOOKBACK) - zapamietaj,
+        od kiedy nastepny rollup() ma przeliczyc juz policzone kubelki"""
+        event_time = parse_timestamp(timestamp)
+        if event_time is None:
+            return
+        for granularity, watermark in self.rollup_watermarks.items():
+            step = ROLLUP_GRANULARITIES[granularity]
+            if event_time < watermark - ROLLUP_LOOKBACK[granularity] * step:
+                late = self.rollup_late.get(granularity)
+                if late is None or event_time < late:
+                    self.rollup_late[granularity] = event_time
+
+    def _rollup_days(self, granularity: str) -> Optional[int]:
+        """Ile dni trzymac kubelki: minutowe rollup_minute_days, godzinowe jak surowe logi"""
+        if granularity == "1m" and self.rollup_minute_days:
+            return self.rollup_minute_days
+        return self.retention_days
+
+    async def rollup(self, granularity: str, now: Optional[datetime] = None) -> int:
+        """Policz kubelki `granularity` od watermarku (kilka ostatnich kubelkow
+        ponownie - ROLLUP_LOOKBACK, a po spoznionych logach od ich kubelka) do
+        teraz; zwraca liczbe zapisanych dokumentow rollup.
+        _id dokumentu wynika z kubelka i wymiarow, wiec ponowne liczenie nadpisuje."""
+        if not self.is_connected:
+            return 0
+        step = ROLLUP_GRANULARITIES[granularity]
+        now = now or datetime.now()
+        written = 0
+        late = self.rollup_late.pop(granularity, None)
         try:
-            from elasticsearch import NotFoundError
+            await self._load_rollup_state()
+            end = floor_time(now - ROLLUP_DELAY, step)
+            keep_days = self._rollup_days(granularity)
+            backfill_days = min(self.rollup_backfill_days, keep_days or self.rollup_backfill_days)
+            backfill_start = floor_time(now - timedelta(days=backfill_days), step)
+            watermark = self.rollup_watermarks.get(granularity)
+            start = max(watermark - ROLLUP_LOOKBACK[granularity] * step, backfill_start) if watermark else backfill_start
+            if late is not None and watermark:
+                # Spoznione logi (np. replay spoola) - przelicz od ich kubelka
+                start = max(min(start, floor_time(late, step)), backfill_start)
 
-            index_pattern = f"{self.index_prefix}-*"
+            chunk_start = start
+            while chunk_start < end:
+                chunk_end = min(end, chunk_start + ROLLUP_CHUNKS[granularity])
+                written += await self._rollup_chunk(granularity, chunk_start, chunk_end)
+                self.rollup_watermarks[granularity] = chunk_end
+                if granularity not in self.rollup_earliest:
+                    self.rollup_earliest[granularity] = start
+                chunk_start = chunk_end
 
-            try:
-                # Liczba dokumentow
-                count = self.es.count(index=index_pattern)
-
-                # Agregacje
-                aggs_body = {
-                    "size": 0,
-                    "aggs": {
-                        "by_severity": {"terms": {"field": "severity", "size": 10}},
-                        "by_source": {"terms": {"field": "source", "size": 50}},
-                        "by_source_type": {"terms": {"field": "source_type", "size": 10}},
-                        "by_event_type": {"terms": {"field": "event_type", "size": 20}}
-                    }
-                }
+            if keep_days:
+                # Minutowe tylko na krotkie okna, godzinowe do retencji surowych logow
+                cutoff = floor_time(now - timedelta(days=keep_days), step)
+                if self.rollup_earliest.get(granularity) and self.rollup_earliest[granularity] < cutoff:
+                    await self.es.delete_by_query(
+                        index=self._rollup_index(),
+                        query={"bool": {"filter": [{"term": {"granularity": granularity}},
+                                                   {"range": {"timestamp": {"lt": cutoff.isoformat()}}}]}},
+                        conflicts="proceed"
+                    )
+                    self.rollup_earliest[granularity] = cutoff
+            self.record_success()
+        except Exception as e:
+            if late is not None:
+                self.rollup_late[granularity] = min(late, self.rollup_late.get(granularity, late))
+            self.record_failure(e)
+            logger.error(f"Blad rollup {granularity}: {e}")
+        self.rollup_docs_written += written
+        return written
 
-                result = self.es.search(index=index_pattern, body=aggs_body)
+    async def _rollup_chunk(self, granularity: str, start: datetime, end: datetime) -> int:
+        index_pattern = self._indices_for_range(start, end)
+        if not index_pattern:
+            return 0
+        written = 0
+        after = None
+        while True:
+            result = await self.es.search(
+                index=index_pattern,
+                body=build_rollup_source(start, end, granularity, ROLLUP_DIMENSIONS, after=after,
+                                         page_size=ROLLUP_PAGE_SIZE),
+                ignore_unavailable=True, allow_no_indices=True
+            )
+            agg = result.get("aggregations", {}).get("rollup", {})
+            buckets = agg.get("buckets", [])
+            if buckets:
+                operations = []
+                for bucket in buckets:
+                    key = bucket["key"]
+                    timestamp = EPOCH + timedelta(milliseconds=key["timestamp"])
+                    dims = {field: key.get(field) for field in ROLLUP_DIMENSIONS if key.get(field) is not None}
+                    doc_id = hashlib.sha1(json.dumps(
+                        [granularity, key["timestamp"], [key.get(field) for field in ROLLUP_DIMENSIONS]]
+                    ).encode("utf-8")).hexdigest()
+                    operations.append({"index": {"_index": self._rollup_index(), "_id": doc_id}})
+                    operations.append({"timestamp": timestamp.isoformat(), "granularity": granularity,
+                                       "count": bucket["doc_count"], **dims})
+                response = await self.es.bulk(operations=operations)
+                if response.get("errors"):
+                    raise RuntimeError(f"rollup {granularity}: ES odrzucil czesc dokumentow")
+                written += len(buckets)
+            after = agg.get("after_key")
+            if not after or not buckets:
+                return written
 
-                return {
-                    "total_logs": count["count"],
-                    "by_severity": {b["key"]: b["doc_count"] for b in result["aggregations"]["by_severity"]["buckets"]},
-                    "by_source": {b["key"]: b["doc_count"] for b in result["aggregations"]["by_source"]["buckets"]},
-                    "by_source_type": {b["key"]: b["doc_count"] for b in
-                                       result["aggregations"]["by_source_type"]["buckets"]},
-                    "by_event_type": {b["key"]: b["doc_count"] for b in
-                                      result["aggregations"]["by_event_type"]["buckets"]}
+    def rollup_metrics(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.rollup_enabled,
+            "index": self._rollup_index(),
+            "docs_written": self.rollup_docs_written,
+            "coverage": {
+                granularity: {
+                    "from": self.rollup_earliest[granularity].isoformat(),
+                    "until": self.rollup_watermarks[granularity].isoformat(),
                 }
-            except NotFoundError:
-                return {"total_logs": 0}
-
-        except Exception as e:
-            logger.error(f"Blad statystyk ES: {e}")
-            return {}
+                for granularity in ROLLUP_GRANULARITIES if granularity in self.rollup_watermarks
+                and granularity in self.rollup_earliest
+            },
+        }
 
     async def delete_old_logs(self, days: int = 30) -> int:
-        """Usun stare logi"""
+        """Usun indeksy dzienne starsze niz `days` dni (caly dzien poza oknem)"""
         if not self.is_connected:
             return 0
 
         try:
             deleted = 0
-            cutoff = datetime.now() - timedelta(days=days)
+            cutoff = (datetime.now() - timedelta(days=days)).date()
 
             # Usun stare indexy
-            indices = self.es.indices.get(index=f"{self.index_prefix}-*")
-            for index_name in indices:
-                # Wyciagnij date z nazwy
+            indices = await self.es.indices.get_alias(
+                index=f"{self.index_prefix}-*", allow_no_indices=True, ignore_unavailable=True
+            )
+            for index_name in sorted(indices):
+                # Wyciagnij date z nazwy (indeksy ILM {prefix}-000001 sa pomijane)
                 try:
                     date_str = index_name.replace(f"{self.index_prefix}-", "")
-                    index_date = datetime.strptime(date_str, "%Y.%m.%d")
+                    index_date = datetime.strptime(date_str, "%Y.%m.%d").date()
                     if index_date < cutoff:
-                        self.es.indices.delete(index=index_name)
+                        await self.es.indices.delete(index=index_name)
+                        self._known_indices.discard(index_name)
                         deleted += 1
                         logger.info(f"Usunieto index: {index_name}")
                 except ValueError:
                     pass
 
+            self.record_success()
             return deleted
         except Exception as e:
+            self.record_failure(e)
             logger.error(f"Blad usuwania starych logow: {e}")
             return 0
 
@@ -299,20 +1168,29 @@ class ElasticsearchStorage:
 
         try:
             # Usun wszystkie indexy z prefixem
-            self.es.indices.delete(index=f"{self.index_prefix}-*", ignore_unavailable=True)
+            await self.es.indices.delete(index=f"{self.index_prefix}-*", ignore_unavailable=True)
+            await self.es.indices.delete(index=self._rollup_index(), ignore_unavailable=True)
+            self._known_indices.clear()
+            # Tryb ILM: index zapisu i alias usuniete - nastepny zapis zaklada je od nowa
+            # (inaczej ES utworzylby {prefix}-write jako zwykly index bez rolloveru)
+            self._write_alias_ready = False
+            self.rollup_earliest.clear()
+            self.rollup_watermarks.clear()
+            self.rollup_late.clear()
+            self._rollup_state_loaded = False
             logger.info("Wyczyszczono wszystkie logi z ES")
             return True
         except Exception as e:
             logger.error(f"Blad czyszczenia ES: {e}")
             return False
 
-    def get_status(self) -> Dict[str, Any]:
+    async def get_status(self) -> Dict[str, Any]:
         """Status Elasticsearch"""
         if not self.is_connected or not self.es:
             return {"connected": False}
 
         try:
-            health = self.es.cluster.health()
+            health = await self.es.cluster.health()
             return {
                 "connected": True,
                 "cluster_name": health.get("cluster_name"),
@@ -0,0 +1,209 @@
+"""
+ES Query - Wspolny builder zapytan wyszukiwania logow
+Warunki dokladne (pola keyword, zakres czasu, id) trafiaja do kontekstu
+`filter` - nie licza score i ES moze je cache'owac. Pelnotekstowo szukamy
+tylko w polach tekstowych (message, raw); `multi_match` po "*" dotykal
+kazdego pola, w tym keyword i liczbowych.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+# Pola przeszukiwane pelnotekstowo (profil lean indeksuje tylko message)
+TEXT_FIELDS = ["message", "raw"]
+
+# Domyslne sortowanie - unmapped_type pozwala pytac indeksy bez dokumentow
+TIMESTAMP_SORT = [{"timestamp": {"order": "desc", "unmapped_type": "date"}}]
+
+
+def time_range(start_time: Optional[datetime] = None, end_time: Optional[datetime] = None) -> Optional[Dict[str, Any]]:
+    """Filtr range po timestamp (None gdy zakres nieograniczony)"""
+    bounds = {}
+    if start_time:
+        bounds["gte"] = start_time.isoformat()
+    if end_time:
+        bounds["lte"] = end_time.isoformat()
+    return {"range": {"timestamp": bounds}} if bounds else None
+
+
+def build_query(
+        query: Optional[str] = None,
+        filters: Optional[Dict[str, Union[str, Sequence[str], None]]] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        ids: Optional[Sequence[str]] = None,
+        text_fields: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """Czesc `query`: pelny tekst w must, reszta w filter"""
+    must: List[Dict[str, Any]] = []
+    filter_clauses: List[Dict[str, Any]] = []
+
+    if query:
+        must.append({"multi_match": {"query": query, "fields": list(text_fields or TEXT_FIELDS)}})
+
+    for field_name, value in (filters or {}).items():
+        if value is None or value == "" or value == []:
+            continue
+        if isinstance(value, (list, tuple, set)):
+            filter_clauses.append({"terms": {field_name: list(value)}})
+        else:
+            filter_clauses.append({"term": {field_name: value}})
+
+    if ids:
+        filter_clauses.append({"ids": {"values": list(ids)}})
+
+    time_filter = time_range(start_time, end_time)
+    if time_filter:
+        filter_clauses.append(time_filter)
+
+    if not must and not filter_clauses:
+        return {"match_all": {}}
+    bool_query: Dict[str, Any] = {}
+    if must:
+        bool_query["must"] = must
+    if filter_clauses:
+        bool_query["filter"] = filter_clauses
+    return {"bool": bool_query}
+
+
+def build_search(
+        query: Optional[str] = None,
+        filters: Optional[Dict[str, Union[str, Sequence[str], None]]] = None,
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        ids: Optional[Sequence[str]] = None,
+        size: int = 100,
+        offset: int = 0,
+        source_fields: Optional[Sequence[str]] = None,
+        track_total_hits: Union[bool, int] = False,
+        sort: Optional[List[Dict[str, Any]]] = None,
+        text_fields: Optional[Sequence[str]] = None
+) -> Dict[str, Any]:
+    """Cale body zapytania _search.
+
+    track_total_hits: False - bez liczenia trafien (najtaniej), True - dokladnie,
+    liczba - dokladnie do tego progu, powyzej tylko "gte".
+    source_fields: projekcja `_source` - zwracane sa tylko wskazane pola.
+    text_fields: pola pelnotekstowe (domyslnie TEXT_FIELDS).
+    """
+    body: Dict[str, Any] = {
+        "query": build_query(query, filters, start_time, end_time, ids, text_fields),
+        "sort": sort if sort is not None else TIMESTAMP_SORT,
+        "size": size,
+        "track_total_hits": track_total_hits,
+    }
+    if offset:
+        body["from"] = offset
+    if source_fields:
+        body["_source"] = list(source_fields)
+    return body
+
+
+def total_hits(response: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """{"value", "relation"} z odpowiedzi (None gdy track_total_hits=False)"""
+    total = response.get("hits", {}).get("total")
+    if total is None:
+        return None
+    if isinstance(total, int):  # ES 6.x / rest_total_hits_as_int
+        return {"value": total, "relation": "eq"}
+    return {"value": total.get("value", 0), "relation": total.get("relation", "eq")}
+
+
+# Przedzialy date_histogram od najdrobniejszego (minuty) - wybierany jest
+# pierwszy, ktory daje co najwyzej max_buckets punktow na osi czasu
+HISTOGRAM_INTERVALS = [(1, "1m"), (5, "5m"), (10, "10m"), (30, "30m"), (60, "1h"),
+                       (180, "3h"), (360, "6h"), (720, "12h"), (1440, "1d"), (10080, "7d")]
+
+
+def auto_interval(hours: float, max_buckets: int = 60) -> str:
+    """fixed_interval dla okna `hours` godzin"""
+    for minutes, interval in HISTOGRAM_INTERVALS:
+        if hours * 60 / minutes <= max_buckets:
+            return interval
+    return HISTOGRAM_INTERVALS[-1][1]
+
+
+def auto_interval_minutes(interval: str) -> int:
+    """Dlugosc przedzialu z HISTOGRAM_INTERVALS w minutach"""
+    return next(minutes for minutes, name in HISTOGRAM_INTERVALS if name == interval)
+
+
+# Liczniki w statystykach: klucz odpowiedzi -> (pole, liczba kubelkow)
+STATS_TERMS = {
+    "by_severity": ("severity", 10),
+    "by_source": ("source", 50),
+    "by_source_type": ("source_type", 10),
+    "by_event_type": ("event_type", 20),
+}
+
+# W indeksie rollup dokument to grupa logow - liczba logow jest w polu count
+ROLLUP_SUM = {"logs": {"sum": {"field": "count"}}}
+
+
+def build_stats(
+        start_time: Optional[datetime] = None,
+        end_time: Optional[datetime] = None,
+        interval: Optional[str] = None,
+        granularity: Optional[str] = None
+) -> Dict[str, Any]:
+    """Body statystyk: size 0, zakres w filter, terms + date_histogram
+    z podzialem na severity i event_type (jedno zapytanie).
+
+    granularity - zapytanie do indeksu rollup ("1m" / "1h"): kubelki
+    sumuja pole count zamiast liczyc dokumenty.
+    """
+    def terms(field: str, size: int) -> Dict[str, Any]:
+        agg: Dict[str, Any] = {"terms": {"field": field, "size": size}}
+        if granularity:
+            agg["terms"]["order"] = {"logs": "desc"}
+            agg["aggs"] = ROLLUP_SUM
+        return agg
+
+    aggs: Dict[str, Any] = {name: terms(field, size) for name, (field, size) in STATS_TERMS.items()}
+    if granularity:
+        aggs["total"] = ROLLUP_SUM["logs"]
+    if interval:
+        histogram: Dict[str, Any] = {"field": "timestamp", "fixed_interval": interval, "min_doc_count": 0}
+        if start_time and end_time:
+            histogram["extended_bounds"] = {"min": start_time.isoformat(), "max": end_time.isoformat()}
+        aggs["timeline"] = {
+            "date_histogram": histogram,
+            "aggs": {
+                "by_severity": terms("severity", 10),
+                "by_event_type": terms("event_type", 20),
+                **(ROLLUP_SUM if granularity else {}),
+            },
+        }
+    return {
+        "size": 0,
+        "track_total_hits": not granularity,
+        "query": build_query(filters={"granularity": granularity} if granularity else None,
+                             start_time=start_time, end_time=end_time),
+        "aggs": aggs,
+    }
+
+
+def build_rollup_source(
+        start_time: datetime,
+        end_time: datetime,
+        granularity: str,
+        dimensions: Sequence[str],
+        after: Optional[Dict[str, Any]] = None,
+        page_size: int = 1000
+) -> Dict[str, Any]:
+    """Strona agregacji composite po surowych logach [start_time, end_time):
+    kubelek czasu x kombinacja wymiarow -> liczba logow"""
+    sources: List[Dict[str, Any]] = [
+        {"timestamp": {"date_histogram": {"field": "timestamp", "fixed_interval": granularity}}}
+    ]
+    sources += [{field: {"terms": {"field": field, "missing_bucket": True}}} for field in dimensions]
+    composite: Dict[str, Any] = {"size": page_size, "sources": sources}
+    if after:
+        composite["after"] = after
+    return {
+        "size": 0,
+        "query": {"bool": {"filter": [
+            {"range": {"timestamp": {"gte": start_time.isoformat(), "lt": end_time.isoformat()}}}
+        ]}},
+        "aggs": {"rollup": {"composite": composite}},
+    }
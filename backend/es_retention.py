@@ -0,0 +1,110 @@
+"""
+ES Retention - Okresowe zadania na danych w Elasticsearch
+RetentionJob: w trybie index_mode: daily nic innego nie kasuje starych
+danych - job co `interval` sekund usuwa indeksy starsze niz retention_days.
+W trybie ilm retencje robi faza delete polityki ILM i job nie jest uruchamiany.
+
+RollupJob: dopisuje do indeksu rollup kubelki minutowe i godzinowe
+(ElasticsearchStorage.rollup) - statystyki dlugich okien nie agreguja
+wtedy kazdego surowego logu.
+"""
+
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+from elasticsearch_storage import ElasticsearchStorage
+
+
+class _BackgroundJob:
+    """Zadanie w event loopie aplikacji; step() zwraca ile sekund czekac"""
+
+    _task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(await self.step())
+
+    async def step(self) -> float:
+        raise NotImplementedError
+
+
+class RetentionJob(_BackgroundJob):
+    """Petla retencji w event loopie aplikacji"""
+
+    def __init__(self, storage: ElasticsearchStorage, retention_days: int, interval: float = 3600.0):
+        self.storage = storage
+        self.retention_days = retention_days
+        self.interval = interval
+        self.runs = 0
+        self.deleted_indices = 0
+        self.last_run_at: Optional[float] = None
+
+    async def step(self) -> float:
+        """Jeden obrot petli; zwraca ile sekund czekac do nastepnego"""
+        if not self.storage.is_connected:
+            return min(self.interval, 60.0)  # sprobuj zaraz po polaczeniu
+
+        deleted = await self.storage.delete_old_logs(self.retention_days)
+        self.runs += 1
+        self.deleted_indices += deleted
+        self.last_run_at = time.time()
+        if deleted:
+            print(f"[ES] Retencja: usunieto {deleted} indeksow starszych niz {self.retention_days} dni")
+        return self.interval
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "retention_days": self.retention_days,
+            "interval": self.interval,
+            "runs": self.runs,
+            "deleted_indices": self.deleted_indices,
+            "last_run_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.last_run_at))
+            if self.last_run_at else None,
+        }
+
+
+class RollupJob(_BackgroundJob):
+    """Petla rollupu: kubelki minutowe co `interval`, godzinowe co `hourly_interval`"""
+
+    def __init__(self, storage: ElasticsearchStorage, interval: float = 60.0, hourly_interval: float = 900.0):
+        self.storage = storage
+        self.interval = interval
+        self.hourly_interval = hourly_interval
+        self.runs = 0
+        self.last_hourly_at: Optional[float] = None
+
+    async def step(self) -> float:
+        if not self.storage.is_connected:
+            return min(self.interval, 60.0)
+
+        written = await self.storage.rollup("1m")
+        now = time.monotonic()
+        if self.last_hourly_at is None or now - self.last_hourly_at >= self.hourly_interval:
+            written += await self.storage.rollup("1h")
+            self.last_hourly_at = now
+        self.runs += 1
+        if written and self.runs == 1:
+            print(f"[ES] Rollup: zapisano {written} dokumentow do {self.storage._rollup_index()}")
+        return self.interval
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.storage.rollup_metrics(),
+            "interval": self.interval,
+            "hourly_interval": self.hourly_interval,
+            "runs": self.runs,
+        }
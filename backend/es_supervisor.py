@@ -0,0 +1,120 @@
+"""
+ES Supervisor - Laczenie i pilnowanie polaczenia z Elasticsearch w tle
+Start API nie czeka na ES: supervisor probuje sie polaczyc z backoffem
+wykladniczym, a gdy polaczenie jest aktywne i nic nie rozmawialo z ES przez
+health_interval - wysyla ping. Stan zmieniaja tez wyniki zwyklych zapytan
+(record_success / record_failure w ElasticsearchStorage).
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Dict, Optional
+
+from elasticsearch_storage import ElasticsearchStorage
+
+
+JITTER = 0.1  # +/- 10% losowego rozrzutu backoffu
+
+
+class ConnectionSupervisor:
+    """Petla laczenia i health-checku ES w event loopie aplikacji"""
+
+    def __init__(
+            self,
+            storage: ElasticsearchStorage,
+            initial_backoff: float = 1.0,
+            max_backoff: float = 60.0,
+            health_interval: float = 15.0
+    ):
+        self.storage = storage
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self.health_interval = health_interval
+        self.backoff = initial_backoff
+        self.attempts = 0
+        self.failed_attempts = 0
+        self.health_checks = 0
+        self.step_errors = 0
+        self.next_attempt_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run(self):
+        while True:
+            try:
+                delay = await self.step()
+            except Exception as e:
+                # Nieoczekiwany blad nie moze zakonczyc petli - bez niej nikt juz
+                # nie polaczylby sie ponownie z ES
+                self.step_errors += 1
+                self.storage.last_error = f"{type(e).__name__}: {e}"
+                delay = self.backoff * random.uniform(1 - JITTER, 1 + JITTER)
+                self.backoff = min(self.max_backoff, self.backoff * 2)
+                print(f"[ES] Blad supervisora ({self.storage.last_error}) - ponowna proba za {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def step(self) -> float:
+        """Jeden obrot petli; zwraca ile sekund czekac do nastepnego"""
+        storage = self.storage
+
+        if not storage.is_connected:
+            self.attempts += 1
+            if await storage.ping():
+                storage.mark_connected(f"polaczono po {self.attempts} probach")
+                print(f"[ES] Polaczono z Elasticsearch {storage.version or 'unknown'}")
+                try:
+                    await storage.setup_indices()
+                except Exception as e:
+                    # Bez szablonow/aliasu nie zapisujemy - nastepna proba od nowa
+                    storage.mark_disconnected(f"setup_indices: {type(e).__name__}: {e}")
+                    raise
+                self.attempts = 0
+                self.backoff = self.initial_backoff
+                self.next_attempt_at = None
+                return self.health_interval
+
+            self.failed_attempts += 1
+            delay = self.backoff * random.uniform(1 - JITTER, 1 + JITTER)
+            self.backoff = min(self.max_backoff, self.backoff * 2)
+            self.next_attempt_at = time.monotonic() + delay
+            if self.attempts == 1 or self.backoff >= self.max_backoff:
+                print(f"[ES] Brak polaczenia ({storage.last_error}) - ponowna proba za {delay:.1f}s")
+            return delay
+
+        # Polaczony - ping tylko gdy zadne zapytanie nie potwierdzilo stanu
+        idle = time.monotonic() - storage.last_success_at if storage.last_success_at else self.health_interval
+        if idle < self.health_interval:
+            return self.health_interval - idle
+
+        self.health_checks += 1
+        if await storage.ping():
+            storage.record_success()
+            return self.health_interval
+        storage.mark_disconnected(f"health-check: {storage.last_error}")
+        self.backoff = self.initial_backoff
+        return self.initial_backoff
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            **self.storage.connection_metrics(),
+            "reconnect_attempts": self.attempts,
+            "failed_attempts": self.failed_attempts,
+            "health_checks": self.health_checks,
+            "step_errors": self.step_errors,
+            "backoff": round(self.backoff, 2),
+            "next_attempt_in": round(max(0.0, self.next_attempt_at - time.monotonic()), 1)
+            if self.next_attempt_at and not self.storage.is_connected else None,
+        }
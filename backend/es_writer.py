@@ -0,0 +1,351 @@
+"""
+ES Writer - Staly zapis do Elasticsearch z laczeniem partii
+Jeden dlugo zyjacy event loop zbiera dokumenty ze wszystkich zrodel i wysyla
+je bulkiem po przekroczeniu limitu dokumentow, bajtow lub wieku najstarszego
+dokumentu. Kilka bulkow moze trwac jednoczesnie (ograniczone okno in-flight).
+Gdy ES jest niedostepny lub bulk sie nie powiedzie, partia trafia do spoola
+na dysku i jest odtwarzana w kolejnosci (z limitem tempa) po powrocie ES.
+"""
+
+import asyncio
+import concurrent.futures
+import json
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+from spool import DiskSpool
+
+
+LATENCY_SAMPLES = 200   # ile ostatnich czasow flush trzymac do metryk
+RATE_WINDOW = 10.0      # sekundy okna do liczenia docs/sec
+REPLAY_IDLE = 0.5       # sekundy miedzy sprawdzeniami spoola
+
+
+def _ms(seconds: float) -> float:
+    return round(seconds * 1000, 2)
+
+
+class BulkWriter:
+    """Buforuje dokumenty i wysyla je do ES partiami w osobnym watku"""
+
+    def __init__(
+            self,
+            send: Callable[[List[Dict[str, Any]]], Awaitable[int]],
+            flush_docs: int = 5000,
+            flush_bytes: int = 5 * 1024 * 1024,
+            flush_interval: float = 1.0,
+            max_in_flight: int = 4,
+            max_buffer_docs: int = 50000,
+            spool: Optional[DiskSpool] = None,
+            is_available: Optional[Callable[[], bool]] = None,
+            replay_rate: float = 5000.0,
+            replay_backoff: float = 5.0
+    ):
+        self.send = send
+        self.spool = spool
+        self.is_available = is_available
+        self.replay_rate = replay_rate
+        self.replay_backoff = replay_backoff
+        self.flush_docs = flush_docs
+        self.flush_bytes = flush_bytes
+        self.flush_interval = flush_interval
+        self.max_in_flight = max_in_flight
+        self.max_buffer_docs = max_buffer_docs
+
+        self._buffer: Deque[Tuple[Dict[str, Any], int]] = deque()
+        self._buffer_bytes = 0
+        self._oldest: Optional[float] = None
+        self._cond = threading.Condition()
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._spool_lock: Optional[asyncio.Lock] = None
+        self._thread: Optional[threading.Thread] = None
+        self._future: Optional[concurrent.futures.Future] = None
+        self._running = False
+        self.in_flight = 0
+
+        # Metryki
+        self.flushes = 0
+        self.docs_written = 0
+        self.docs_failed = 0
+        self.docs_spooled = 0
+        self.docs_rejected = 0
+        self.flush_reasons: Dict[str, int] = {}
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._written_recent: Deque[Tuple[float, int]] = deque()
+
+    # --- Sterowanie ---
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Uruchom we wlasnym watku albo w podanym, dzialajacym event loopie
+        (loop aplikacji - wtedy writer wspoldzieli klienta AsyncElasticsearch)"""
+        if self._running:
+            return
+        self._running = True
+        if loop is None:
+            self._thread = threading.Thread(target=lambda: asyncio.run(self._run()), name="es-writer", daemon=True)
+            self._thread.start()
+        else:
+            self._future = asyncio.run_coroutine_threadsafe(self._run(), loop)
+
+    def stop(self, timeout: float = 10.0):
+        """Wyslij pozostaly bufor i zatrzymaj writer"""
+        self._running = False
+        with self._cond:
+            self._cond.notify_all()
+        self._wake()
+        if self._thread:
+            self._thread.join(timeout)
+        elif self._future and not self._in_own_loop():
+            try:
+                self._future.result(timeout)
+            except Exception:
+                pass
+
+    async def wait_closed(self, timeout: float = 10.0):
+        """Poczekaj na zakonczenie po stop() wywolanym z loopu writera"""
+        if self._future:
+            try:
+                await asyncio.wait_for(asyncio.wrap_future(self._future), timeout)
+            except Exception as e:
+                print(f"[ES] Writer nie zakonczyl sie poprawnie: {e}")
+
+    def _in_own_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            return False
+
+    # --- Wejscie (dowolny watek) ---
+
+    def add(self, docs: List[Dict[str, Any]]):
+        """Dodaj dokumenty do bufora; blokuje gdy bufor pelny (backpressure)"""
+        sized = [(doc, len(json.dumps(doc, default=str))) for doc in docs]
+        with self._cond:
+            while self._running and len(self._buffer) >= self.max_buffer_docs:
+                self._cond.wait(0.5)
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._buffer.extend(sized)
+            self._buffer_bytes += sum(size for _, size in sized)
+            full = len(self._buffer) >= self.flush_docs or self._buffer_bytes >= self.flush_bytes
+        if full:
+            self._wake()
+
+    async def requeue(self, docs: List[Dict[str, Any]]) -> int:
+        """Dokumenty do ponowienia spoza writera (np. zadanie sync-to-es): do spoola,
+        a bez spoola do bufora; zwraca liczbe przyjetych"""
+        if not docs:
+            return 0
+        if self.spool is None:
+            await asyncio.to_thread(self.add, docs)
+            return len(docs)
+        async with self._spool_lock or asyncio.Lock():
+            if not await asyncio.to_thread(self.spool.append, docs):
+                return 0
+        with self._cond:
+            self.docs_spooled += len(docs)
+        return len(docs)
+
+    def _wake(self):
+        if self._loop and self._wakeup:
+            try:
+                self._loop.call_soon_threadsafe(self._wakeup.set)
+            except RuntimeError:
+                pass  # loop juz zamkniety
+
+    # --- Event loop writera ---
+
+    async def _run(self):
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        window = asyncio.Semaphore(self.max_in_flight)
+        # Dopisywanie do spoola po kolei - partie trafiaja na dysk w kolejnosci flush
+        self._spool_lock = asyncio.Lock()
+        tasks: Set[asyncio.Task] = set()
+        replay = asyncio.create_task(self._replay_loop(window)) if self.spool else None
+
+        while True:
+            reason = self._flush_reason()
+            if reason:
+                await window.acquire()
+                batch = self._take_batch()
+                if not batch:
+                    window.release()
+                    continue
+                task = asyncio.create_task(self._flush(batch, reason, window))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                continue
+
+            with self._cond:
+                if not self._running and not self._buffer:
+                    break
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self._wait_time())
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if replay:
+            replay.cancel()
+            await asyncio.gather(replay, return_exceptions=True)
+        if self.spool:
+            self.spool.close()
+
+    def _flush_reason(self) -> Optional[str]:
+        with self._cond:
+            if not self._buffer:
+                return None
+            if len(self._buffer) >= self.flush_docs:
+                return 'docs'
+            if self._buffer_bytes >= self.flush_bytes:
+                return 'bytes'
+            if not self._running:
+                return 'shutdown'
+            if time.monotonic() - self._oldest >= self.flush_interval:
+                return 'age'
+        return None
+
+    def _wait_time(self) -> float:
+        with self._cond:
+            if self._oldest is None:
+                return self.flush_interval
+            return max(0.001, self.flush_interval - (time.monotonic() - self._oldest))
+
+    def _take_batch(self) -> List[Dict[str, Any]]:
+        """Zdejmij z bufora jedna partie (limit dokumentow i bajtow)"""
+        batch = []
+        batch_bytes = 0
+        with self._cond:
+            while self._buffer and len(batch) < self.flush_docs:
+                doc, size = self._buffer[0]
+                if batch and batch_bytes + size > self.flush_bytes:
+                    break
+                self._buffer.popleft()
+                batch.append(doc)
+                batch_bytes += size
+            self._buffer_bytes -= batch_bytes
+            # Reszta bufora liczy wiek od teraz - nie znamy czasu kazdego dokumentu
+            self._oldest = time.monotonic() if self._buffer else None
+            self._cond.notify_all()
+        return batch
+
+    def _available(self) -> bool:
+        return self.is_available is None or self.is_available()
+
+    @staticmethod
+    def _outcome(batch: List[Dict[str, Any]], result: Any) -> Tuple[int, List[Dict[str, Any]], int]:
+        """(zapisane, do ponowienia, odrzucone trwale) z wyniku send().
+
+        send() zwraca liczbe zapisanych (0 = cala partia do ponowienia) albo
+        obiekt z polami saved i retryable (BulkResult z elasticsearch_storage)."""
+        if result is None or isinstance(result, int):
+            saved = result or 0
+            return saved, (batch if saved == 0 else []), 0
+        retryable = list(result.retryable)
+        return result.saved, retryable, len(batch) - result.saved - len(retryable)
+
+    async def _flush(self, batch: List[Dict[str, Any]], reason: str, window: asyncio.Semaphore):
+        self.in_flight += 1
+        started = time.monotonic()
+        attempted = self._available()
+        saved, retryable, rejected = 0, batch, 0
+        try:
+            if attempted:
+                saved, retryable, rejected = self._outcome(batch, await self.send(batch))
+        except Exception as e:
+            print(f"[ES] Blad zapisu partii ({len(batch)} logow): {e}")
+        finally:
+            self.in_flight -= 1
+            window.release()
+
+        finished = time.monotonic()
+        spooled = 0
+        if retryable and self.spool is not None:
+            # ES niedostepny lub odrzucil pozycje - na dysk, odtworzy je _replay_loop
+            async with self._spool_lock:
+                if await asyncio.to_thread(self.spool.append, retryable):
+                    spooled = len(retryable)
+
+        with self._cond:
+            self.flushes += 1
+            self.flush_reasons[reason] = self.flush_reasons.get(reason, 0) + 1
+            self.docs_written += saved
+            self.docs_spooled += spooled
+            self.docs_rejected += rejected
+            self.docs_failed += len(retryable) - spooled
+            if attempted:
+                self._latencies.append(finished - started)
+            self._written_recent.append((finished, saved))
+
+    async def _replay_loop(self, window: asyncio.Semaphore):
+        """Odtwarzaj spool w kolejnosci zapisu, z limitem replay_rate docs/s"""
+        while True:
+            if not self._available() or not await asyncio.to_thread(lambda: self.spool.has_pending):
+                await asyncio.sleep(REPLAY_IDLE)
+                continue
+            docs = await asyncio.to_thread(self.spool.peek)
+            if not docs:
+                await asyncio.sleep(REPLAY_IDLE)
+                continue
+
+            saved, retryable, rejected = 0, docs, 0
+            async with window:
+                try:
+                    saved, retryable, rejected = self._outcome(docs, await self.send(docs))
+                except Exception as e:
+                    print(f"[SPOOL] Blad odtwarzania partii ({len(docs)} logow): {e}")
+            if len(retryable) == len(docs):
+                # Partia zostaje w spoolu - sprobuj ponownie pozniej
+                await asyncio.sleep(self.replay_backoff)
+                continue
+
+            # Czesciowy sukces - reszta wraca na koniec spoola
+            if retryable:
+                await asyncio.to_thread(self.spool.append, retryable)
+            await asyncio.to_thread(self.spool.commit)
+            self.spool.record_replayed_docs(saved)
+            with self._cond:
+                self.docs_written += saved
+                self.docs_rejected += rejected
+                self._written_recent.append((time.monotonic(), saved))
+            if self.replay_rate:
+                await asyncio.sleep(len(docs) / self.replay_rate)
+
+    # --- Metryki ---
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._cond:
+            while self._written_recent and self._written_recent[0][0] < now - RATE_WINDOW:
+                self._written_recent.popleft()
+            recent = sum(n for _, n in self._written_recent)
+            latencies = sorted(self._latencies)
+            buffered = len(self._buffer)
+            buffered_bytes = self._buffer_bytes
+            reasons = dict(self.flush_reasons)
+        return {
+            "buffered_docs": buffered,
+            "buffered_bytes": buffered_bytes,
+            "in_flight": self.in_flight,
+            "flushes": self.flushes,
+            "flush_reasons": reasons,
+            "docs_written": self.docs_written,
+            "docs_failed": self.docs_failed,
+            "docs_spooled": self.docs_spooled,
+            "docs_rejected": self.docs_rejected,
+            "spool": self.spool.metrics() if self.spool else None,
+            "docs_per_sec": round(recent / RATE_WINDOW, 2),
+            "flush_latency_ms": {
+                "avg": _ms(sum(latencies) / len(latencies)) if latencies else None,
+                "p95": _ms(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]) if latencies else None,
+                "max": _ms(latencies[-1]) if latencies else None,
+            },
+        }
@@ -0,0 +1,161 @@
+"""
+Jobs - Zadania masowe w tle (np. sync-to-es)
+Endpoint tylko zaklada zadanie i od razu zwraca jego id; praca idzie w
+event loopie aplikacji porcjami, z postepem do odpytywania, mozliwoscia
+anulowania i limitem zadan wykonywanych jednoczesnie.
+"""
+
+import asyncio
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+class JobLimitError(Exception):
+    """Za duzo zadan w kolejce"""
+
+
+class Job:
+    """Stan jednego zadania; runner aktualizuje liczniki przez progress()"""
+
+    STATES = ('pending', 'running', 'completed', 'failed', 'cancelled')
+
+    def __init__(self, kind: str, total: int = 0):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = 'pending'
+        self.total = total
+        self.processed = 0
+        self.saved = 0
+        self.duplicates = 0
+        self.dead_lettered = 0  # trwale odrzucone (dead-letter)
+        self.requeued = 0       # do ponowienia pozniej (spool)
+        self.failed = 0         # do ponowienia, ale nie przyjete przez spool
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._cancel = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def done(self) -> bool:
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def progress(self, processed: int = 0, saved: int = 0, duplicates: int = 0,
+                 dead_lettered: int = 0, requeued: int = 0, failed: int = 0):
+        self.processed += processed
+        self.saved += saved
+        self.duplicates += duplicates
+        self.dead_lettered += dead_lettered
+        self.requeued += requeued
+        self.failed += failed
+
+    def to_dict(self) -> Dict[str, Any]:
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        rate = self.processed / elapsed if elapsed > 0 else 0.0
+        remaining = max(0, self.total - self.processed)
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "total": self.total,
+            "processed": self.processed,
+            "saved": self.saved,
+            "duplicates": self.duplicates,
+            "dead_lettered": self.dead_lettered,
+            "requeued": self.requeued,
+            "failed": self.failed,
+            "percent": round(100.0 * self.processed / self.total, 1) if self.total else 100.0,
+            "docs_per_sec": round(rate, 1),
+            "elapsed_sec": round(elapsed, 3),
+            "eta_sec": round(remaining / rate, 1) if rate and not self.done else None,
+            "error": self.error,
+            "created_at": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.created_at)),
+        }
+
+
+class JobManager:
+    """Zadania w tle: najwyzej max_running naraz, reszta czeka w kolejce
+    (najwyzej max_queued); zakonczone trzymane w historii (history)"""
+
+    def __init__(self, max_running: int = 1, max_queued: int = 4, history: int = 50):
+        self.max_running = max_running
+        self.max_queued = max_queued
+        self.history = history
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def submit(self, kind: str, runner: Callable[[Job], Awaitable[None]], total: int = 0) -> Job:
+        """Zaloz zadanie i uruchom je w biezacym event loopie"""
+        waiting = sum(1 for job in self._jobs.values() if job.status == 'pending')
+        if waiting >= self.max_queued:
+            raise JobLimitError(f"Za duzo zadan w kolejce ({waiting})")
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_running)
+
+        job = Job(kind, total)
+        self._jobs[job.id] = job
+        self._trim()
+        job._task = asyncio.create_task(self._run(job, runner))
+        return job
+
+    async def _run(self, job: Job, runner: Callable[[Job], Awaitable[None]]):
+        async with self._slots:
+            if job.cancel_requested:
+                job.status = 'cancelled'
+                job.finished_at = time.time()
+                return
+            job.status = 'running'
+            job.started_at = time.time()
+            try:
+                await runner(job)
+                job.status = 'cancelled' if job.cancel_requested else 'completed'
+            except asyncio.CancelledError:
+                job.status = 'cancelled'
+            except Exception as e:
+                job.status = 'failed'
+                job.error = str(e)
+                print(f"[JOBS] Zadanie {job.kind} {job.id} przerwane: {e}")
+            finally:
+                job.finished_at = time.time()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        return list(reversed(self._jobs.values()))
+
+    def cancel(self, job_id: str) -> Optional[Job]:
+        """Anuluj zadanie - runner konczy po biezacej porcji"""
+        job = self._jobs.get(job_id)
+        if job is not None and not job.done:
+            job._cancel.set()
+        return job
+
+    async def shutdown(self):
+        """Przy zamykaniu aplikacji - przerwij niedokonczone zadania"""
+        tasks = [job._task for job in self._jobs.values() if job._task and not job._task.done()]
+        for job in self._jobs.values():
+            job._cancel.set()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _trim(self):
+        """Historia: usun najstarsze zakonczone zadania ponad limit"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self._jobs) - self.history)]:
+            del self._jobs[job_id]
+
+    def metrics(self) -> Dict[str, Any]:
+        counts: Dict[str, int] = {state: 0 for state in Job.STATES}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {"max_running": self.max_running, "max_queued": self.max_queued, **counts}
@@ -6,17 +6,24 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Union
 from datetime import datetime
 import threading
 import asyncio
-import time
 import os
 
 from config import Config
 from sources import FileSource, MySQLSource, MongoDBSource
 from smart_parser import ParsedLog
-from elasticsearch_storage import ElasticsearchStorage
+from elasticsearch_storage import ElasticsearchStorage, BulkResult, document_id
+from es_supervisor import ConnectionSupervisor
+from es_retention import RetentionJob, RollupJob
+from scheduler import SourceScheduler, DEFAULT_INTERVAL
+from pipeline import IngestPipeline
+from es_writer import BulkWriter
+from spool import DiskSpool, DeadLetterStore
+from stats_cache import StatsCache
+from jobs import Job, JobLimitError, JobManager
 
 # ============================================
 # GLOBALNE DANE
@@ -27,8 +34,23 @@ sources: Dict[str, Any] = {}
 all_logs: List[Dict] = []
 MAX_LOGS = 10000
 
+# Statystyki ostatnich godzin liczone przy zbieraniu (/api/stats bez ES)
+stats_cache = StatsCache(
+    minutes=int(config.agent.get('stats_cache_minutes', 1440)),
+    max_age=float(config.agent.get('stats_cache_max_age', 1.0))
+)
+
+# Zadania w tle (sync-to-es)
+jobs = JobManager(
+    max_running=int(config.agent.get('jobs_max_running', 1)),
+    max_queued=int(config.agent.get('jobs_max_queued', 4))
+)
+
 # Elasticsearch
 es_storage: Optional[ElasticsearchStorage] = None
+es_supervisor: Optional[ConnectionSupervisor] = None
+es_retention: Optional[RetentionJob] = None
+es_rollup: Optional[RollupJob] = None
 ES_ENABLED = True
 
 # ============================================
@@ -42,6 +64,10 @@ async def lifespan(app: FastAPI):
     print("  LOG MANAGER - START")
     print("="*50 + "\n")
     
+    # Writer kolektora dziala w tym loopie (wspolny klient AsyncElasticsearch)
+    global app_loop
+    app_loop = asyncio.get_running_loop()
+    
     # Elasticsearch
     await init_elasticsearch()
     
@@ -53,16 +79,27 @@ async def lifespan(app: FastAPI):
     
     print(f"\n[OK] Zaladowano {len(sources)} zrodel")
     print("[OK] Collector uruchomiony")
-    if es_storage and es_storage.is_connected:
-        print("[OK] Elasticsearch polaczony")
+    if es_storage:
+        print("[INFO] Elasticsearch - laczenie w tle (do tego czasu logi trafiaja do spoola)")
     else:
-        print("[WARN] Elasticsearch niedostepny - logi tylko w pamieci")
+        print("[WARN] Elasticsearch wylaczony - logi tylko w pamieci")
     print("\n" + "="*50 + "\n")
     
     yield
     
     # SHUTDOWN
     stop_collector()
+    for source in sources.values():
+        source.close()
+    await jobs.shutdown()
+    if es_writer:
+        await es_writer.wait_closed()
+    if es_retention:
+        await es_retention.stop()
+    if es_rollup:
+        await es_rollup.stop()
+    if es_supervisor:
+        await es_supervisor.stop()
     if es_storage:
         await es_storage.disconnect()
     print("Log Manager zatrzymany")
@@ -83,7 +120,7 @@ app.add_middleware(
 
 async def init_elasticsearch():
     """Inicjalizuj polaczenie z Elasticsearch"""
-    global es_storage, ES_ENABLED
+    global es_storage, es_supervisor, es_retention, es_rollup, ES_ENABLED
     
     es_config = config.elasticsearch
     es_enabled = os.environ.get(
@@ -104,18 +141,64 @@ async def init_elasticsearch():
         es_hosts = configured_hosts if isinstance(configured_hosts, list) else [configured_hosts]
 
     index_prefix = es_config.get('index_prefix', 'log-manager')
+    retention_days = es_config.get('retention_days', 30)
     print(f"[INFO] Laczenie z Elasticsearch: {', '.join(es_hosts)}")
 
     es_storage = ElasticsearchStorage(
         hosts=es_hosts,
-        index_prefix=index_prefix
+        index_prefix=index_prefix,
+        failure_threshold=int(es_config.get('failure_threshold', 3)),
+        connections_per_node=int(es_config.get('connections_per_node', 10)),
+        request_timeout=float(es_config.get('request_timeout', 10)),
+        max_retries=int(es_config.get('max_retries', 3)),
+        node_class=es_config.get('node_class'),
+        bulk_max_attempts=int(es_config.get('bulk_max_attempts', 5)),
+        bulk_backoff=float(es_config.get('bulk_backoff', 0.5)),
+        bulk_backoff_max=float(es_config.get('bulk_backoff_max', 10.0)),
+        number_of_shards=int(es_config.get('number_of_shards', 1)),
+        number_of_replicas=es_config.get('number_of_replicas'),
+        refresh_interval=str(es_config.get('refresh_interval', '5s')),
+        mapping_profile=es_config.get('mapping_profile', 'standard'),
+        route_max_past_days=int(es_config.get('route_max_past_days', 365)),
+        route_max_future_hours=float(es_config.get('route_max_future_hours', 24)),
+        search_max_indices=int(es_config.get('search_max_indices', 60)),
+        index_mode=es_config.get('index_mode', 'daily'),
+        retention_days=int(retention_days) if retention_days else None,
+        ilm=es_config.get('ilm'),
+        rollup_enabled=bool(es_config.get('rollup_enabled', False)),
+        rollup_raw_max_hours=float(es_config.get('rollup_raw_max_hours', 24)),
+        rollup_minute_days=int(es_config.get('rollup_minute_days', 7)),
+        dead_letter=DeadLetterStore(es_config.get(
+            'dead_letter_path', os.path.join(os.environ.get('LOG_MANAGER_STATE_DIR', '.state'), 'dead_letter.jsonl')
+        ))
     )
     
-    connected = await es_storage.connect()
-    if connected:
-        print("[OK] Elasticsearch polaczony")
-    else:
-        print("[WARN] Nie mozna polaczyc z Elasticsearch")
+    # Nie blokuj startu API - polaczenie nawiazuje supervisor w tle
+    es_supervisor = ConnectionSupervisor(
+        es_storage,
+        initial_backoff=float(es_config.get('reconnect_backoff', 1.0)),
+        max_backoff=float(es_config.get('reconnect_backoff_max', 60.0)),
+        health_interval=float(es_config.get('health_interval', 15.0))
+    )
+    es_supervisor.start()
+
+    # Tryb dzienny - stare indeksy usuwa job retencji (w trybie ilm faza delete)
+    if es_storage.index_mode == 'daily' and es_storage.retention_days:
+        es_retention = RetentionJob(
+            es_storage,
+            retention_days=es_storage.retention_days,
+            interval=float(es_config.get('retention_interval', 3600))
+        )
+        es_retention.start()
+
+    # Rollup - wstepnie zagregowane kubelki dla statystyk dlugich okien
+    if es_storage.rollup_enabled:
+        es_rollup = RollupJob(
+            es_storage,
+            interval=float(es_config.get('rollup_interval', 60)),
+            hourly_interval=float(es_config.get('rollup_hourly_interval', 900))
+        )
+        es_rollup.start()
 
 # ============================================
 # SOURCES
@@ -153,95 +236,115 @@ def init_sources():
 # ============================================
 
 collector_running = False
-collector_thread = None
-
-def collector_loop():
-    """Glowna petla zbierajaca logi"""
-    global all_logs
-    
-    print("[COLLECTOR] Start")
-    
-    while collector_running:
-        for name, source in list(sources.items()):
-            if not source.enabled or not source.running:
-                continue
-            
-            try:
-                new_logs = source.collect()
-                
-                if new_logs:
-                    # Konwertuj ParsedLog na slowniki i dodaj metadane
-                    processed_logs = []
-                    for log in new_logs:
-                        # Konwertuj ParsedLog na dict
-                        if hasattr(log, 'to_dict'):
-                            log_dict = log.to_dict()
-                        elif hasattr(log, '__dict__'):
-                            log_dict = dict(log.__dict__)
-                        else:
-                            log_dict = dict(log) if isinstance(log, dict) else {'raw': str(log)}
-                        
-                        # Dodaj metadane
-                        log_dict['source'] = name
-                        log_dict['source_type'] = source.config.get('type', 'unknown')
-                        log_dict['collected_at'] = datetime.now().isoformat()
-                        
-                        # Upewnij sie ze timestamp istnieje
-                        if 'timestamp' not in log_dict or not log_dict['timestamp']:
-                            log_dict['timestamp'] = log_dict['collected_at']
-                        
-                        processed_logs.append(log_dict)
-                    
-                    # Zapisz do pamieci
-                    all_logs.extend(processed_logs)
-                    # Uzyj slice assignment zamiast = zeby nie tworzyc nowej zmiennej!
-                    if len(all_logs) > MAX_LOGS:
-                        del all_logs[:-MAX_LOGS]
-                    
-                    # Zapisz do Elasticsearch (async w osobnym watku)
-                    if es_storage and es_storage.is_connected:
-                        try:
-                            # Uruchom async w nowym event loop
-                            loop = asyncio.new_event_loop()
-                            saved_count = loop.run_until_complete(es_storage.save_logs_bulk(processed_logs))
-                            loop.close()
-                            print(f"[ES] Zapisano {saved_count}/{len(processed_logs)} logow (source_type: {processed_logs[0].get('source_type', 'unknown')})")
-                        except Exception as e:
-                            print(f"[ES] Blad zapisu: {e}")
-                            import traceback
-                            traceback.print_exc()
-                    else:
-                        print(f"[ES] Pominięto zapis - ES nie polaczony (is_connected={es_storage.is_connected if es_storage else 'None'})")
-                    
-                    print(f"[{name}] Zebrano {len(processed_logs)} logow")
-                
-                source.last_check = datetime.now()
-                # collect() ustawia last_error także dla błędów obsłużonych
-                # wewnętrznie (np. brak SELECT do mysql.general_log). Nie
-                # kasuj go tutaj, bo panel Sources musi go pokazać.
-                
-            except Exception as e:
-                source.last_error = str(e)
-                print(f"[ERROR] {name}: {e}")
+scheduler: Optional[SourceScheduler] = None
+pipeline: Optional[IngestPipeline] = None
+es_writer: Optional[BulkWriter] = None
+app_loop: Optional[asyncio.AbstractEventLoop] = None
+logs_lock = threading.Lock()
+
+def normalize_logs(name: str, source: Any, new_logs: List[Any]) -> List[Dict[str, Any]]:
+    """Etap normalize - konwertuj zebrane logi na slowniki z metadanymi"""
+    processed_logs = []
+    for log in new_logs:
+        # Konwertuj ParsedLog na dict
+        if hasattr(log, 'to_dict'):
+            log_dict = log.to_dict()
+        elif hasattr(log, '__dict__'):
+            log_dict = dict(log.__dict__)
+        else:
+            log_dict = dict(log) if isinstance(log, dict) else {'raw': str(log)}
         
-        time.sleep(2)
-    
-    print("[COLLECTOR] Stop")
+        # Dodaj metadane
+        log_dict['source'] = name
+        log_dict['source_type'] = source.config.get('type', 'unknown')
+        log_dict['collected_at'] = datetime.now().isoformat()
+        
+        # Upewnij sie ze timestamp istnieje
+        if 'timestamp' not in log_dict or not log_dict['timestamp']:
+            log_dict['timestamp'] = log_dict['collected_at']
+        
+        # _id wspolne dla pamieci i ES - ponowny zapis tego samego loga nie duplikuje
+        log_dict['_id'] = document_id(log_dict, log_dict.pop('position', None))
+        
+        processed_logs.append(log_dict)
+    return processed_logs
+
+def buffer_logs(processed_logs: List[Dict[str, Any]]):
+    """Etap buffer - zapisz do pamieci (ograniczone do MAX_LOGS)"""
+    stats_cache.add(processed_logs)
+    with logs_lock:
+        all_logs.extend(processed_logs)
+        # Uzyj slice assignment zamiast = zeby nie tworzyc nowej zmiennej!
+        if len(all_logs) > MAX_LOGS:
+            del all_logs[:-MAX_LOGS]
+
+def sink_to_elasticsearch(processed_logs: List[Dict[str, Any]]):
+    """Etap sink - przekaz partie do writera ES (laczy partie wszystkich zrodel)"""
+    # Przy niedostepnym ES writer odklada partie do spoola na dysku
+    if not es_storage or not es_writer:
+        return
+    es_writer.add(processed_logs)
+
+async def send_to_elasticsearch(docs: List[Dict[str, Any]]) -> Union[int, BulkResult]:
+    """Wysylka jednej partii writera (ponawianie pozycji w bulk_index)"""
+    if not es_storage or not es_storage.is_connected:
+        return 0
+    return await es_storage.bulk_index(docs)
 
 def start_collector():
-    """Uruchom collector w tle"""
-    global collector_running, collector_thread
+    """Uruchom harmonogram zbierania w tle"""
+    global collector_running, scheduler, pipeline, es_writer
     
     if collector_running:
         return
     
     collector_running = True
-    collector_thread = threading.Thread(target=collector_loop, daemon=True)
-    collector_thread.start()
+    agent_cfg = config.agent
+    es_cfg = config.elasticsearch
+    spool = None
+    if es_cfg.get('spool_enabled', True):
+        spool = DiskSpool(
+            es_cfg.get('spool_dir', os.path.join(os.environ.get('LOG_MANAGER_STATE_DIR', '.state'), 'spool')),
+            segment_bytes=int(es_cfg.get('spool_segment_bytes', 16 * 1024 * 1024)),
+            max_bytes=int(es_cfg.get('spool_max_bytes', 512 * 1024 * 1024)),
+            fsync=es_cfg.get('spool_fsync', 'interval')
+        )
+    es_writer = BulkWriter(
+        send=send_to_elasticsearch,
+        flush_docs=int(es_cfg.get('flush_docs', 5000)),
+        flush_bytes=int(es_cfg.get('flush_bytes', 5 * 1024 * 1024)),
+        flush_interval=float(es_cfg.get('flush_interval', 1.0)),
+        max_in_flight=int(es_cfg.get('max_in_flight', 4)),
+        spool=spool,
+        is_available=lambda: bool(es_storage and es_storage.is_connected),
+        replay_rate=float(es_cfg.get('replay_rate', 5000))
+    )
+    es_writer.start(loop=app_loop)
+    pipeline = IngestPipeline(
+        normalize=normalize_logs,
+        buffer=buffer_logs,
+        sink=sink_to_elasticsearch,
+        queue_docs=int(agent_cfg.get('pipeline_queue_docs', 10000)),
+        sink_batch=int(agent_cfg.get('pipeline_sink_batch', 1000))
+    )
+    pipeline.start()
+    scheduler = SourceScheduler(
+        get_sources=lambda: sources,
+        handle_logs=pipeline.submit,
+        max_workers=int(agent_cfg.get('max_workers', 8)),
+        is_paused=lambda: pipeline.paused
+    )
+    scheduler.start()
 
 def stop_collector():
     global collector_running
     collector_running = False
+    if scheduler:
+        scheduler.stop()
+    if pipeline:
+        pipeline.stop()
+    if es_writer:
+        es_writer.stop()
 
 # ============================================
 # MODELE API
@@ -265,6 +368,16 @@ class SourceConfig(BaseModel):
     timestamp_column: Optional[str] = None
     auto_enable_general_log: Optional[bool] = None
     strict_database_filter: Optional[bool] = None
+    # Harmonogram
+    interval: Optional[float] = None
+    timeout: Optional[float] = None
+    min_interval: Optional[float] = None
+    max_interval: Optional[float] = None
+    adaptive: Optional[bool] = None
+    # MongoDB specific
+    collections: Optional[List[str]] = None
+    mode: Optional[str] = None
+    watermark_field: Optional[str] = None
 
 # ============================================
 # ENDPOINTY API
@@ -294,6 +407,7 @@ def agent_status():
         "running": collector_running,
         "sources_count": len(sources),
         "active_sources": active,
+        "hung_workers": scheduler.hung_workers if scheduler else 0,
         "logs_in_cache": len(all_logs),
         "elasticsearch": {
             "enabled": ES_ENABLED,
@@ -308,6 +422,7 @@ def get_sources() -> List[Dict]:
     """Lista wszystkich zrodel"""
     result = []
     for name, source in sources.items():
+        schedule = scheduler.get_schedule(name) if scheduler else None
         result.append({
             "name": name,
             "type": source.config.get('type', 'unknown'),
@@ -315,7 +430,11 @@ def get_sources() -> List[Dict]:
             "running": source.running,
             "last_check": source.last_check.isoformat() if source.last_check else None,
             "logs_collected": source.logs_collected,
-            "last_error": source.last_error
+            "last_error": source.last_error,
+            "round_trips": getattr(source, 'round_trips', 0),
+            "interval": schedule.current_interval if schedule else source.config.get('interval', DEFAULT_INTERVAL),
+            "backlog": schedule.backlog if schedule else False,
+            "schedule": schedule.to_dict() if schedule else None
         })
     return result
 
@@ -356,7 +475,8 @@ def delete_source(name: str) -> Dict:
     if name not in sources:
         raise HTTPException(404, "Zrodlo nie istnieje")
     
-    del sources[name]
+    # Zamknij strumienie, kursory i watki w tle zrodla
+    sources.pop(name).close()
     return {"status": "ok"}
 
 @app.post("/api/sources/{name}/toggle")
@@ -551,6 +671,31 @@ def debug_logs() -> Dict:
         }
     }
 
+@app.get("/api/debug/pipeline")
+def debug_pipeline() -> Dict:
+    """Debug - glebokosc kolejek i przepustowosc etapow zbierania"""
+    if not pipeline:
+        return {"status": "stopped"}
+    return {
+        "status": "running",
+        **pipeline.metrics(),
+        "es_writer": es_writer.metrics() if es_writer else None,
+        "es_bulk": es_storage.bulk_metrics() if es_storage else None,
+        "stats_cache": stats_cache.metrics(),
+        "jobs": jobs.metrics()
+    }
+
+@app.get("/api/debug/dead-letter")
+def debug_dead_letter(limit: int = 50) -> Dict:
+    """Debug - dokumenty trwale odrzucone przez Elasticsearch"""
+    if not es_storage or es_storage.dead_letter is None:
+        return {"count": 0, "entries": []}
+    return {
+        "count": es_storage.dead_letter.count,
+        "path": es_storage.dead_letter.path,
+        "entries": es_storage.dead_letter.recent(limit)
+    }
+
 @app.get("/api/debug/elasticsearch")
 async def debug_elasticsearch() -> Dict:
     """Debug - szczegolowy stan Elasticsearch"""
@@ -562,22 +707,22 @@ async def debug_elasticsearch() -> Dict:
     
     try:
         # Sprawdz ile dokumentow jest w ES
-        index_pattern = "log-manager-*"
+        index_pattern = f"{es_storage.index_prefix}-*"
         
         # Count all documents
-        count_result = es_storage.es.count(index=index_pattern)
+        count_result = await es_storage.es.count(index=index_pattern)
         total_docs = count_result.get("count", 0)
         
-        # Get breakdown by source_type
-        agg_result = es_storage.es.search(
+        # Get breakdown by source_type (pola sa typu keyword w szablonie)
+        agg_result = await es_storage.es.search(
             index=index_pattern,
             size=0,
             aggs={
                 "by_source_type": {
-                    "terms": {"field": "source_type.keyword", "size": 100}
+                    "terms": {"field": "source_type", "size": 100}
                 },
                 "by_source": {
-                    "terms": {"field": "source.keyword", "size": 100}
+                    "terms": {"field": "source", "size": 100}
                 }
             }
         )
@@ -592,12 +737,7 @@ async def debug_elasticsearch() -> Dict:
         }
         
         # Get last 5 docs
-        last_docs = es_storage.es.search(
-            index=index_pattern,
-            size=5,
-            sort=[{"timestamp": {"order": "desc"}}]
-        )
-        recent = [hit["_source"] for hit in last_docs.get("hits", {}).get("hits", [])]
+        recent = (await es_storage.search(size=5, index=index_pattern))["logs"]
         
         return {
             "status": "connected",
@@ -610,21 +750,65 @@ async def debug_elasticsearch() -> Dict:
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+async def sync_logs_to_es(job: Job, logs: List[Dict[str, Any]], chunk_size: int):
+    """Zadanie sync-to-es: logi do ES porcjami po chunk_size dokumentow
+    (w pamieci tylko jedna porcja operacji bulk naraz)"""
+    for start in range(0, len(logs), chunk_size):
+        if job.cancel_requested:
+            return
+        if not es_storage or not es_storage.is_connected:
+            raise RuntimeError("ES nie polaczony")
+        chunk = logs[start:start + chunk_size]
+        result = await es_storage.bulk_index(chunk)
+        # Nieudane po wyczerpaniu prob - do spoola writera, odtworzy je replay
+        requeued = await es_writer.requeue(result.retryable) if es_writer else 0
+        job.progress(processed=len(chunk), saved=result.saved, duplicates=result.duplicates,
+                     dead_lettered=result.dead_lettered, requeued=requeued,
+                     failed=len(result.retryable) - requeued)
+
 @app.post("/api/debug/sync-to-es")
 async def sync_to_elasticsearch() -> Dict:
-    """Reczne przeslanie wszystkich logow z pamieci do ES"""
+    """Reczne przeslanie wszystkich logow z pamieci do ES - zadanie w tle,
+    postep: GET /api/jobs/{job_id}"""
     if not es_storage or not es_storage.is_connected:
         return {"status": "error", "message": "ES nie polaczony"}
     
+    # Kopia listy (referencje) - bufor moze sie zmieniac w trakcie zadania
+    with logs_lock:
+        snapshot = list(all_logs)
+    chunk_size = max(1, int(config.elasticsearch.get('sync_chunk_docs', 5000)))
     try:
-        saved = await es_storage.save_logs_bulk(list(all_logs))
-        return {
-            "status": "ok",
-            "synced": saved,
-            "total_in_memory": len(all_logs)
-        }
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+        job = jobs.submit('sync-to-es', lambda job: sync_logs_to_es(job, snapshot, chunk_size),
+                          total=len(snapshot))
+    except JobLimitError as e:
+        raise HTTPException(429, str(e))
+    print(f"[ES] sync-to-es: zadanie {job.id} ({len(snapshot)} logow)")
+    return {
+        "status": "accepted",
+        "job_id": job.id,
+        "total_in_memory": len(snapshot)
+    }
+
+@app.get("/api/jobs")
+def list_jobs() -> Dict:
+    """Zadania w tle (najnowsze pierwsze)"""
+    return {"jobs": [job.to_dict() for job in jobs.list()], **jobs.metrics()}
+
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str) -> Dict:
+    """Postep zadania"""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Zadanie nie istnieje")
+    return job.to_dict()
+
+@app.post("/api/jobs/{job_id}/cancel")
+def cancel_job(job_id: str) -> Dict:
+    """Anuluj zadanie (konczy sie po biezacej porcji)"""
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(404, "Zadanie nie istnieje")
+    return job.to_dict()
 
 @app.get("/api/logs/{log_id}")
 async def get_log_details(log_id: str) -> Dict:
@@ -686,8 +870,11 @@ async def receive_frontend_logs(request: FrontendLogsRequest) -> Dict:
             'stack_trace': log_entry.stack,
             'raw': f"[{log_entry.level.upper()}] {log_entry.message}"
         }
+        log_dict['_id'] = document_id(log_dict)
         
-        all_logs.append(log_dict)
+        with logs_lock:
+            all_logs.append(log_dict)
+        stats_cache.add([log_dict])
         received += 1
         
         # Zapisz do ES
@@ -698,8 +885,9 @@ async def receive_frontend_logs(request: FrontendLogsRequest) -> Dict:
                 print(f"[ES] Blad zapisu frontend log: {e}")
     
     # Ogranicz rozmiar listy
-    if len(all_logs) > MAX_LOGS:
-        del all_logs[:-MAX_LOGS]
+    with logs_lock:
+        if len(all_logs) > MAX_LOGS:
+            del all_logs[:-MAX_LOGS]
     
     print(f"[FRONTEND] Otrzymano {received} logow z frontendu")
     
@@ -712,6 +900,7 @@ async def clear_logs() -> Dict:
     
     memory_count = len(all_logs)
     all_logs = []
+    stats_cache.clear()
     
     # Reset tylko licznikow, NIE trackingu - stare logi nie beda ponownie zbierane
     for source in sources.values():
@@ -740,15 +929,24 @@ async def clear_logs() -> Dict:
 async def get_stats(hours: int = 24) -> Dict:
     """Statystyki logow"""
     
+    # Ostatnie godziny - z cache liczonego przy zbieraniu, bez zapytania do ES
+    stats = stats_cache.lookup(hours)
+    if stats is not None:
+        return {**stats, "served_from": "cache"}
+    
     # Probuj z ES
     if es_storage and es_storage.is_connected:
         try:
             stats = await es_storage.get_stats(hours=hours)
             if stats:
-                return stats
+                return {**stats, "served_from": "elasticsearch"}
         except Exception as e:
             print(f"[ES] Blad statystyk: {e}")
     
+    # Bez ES cache ma wszystko, co widzial ten proces - jesli okno miesci sie w pierscieniu
+    if 0 < hours * 60 <= stats_cache.minutes:
+        return {**stats_cache.stats(hours), "served_from": "cache"}
+    
     # Fallback do pamieci
     logs = all_logs
     
@@ -775,7 +973,8 @@ async def get_stats(hours: int = 24) -> Dict:
         "by_source": by_source,
         "timeline": [],
         "level_timeline": [],
-        "operation_timeline": []
+        "operation_timeline": [],
+        "served_from": "memory"
     }
 
 # --- ELASTICSEARCH STATUS ---
@@ -794,5 +993,11 @@ def elasticsearch_status() -> Dict:
         "enabled": ES_ENABLED,
         "connected": es_storage.is_connected,
         "hosts": es_storage.hosts,
-        "index_prefix": es_storage.index_prefix
+        "index_prefix": es_storage.index_prefix,
+        "index_mode": es_storage.index_mode,
+        "mapping_profile": es_storage.mapping_profile,
+        "write_alias": es_storage._write_alias() if es_storage.index_mode == 'ilm' else None,
+        "retention": es_retention.metrics() if es_retention else None,
+        "rollup": es_rollup.metrics() if es_rollup else None,
+        "connection": es_supervisor.metrics() if es_supervisor else es_storage.connection_metrics()
     }
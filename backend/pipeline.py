@@ -0,0 +1,231 @@
+"""
+Pipeline - Etapowe przetwarzanie zebranych logow
+collect -> normalize -> buffer -> sink, polaczone ograniczonymi kolejkami.
+Gdy sink (Elasticsearch) nie nadaza, kolejki sie zapelniaja i scheduler
+wstrzymuje zrodla (backpressure) zamiast trzymac caly burst w pamieci.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+
+RATE_WINDOW = 10.0  # sekundy okna do liczenia przepustowosci
+
+
+class StageStats:
+    """Liczniki pojedynczego etapu"""
+
+    def __init__(self):
+        self.batches = 0
+        self.items = 0
+        self.errors = 0
+        self._recent: deque = deque(maxlen=10000)
+        self._lock = threading.Lock()
+
+    def record(self, items: int):
+        now = time.monotonic()
+        with self._lock:
+            self.batches += 1
+            self.items += items
+            self._recent.append((now, items))
+
+    def per_sec(self) -> float:
+        cutoff = time.monotonic() - RATE_WINDOW
+        with self._lock:
+            while self._recent and self._recent[0][0] < cutoff:
+                self._recent.popleft()
+            return sum(n for _, n in self._recent) / RATE_WINDOW
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "errors": self.errors,
+            "per_sec": round(self.per_sec(), 2),
+        }
+
+
+class DocQueue:
+    """Kolejka partii ograniczona liczba dokumentow, nie partii.
+
+    put() blokuje gdy suma dokumentow w kolejce przekroczylaby max_docs;
+    partia wieksza niz cala pojemnosc wchodzi tylko do pustej kolejki.
+    """
+
+    def __init__(self, max_docs: int):
+        self.max_docs = max_docs
+        self.docs = 0  # biezaca suma dokumentow (put dodaje, get odejmuje)
+        self.unfinished_tasks = 0
+        self._batches: deque = deque()
+        self._cond = threading.Condition()
+
+    def put(self, item: Any, size: int):
+        with self._cond:
+            while self.max_docs > 0 and self.docs and self.docs + size > self.max_docs:
+                self._cond.wait()
+            self._batches.append((item, size))
+            self.docs += size
+            self.unfinished_tasks += 1
+            self._cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._batches, timeout):
+                raise queue.Empty
+            return self._pop()
+
+    def get_nowait(self) -> Any:
+        with self._cond:
+            if not self._batches:
+                raise queue.Empty
+            return self._pop()
+
+    def _pop(self) -> Any:
+        item, size = self._batches.popleft()
+        self.docs -= size
+        self._cond.notify_all()
+        return item
+
+    def task_done(self):
+        with self._cond:
+            self.unfinished_tasks -= 1
+
+    def qsize(self) -> int:
+        return len(self._batches)
+
+    def fill(self) -> float:
+        return self.docs / self.max_docs if self.max_docs > 0 else 0.0
+
+
+class IngestPipeline:
+    """Etapy normalize/buffer/sink w osobnych watkach z ograniczonymi kolejkami"""
+
+    def __init__(
+            self,
+            normalize: Callable[[str, Any, List[Any]], List[Dict[str, Any]]],
+            buffer: Callable[[List[Dict[str, Any]]], None],
+            sink: Callable[[List[Dict[str, Any]]], None],
+            queue_docs: int = 10000,
+            sink_batch: int = 1000,
+            high_watermark: float = 0.8,
+            low_watermark: float = 0.5
+    ):
+        self.normalize = normalize
+        self.buffer = buffer
+        self.sink = sink
+        self.sink_batch = sink_batch
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+
+        # Kolejki przechowuja partie, ale pojemnosc i zapelnienie licza sie
+        # w dokumentach - jedna partia 10k logow to nie to samo co 10 logow
+        self.normalize_queue = DocQueue(queue_docs)
+        self.sink_queue = DocQueue(queue_docs)
+
+        self.stats = {name: StageStats() for name in ('collect', 'normalize', 'buffer', 'sink')}
+        self.paused_count = 0
+        self._paused = False
+        self._running = False
+        self._threads: List[threading.Thread] = []
+
+    # --- Sterowanie ---
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._threads = [
+            threading.Thread(target=self._normalize_loop, name="pipeline-normalize", daemon=True),
+            threading.Thread(target=self._sink_loop, name="pipeline-sink", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Zatrzymaj etapy po oproznieniu kolejek (maks. timeout sekund)"""
+        deadline = time.monotonic() + timeout
+        while (self.normalize_queue.unfinished_tasks or self.sink_queue.unfinished_tasks) \
+                and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._running = False
+
+    # --- Etap collect (wolany przez scheduler) ---
+
+    def submit(self, name: str, source: Any, logs: List[Any]):
+        """Przekaz partie z collect(); blokuje gdy kolejka pelna (backpressure)"""
+        self.normalize_queue.put((name, source, logs), len(logs))
+        self.stats['collect'].record(len(logs))
+
+    @property
+    def paused(self) -> bool:
+        """Czy zrodla powinny wstrzymac zbieranie (histereza high/low watermark)"""
+        fill = max(self.normalize_queue.fill(), self.sink_queue.fill())
+        if self._paused:
+            if fill <= self.low_watermark:
+                self._paused = False
+        elif fill >= self.high_watermark:
+            self._paused = True
+            self.paused_count += 1
+            print(f"[PIPELINE] Backpressure - wstrzymano zrodla (kolejki {fill:.0%})")
+        return self._paused
+
+    # --- Etapy w tle ---
+
+    def _normalize_loop(self):
+        while self._running:
+            try:
+                name, source, logs = self.normalize_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            try:
+                docs = self.normalize(name, source, logs)
+                self.stats['normalize'].record(len(docs))
+                self.buffer(docs)
+                self.stats['buffer'].record(len(docs))
+                # Blokuje gdy sink nie nadaza - backpressure wraca do collect
+                self.sink_queue.put(docs, len(docs))
+            except Exception as e:
+                self.stats['normalize'].errors += 1
+                print(f"[PIPELINE] Blad normalizacji {name}: {e}")
+            finally:
+                self.normalize_queue.task_done()
+
+    def _sink_loop(self):
+        while self._running:
+            try:
+                docs = self.sink_queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            taken = 1
+            # Sklej oczekujace partie w jeden zapis (do sink_batch logow)
+            while len(docs) < self.sink_batch:
+                try:
+                    docs = docs + self.sink_queue.get_nowait()
+                    taken += 1
+                except queue.Empty:
+                    break
+            try:
+                self.sink(docs)
+                self.stats['sink'].record(len(docs))
+            except Exception as e:
+                self.stats['sink'].errors += 1
+                print(f"[PIPELINE] Blad zapisu: {e}")
+            finally:
+                for _ in range(taken):
+                    self.sink_queue.task_done()
+
+    # --- Metryki ---
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "paused": self._paused,
+            "paused_count": self.paused_count,
+            "queues": {
+                name: {"docs": q.docs, "batches": q.qsize(), "capacity": q.max_docs}
+                for name, q in (("normalize", self.normalize_queue), ("sink", self.sink_queue))
+            },
+            "stages": {name: stats.to_dict() for name, stats in self.stats.items()},
+        }
@@ -0,0 +1,245 @@
+"""
+Scheduler - Rownolegle zbieranie logow ze zrodel
+Kazde zrodlo ma wlasny harmonogram (interval) i wykonuje collect() w puli
+watkow, wiec wolne lub zawieszone zrodlo nie opoznia pozostalych.
+Interval jest adaptacyjny: backlog - natychmiast kolejny cykl, brak logow -
+stopniowe wydluzanie z jitterem, bledy - backoff wykladniczy.
+Gdy is_paused() zwraca True (pelne kolejki pipeline), nowe cykle czekaja.
+Zawieszony (timeout) collect() nie zajmuje miejsca w puli: pula jest
+wymieniana na nowa, a stara konczy sie razem z zawieszonym watkiem.
+"""
+
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+
+DEFAULT_INTERVAL = 2.0   # sekundy miedzy cyklami zrodla
+DEFAULT_TIMEOUT = 30.0   # po tylu sekundach collect() jest uznany za zawieszony
+DEFAULT_MAX_INTERVAL = 10.0  # maksymalny interval bezczynnego/blednego zrodla
+IDLE_BACKOFF = 1.5       # mnoznik intervalu po pustym cyklu
+JITTER = 0.1             # +/- 10% losowego rozrzutu
+MAX_BACKOFF_EXPONENT = 16  # 2**16 x interval - i tak powyzej max_interval
+
+
+@dataclass
+class SourceSchedule:
+    """Stan harmonogramu pojedynczego zrodla"""
+    interval: float              # bazowy interval z konfiguracji
+    timeout: float
+    min_interval: float = 0.0
+    max_interval: float = DEFAULT_MAX_INTERVAL
+    adaptive: bool = True
+    current_interval: Optional[float] = None
+    backlog: bool = False
+    last_count: int = 0
+    error_streak: int = 0
+    next_run: float = 0.0
+    started_at: Optional[float] = None
+    future: Optional[Future] = None
+    timed_out: bool = False
+    last_duration: Optional[float] = None
+    runs: int = 0
+    timeouts: int = 0
+
+    def __post_init__(self):
+        if self.current_interval is None:
+            self.current_interval = self.interval
+
+    def to_dict(self) -> dict:
+        return {
+            "interval": self.current_interval,
+            "base_interval": self.interval,
+            "backlog": self.backlog,
+            "last_count": self.last_count,
+            "error_streak": self.error_streak,
+            "timeout": self.timeout,
+            "in_flight": self.future is not None and not self.future.done(),
+            "last_duration": self.last_duration,
+            "runs": self.runs,
+            "timeouts": self.timeouts,
+            "hung": self.hung,
+        }
+
+    @property
+    def hung(self) -> bool:
+        """collect() przekroczyl timeout i nadal trwa"""
+        return self.timed_out and self.future is not None and not self.future.done()
+
+
+class SourceScheduler:
+    """Harmonogram zrodel na ograniczonej puli watkow"""
+
+    def __init__(
+            self,
+            get_sources: Callable[[], Dict[str, Any]],
+            handle_logs: Callable[[str, Any, List[Any]], None],
+            max_workers: int = 8,
+            tick: float = 0.1,
+            is_paused: Optional[Callable[[], bool]] = None
+    ):
+        self.get_sources = get_sources
+        self.handle_logs = handle_logs
+        self.is_paused = is_paused
+        self.max_workers = max_workers
+        self.tick = tick
+        self.schedules: Dict[str, SourceSchedule] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def start(self):
+        if self._running:
+            return
+        self._running = True
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="collector")
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._executor:
+            # Nie czekaj na zawieszone zrodla - watki sa daemon
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    @property
+    def hung_workers(self) -> int:
+        """Watki zajete przez zawieszone collect() (poza pula max_workers)"""
+        return sum(1 for schedule in self.schedules.values() if schedule.hung)
+
+    def get_schedule(self, name: str) -> Optional[SourceSchedule]:
+        return self.schedules.get(name)
+
+    def _schedule_for(self, source: Any) -> SourceSchedule:
+        cfg = getattr(source, 'config', {}) or {}
+        interval = float(cfg.get('interval', DEFAULT_INTERVAL))
+        return SourceSchedule(
+            interval=interval,
+            timeout=float(cfg.get('timeout', DEFAULT_TIMEOUT)),
+            min_interval=float(cfg.get('min_interval', 0.0)),
+            max_interval=max(interval, float(cfg.get('max_interval', DEFAULT_MAX_INTERVAL))),
+            adaptive=bool(cfg.get('adaptive', True)),
+        )
+
+    def _loop(self):
+        print("[COLLECTOR] Start")
+        while self._running:
+            try:
+                self._dispatch(time.monotonic())
+            except Exception as e:
+                print(f"[COLLECTOR] Blad harmonogramu: {e}")
+            time.sleep(self.tick)
+        print("[COLLECTOR] Stop")
+
+    def _dispatch(self, now: float):
+        """Uruchom zrodla, ktorym minal interval (bez nakladania sie cykli)"""
+        sources = self.get_sources()
+
+        for name in list(self.schedules):
+            if name not in sources:
+                del self.schedules[name]
+
+        # Backpressure - pipeline nie nadaza, nie zaczynaj nowych cykli
+        paused = bool(self.is_paused and self.is_paused())
+
+        for name, source in list(sources.items()):
+            if not source.enabled or not source.running:
+                continue
+
+            schedule = self.schedules.get(name)
+            if schedule is None:
+                schedule = self.schedules[name] = self._schedule_for(source)
+
+            if schedule.future is not None:
+                if not schedule.future.done():
+                    # Poprzedni cykl nadal trwa - nie uruchamiaj kolejnego
+                    if not schedule.timed_out and now - schedule.started_at > schedule.timeout:
+                        schedule.timed_out = True
+                        schedule.timeouts += 1
+                        source.last_error = f"Timeout: collect() trwa dluzej niz {schedule.timeout:.0f}s"
+                        print(f"[ERROR] {name}: {source.last_error}")
+                        self._replace_executor()
+                    continue
+                schedule.future = None
+
+            if not paused and now >= schedule.next_run:
+                schedule.started_at = now
+                schedule.timed_out = False
+                schedule.future = self._executor.submit(self._run_source, name, source, schedule)
+
+    def _replace_executor(self):
+        """Oddaj zawieszony watek starej puli i uruchamiaj cykle w nowej
+
+        Watku nie da sie przerwac, wiec stara pula konczy sie dopiero po
+        powrocie collect(). Kazde zawieszone zrodlo trzyma najwyzej jeden
+        watek (kolejny cykl startuje po zakonczeniu poprzedniego), wiec
+        watkow jest co najwyzej max_workers + hung_workers.
+        """
+        old = self._executor
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="collector")
+        if old:
+            # Trwajace cykle dokoncza sie w starej puli, czekajace w kolejce
+            # sa anulowane i w nastepnym ticku trafia do nowej
+            old.shutdown(wait=False, cancel_futures=True)
+
+    def _run_source(self, name: str, source: Any, schedule: SourceSchedule):
+        started = time.monotonic()
+        count = 0
+        failed = False
+        try:
+            new_logs = source.collect()
+            count = len(new_logs) if new_logs else 0
+            if new_logs:
+                self.handle_logs(name, source, new_logs)
+            source.last_check = datetime.now()
+            # collect() ustawia last_error także dla błędów obsłużonych
+            # wewnętrznie (np. brak SELECT do mysql.general_log). Nie
+            # kasuj go tutaj, bo panel Sources musi go pokazać.
+            failed = count == 0 and bool(source.last_error)
+        except Exception as e:
+            source.last_error = str(e)
+            failed = True
+            print(f"[ERROR] {name}: {e}")
+        finally:
+            finished = time.monotonic()
+            schedule.last_duration = finished - started
+            schedule.runs += 1
+            schedule.last_count = count
+            schedule.backlog = bool(getattr(source, 'backlog', False)) and not failed
+            schedule.next_run = finished + self._next_interval(schedule, count, failed)
+
+    @staticmethod
+    def _next_interval(schedule: SourceSchedule, count: int, failed: bool) -> float:
+        """Wylicz opoznienie nastepnego cyklu i zapamietaj biezacy interval"""
+        if not schedule.adaptive:
+            schedule.current_interval = schedule.interval
+            return schedule.interval
+
+        if failed:
+            # Backoff wykladniczy przy kolejnych bledach
+            schedule.error_streak += 1
+            # Wykladnik ograniczony - dluga seria bledow nie przepelnia floata
+            interval = schedule.interval * (2 ** min(schedule.error_streak, MAX_BACKOFF_EXPONENT))
+        else:
+            schedule.error_streak = 0
+            if schedule.backlog:
+                # Limit partii osiagniety - zbieraj dalej od razu
+                schedule.current_interval = schedule.min_interval
+                return schedule.min_interval
+            if count:
+                interval = schedule.interval
+            else:
+                # Bezczynne zrodlo - stopniowo rzadziej
+                interval = schedule.current_interval * IDLE_BACKOFF
+
+        interval = min(schedule.max_interval, max(schedule.interval, interval))
+        schedule.current_interval = interval
+        return interval * random.uniform(1 - JITTER, 1 + JITTER)
@@ -31,6 +31,15 @@ class ParsedLog:
     message: str = ""                     # Oczyszczona wiadomość
     user: Optional[str] = None            # User jeśli wykryty
     
+    # Wydajność zapytania (np. MongoDB system.profile)
+    duration_ms: Optional[int] = None     # Czas wykonania (millis)
+    docs_examined: Optional[int] = None   # Przeskanowane dokumenty
+    docs_returned: Optional[int] = None   # Zwrócone dokumenty (nreturned)
+    
+    # Pozycja w źródle (inode:offset, klucz zdarzenia, resume token) - z niej
+    # i z treści powstaje deterministyczne _id dokumentu w ES
+    position: Optional[str] = None
+    
     def to_dict(self) -> dict:
         return {k: v for k, v in asdict(self).items() if v is not None}
 
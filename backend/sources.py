@@ -5,14 +5,17 @@ Sources - Klasy do czytania logow z roznych zrodel
 import os
 import time
 import hashlib
+import json
 import re
+import fnmatch
+import threading
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from dataclasses import dataclass, asdict
 from pathlib import Path
 
-from smart_parser import parse_log, parse_and_filter, ParsedLog
+from smart_parser import parse_log, parse_and_filter, ParsedLog, parser as log_parser
 
 
 @dataclass
@@ -25,11 +28,26 @@ class SourceStatus:
     last_check: Optional[str] = None
     logs_collected: int = 0
     last_error: Optional[str] = None
+    round_trips: int = 0
     
     def to_dict(self) -> dict:
         return asdict(self)
 
 
+def _load_fast_hash():
+    """64-bitowy hash bajtow: xxhash (opcjonalny) lub blake2b jako fallback"""
+    try:
+        import xxhash
+        return xxhash.xxh3_64_intdigest
+    except ImportError:
+        def blake2b_64(data: bytes) -> int:
+            return int.from_bytes(hashlib.blake2b(data, digest_size=8).digest(), 'little')
+        return blake2b_64
+
+
+_fast_hash = _load_fast_hash()
+
+
 class BaseSource(ABC):
     """Bazowa klasa dla zrodel logow"""
     
@@ -41,9 +59,16 @@ class BaseSource(ABC):
         self.last_check: Optional[datetime] = None
         self.logs_collected = 0
         self.last_error: Optional[str] = None
+        # Liczba zapytan/round-tripow do serwera zrodla (diagnostyka)
+        self.round_trips = 0
+        # Ostatni collect() trafil w limit partii - na serwerze czekaja kolejne logi
+        self.backlog = False
         
         # Filtrowanie
         self.filter_important = config.get('filter_important', False)
+        
+        # Katalog na stan przetrwajacy restart (np. resume token)
+        self.state_dir = config.get('state_dir', os.environ.get('LOG_MANAGER_STATE_DIR', '.state'))
     
     @abstractmethod
     def collect(self) -> List[ParsedLog]:
@@ -61,6 +86,11 @@ class BaseSource(ABC):
         """Typ zrodla"""
         pass
     
+    def close(self):
+        """Zrodlo usuniete albo aplikacja zamykana - zwolnij polaczenia i watki w tle"""
+        self.enabled = False
+        self.running = False
+    
     def get_status(self) -> SourceStatus:
         return SourceStatus(
             name=self.name,
@@ -69,13 +99,41 @@ class BaseSource(ABC):
             running=self.running,
             last_check=self.last_check.isoformat() if self.last_check else None,
             logs_collected=self.logs_collected,
-            last_error=self.last_error
+            last_error=self.last_error,
+            round_trips=self.round_trips
         )
     
     def reset_tracking(self):
         """Reset tracking - pozwoli na ponowne zebranie logow"""
         pass  # Domyslnie nic - podklasy moga nadpisac
     
+    def _state_path(self) -> str:
+        safe_name = re.sub(r'[^\w.-]', '_', self.name)
+        return os.path.join(self.state_dir, f"{safe_name}.json")
+    
+    def load_state(self) -> Dict[str, Any]:
+        """Wczytaj zapisany stan zrodla (pusty slownik gdy brak)"""
+        try:
+            with open(self._state_path(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            print(f"[{self.name}] Nie mozna wczytac stanu: {e}")
+            return {}
+    
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Zapisz stan zrodla atomowo (plik tymczasowy + rename)"""
+        try:
+            os.makedirs(self.state_dir, exist_ok=True)
+            path = self._state_path()
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            print(f"[{self.name}] Nie mozna zapisac stanu: {e}")
+    
     def _parse_and_filter(self, raw: str, event_type: str = None) -> Optional[ParsedLog]:
         """Parsuj log i filtruj jesli wlaczone"""
         if self.filter_important:
@@ -252,18 +310,23 @@ class FileSource(BaseSource):
                 position = 0
                 self._file_positions[filepath] = 0
             
-            # Czytaj nowe linie
-            with open(filepath, 'r', encoding='utf-8', errors='ignore') as f:
+            # Czytaj nowe linie (binarnie - offset kazdej linii jest jej pozycja,
+            # ta sama linia przeczytana ponownie po restarcie dostaje to samo _id)
+            with open(filepath, 'rb') as f:
                 f.seek(position)
                 
-                for line in f:
-                    line = line.strip()
+                offset = position
+                for raw_line in f:
+                    line_offset = offset
+                    offset += len(raw_line)
+                    line = raw_line.decode('utf-8', errors='ignore').strip()
                     if line:
                         parsed = self._parse_and_filter(line)
                         if parsed:
+                            parsed.position = f"{current_inode}:{line_offset}"
                             logs.append(parsed)
                 
-                self._file_positions[filepath] = f.tell()
+                self._file_positions[filepath] = offset
         
         except FileNotFoundError:
             self._file_positions.pop(filepath, None)
@@ -300,12 +363,34 @@ class MySQLSource(BaseSource):
         self.monitor_table = config.get('monitor_table', '')
         self.monitor_column = config.get('monitor_column', 'id')
         self.timestamp_column = config.get('timestamp_column', 'created_at')
+        # Projekcja kolumn custom tabeli (pusta lista = wszystkie kolumny)
+        self.monitor_columns: List[str] = config.get('monitor_columns') or []
+        # Mapowanie pol ParsedLog na kolumny, np. {'message': 'action', 'user': 'login'}
+        self.column_map: Dict[str, str] = config.get('column_map') or {}
+        # Keyset pagination - rozmiar strony i limit stron w jednym cyklu
+        self.batch_size = int(config.get('batch_size', 1000))
+        self.max_batches = int(config.get('max_batches_per_cycle', 20))
+        self.fetch_size = int(config.get('fetch_size', 500))
+        # Rozszerzenie C mysql.connector (jesli zainstalowane); True wymusza czysty Python
+        self.use_pure = bool(config.get('use_pure', False))
+        # Cache zdrowia polaczenia i sprawdzen general_log (sekundy)
+        self.health_check_interval = float(config.get('health_check_interval', 30))
+        self.capability_ttl = float(config.get('capability_ttl', 300))
+        # Backoff ponownego laczenia gdy serwer nie odpowiada (sekundy)
+        self.reconnect_backoff = float(config.get('reconnect_backoff', 2))
+        self.reconnect_backoff_max = float(config.get('reconnect_backoff_max', 300))
         
         # Tracking
         self._last_event_time = None
         self._last_id = 0
         self._connection = None
         self._initialized = False
+        self._resolved_column_map: Optional[Dict[str, str]] = None
+        # Stan cache polaczenia (time.monotonic())
+        self._connection_ok_at: Optional[float] = None
+        self._capabilities_checked_at: Optional[float] = None
+        self._reconnect_delay = 0.0
+        self._next_connect_at = 0.0
     
     @property
     def source_type(self) -> str:
@@ -318,34 +403,89 @@ class MySQLSource(BaseSource):
         self._initialized = False
         self._thread_databases.clear()
         self._seen_events.clear()
+        self._resolved_column_map = None
         print(f"[MySQL] Reset tracking dla {self.name}")
     
     def _get_connection(self):
-        """Pobierz lub utworz polaczenie"""
+        """Pobierz lub utworz polaczenie (z cache zdrowia i backoffem)"""
         try:
             import mysql.connector
             
-            if self._connection is None or not self._connection.is_connected():
+            now = time.monotonic()
+            if self._connection is not None:
+                # Ping (is_connected) tylko gdy polaczenie dawno nie bylo uzyte
+                if (self._connection_ok_at is not None and
+                        now - self._connection_ok_at < self.health_check_interval):
+                    return self._connection
+                self.round_trips += 1
+                if self._connection.is_connected():
+                    self._connection_ok_at = now
+                    return self._connection
+                self._drop_connection()
+            
+            if now < self._next_connect_at:
+                raise ConnectionError(
+                    f"Serwer MySQL niedostepny - ponowna proba za {self._next_connect_at - now:.0f}s")
+            
+            self.round_trips += 1
+            try:
                 self._connection = mysql.connector.connect(
                     host=self.host,
                     port=self.port,
                     user=self.user,
                     password=self.password,
                     database=self.database if self.database else None,
-                    connection_timeout=10
+                    connection_timeout=10,
+                    use_pure=self.use_pure
                 )
+            except Exception:
+                # Wykladniczy backoff zamiast laczenia w kazdym cyklu
+                self._reconnect_delay = min(self.reconnect_backoff_max,
+                                            max(self.reconnect_backoff, self._reconnect_delay * 2))
+                self._next_connect_at = time.monotonic() + self._reconnect_delay
+                raise
             
+            self._reconnect_delay = 0.0
+            self._next_connect_at = 0.0
+            self._connection_ok_at = time.monotonic()
             return self._connection
         except Exception as e:
             self.last_error = str(e)
             raise
     
+    def close(self):
+        super().close()
+        self._drop_connection()
+    
+    def _drop_connection(self):
+        """Porzuc polaczenie i cache zwiazanych z nim sprawdzen"""
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+        self._connection = None
+        self._connection_ok_at = None
+        self._capabilities_checked_at = None
+    
+    def _execute(self, cursor, query: str, params: tuple = ()):
+        """Wykonaj zapytanie i policz round-trip"""
+        self.round_trips += 1
+        cursor.execute(query, params)
+        # Udane zapytanie potwierdza zdrowie polaczenia - ping nie jest potrzebny
+        self._connection_ok_at = time.monotonic()
+    
+    def _mark_connection_suspect(self):
+        """Po bledzie zapytania wymus ping przy nastepnym cyklu"""
+        self._connection_ok_at = None
+        self._capabilities_checked_at = None
+    
     def test_connection(self) -> bool:
         """Testuj polaczenie z MySQL"""
         try:
             conn = self._get_connection()
             cursor = conn.cursor()
-            cursor.execute("SELECT 1")
+            self._execute(cursor, "SELECT 1")
             cursor.fetchone()
             cursor.close()
             self.last_error = None
@@ -376,63 +516,178 @@ class MySQLSource(BaseSource):
         
         return logs
     
+    # Kandydaci na kolumny mapowane na pola ParsedLog (gdy brak column_map)
+    _COLUMN_CANDIDATES = {
+        'message': ('message', 'msg', 'description', 'details'),
+        'severity': ('severity', 'level', 'log_level'),
+        'event_type': ('event_type', 'operation', 'action', 'event'),
+        'user': ('user', 'username', 'user_name', 'login'),
+        'table_name': ('table_name', 'entity', 'object_type'),
+    }
+
+    @staticmethod
+    def _quote_identifier(name: str) -> str:
+        """Cytuj identyfikator MySQL (obsluga zapisu baza.tabela)"""
+        return '.'.join('`' + part.replace('`', '``') + '`' for part in name.split('.'))
+
+    def _table_query(self) -> str:
+        """Zapytanie keyset dla custom tabeli z projekcja kolumn"""
+        if self.monitor_columns:
+            columns = list(self.monitor_columns)
+            # Kolumny potrzebne do paginacji i mapowania musza byc w projekcji
+            for required in [self.monitor_column, self.timestamp_column, *self.column_map.values()]:
+                if required and required not in columns:
+                    columns.append(required)
+            projection = ', '.join(self._quote_identifier(c) for c in columns)
+        else:
+            projection = '*'
+        key = self._quote_identifier(self.monitor_column)
+        return (f"SELECT {projection} FROM {self._quote_identifier(self.monitor_table)} "
+                f"WHERE {key} > %s ORDER BY {key} ASC LIMIT {self.batch_size}")
+
+    def _get_column_map(self, row: Dict[str, Any]) -> Dict[str, str]:
+        """Ustal (raz) mapowanie pol ParsedLog na kolumny tabeli"""
+        if self._resolved_column_map is None:
+            resolved = {}
+            for field_name, candidates in self._COLUMN_CANDIDATES.items():
+                if field_name in self.column_map:
+                    resolved[field_name] = self.column_map[field_name]
+                    continue
+                for column in candidates:
+                    if column in row:
+                        resolved[field_name] = column
+                        break
+            self._resolved_column_map = resolved
+        return self._resolved_column_map
+
+    def _row_to_log(self, row: Dict[str, Any]) -> Optional[ParsedLog]:
+        """Mapuj wiersz bezposrednio na ParsedLog (bez str(row) i ponownego parsowania)"""
+        columns = self._get_column_map(row)
+
+        def value(field_name: str) -> Optional[str]:
+            column = columns.get(field_name)
+            if not column:
+                return None
+            val = row.get(column)
+            if val is None:
+                return None
+            if isinstance(val, (bytes, bytearray)):
+                return val.decode('utf-8', errors='ignore')
+            return str(val)
+
+        ts = row.get(self.timestamp_column)
+        if isinstance(ts, datetime):
+            timestamp = ts.isoformat()
+        elif ts:
+            timestamp = str(ts)
+        else:
+            timestamp = datetime.now().isoformat()
+
+        raw = ' '.join(f"{k}={v.decode('utf-8', errors='ignore') if isinstance(v, (bytes, bytearray)) else v}"
+                       for k, v in row.items())
+        message = value('message') or raw
+
+        parsed = ParsedLog(
+            raw=raw,
+            timestamp=timestamp,
+            source=self.name,
+            event_type=(value('event_type') or 'DB_RECORD').upper(),
+            severity=(value('severity') or 'INFO').upper(),
+            table_name=value('table_name') or self.monitor_table,
+            message=message[:500],
+            user=value('user')
+        )
+        if self.filter_important and not log_parser.is_important(parsed):
+            return None
+        return parsed
+
     def _collect_from_table(self) -> List[ParsedLog]:
-        """Zbierz logi z custom tabeli"""
+        """Zbierz logi z custom tabeli - kursor strumieniowy + keyset pagination"""
         logs = []
+        cursor = None
         
         try:
             conn = self._get_connection()
-            cursor = conn.cursor(dictionary=True)
-            
-            query = f"""
-                SELECT * FROM {self.monitor_table}
-                WHERE {self.monitor_column} > %s
-                ORDER BY {self.monitor_column} ASC
-                LIMIT 1000
-            """
-            
-            cursor.execute(query, (self._last_id,))
-            rows = cursor.fetchall()
+            # Kursor niebuforowany: wiersze sa czytane z serwera porcjami
+            # (fetchmany) zamiast buforowania calego wyniku w pamieci.
+            cursor = conn.cursor(dictionary=True, buffered=False)
+            query = self._table_query()
             
-            for row in rows:
-                if self.monitor_column in row:
-                    self._last_id = max(self._last_id, row[self.monitor_column])
-                
-                # Utworz log
-                raw = str(row)
-                timestamp = datetime.now().isoformat()
-                
-                if self.timestamp_column in row and row[self.timestamp_column]:
-                    ts = row[self.timestamp_column]
-                    if isinstance(ts, datetime):
-                        timestamp = ts.isoformat()
-                    else:
-                        timestamp = str(ts)
-                
-                parsed = self._parse_and_filter(raw, 'DB_RECORD')
-                if parsed:
-                    parsed.timestamp = timestamp
-                    logs.append(parsed)
+            # Kolejne strony w tym samym cyklu - duzy backlog jest
+            # oprozniany bez czekania na nastepne wywolanie collect().
+            self.backlog = False
+            for _ in range(max(1, self.max_batches)):
+                self._execute(cursor, query, (self._last_id,))
+                fetched = 0
+                while True:
+                    rows = cursor.fetchmany(self.fetch_size)
+                    if not rows:
+                        break
+                    fetched += len(rows)
+                    batch_logs = []
+                    last_id = self._last_id
+                    for row in rows:
+                        # ORDER BY ASC - ostatni wiersz ma najwiekszy klucz
+                        if row.get(self.monitor_column) is not None:
+                            last_id = row[self.monitor_column]
+                        parsed = self._row_to_log(row)
+                        if parsed:
+                            if row.get(self.monitor_column) is not None:
+                                parsed.position = f"{self.monitor_table}:{row[self.monitor_column]}"
+                            batch_logs.append(parsed)
+                    # Klucz przesuwany dopiero gdy cala porcja jest w logach -
+                    # blad w polowie nie gubi wierszy
+                    logs.extend(batch_logs)
+                    self._last_id = last_id
+                if fetched < self.batch_size:
+                    break
+            else:
+                # Limit stron w cyklu wyczerpany - w tabeli zostaly wiersze
+                self.backlog = True
             
-            cursor.close()
             self.last_error = None
             
         except Exception as e:
             self.last_error = str(e)
+            self._mark_connection_suspect()
+        finally:
+            if cursor:
+                self._close_cursor(cursor)
         
         return logs
     
+    def _close_cursor(self, cursor):
+        """Zamknij kursor niebuforowany. Po bledzie w polowie wyniku close() rzuca
+        'Unread result found' - reszta wyniku jest najpierw odczytywana, a blad
+        zamkniecia nie wychodzi poza collect()"""
+        try:
+            if getattr(cursor, 'with_rows', False):
+                cursor.fetchall()
+        except Exception:
+            pass
+        try:
+            cursor.close()
+        except Exception as e:
+            self._mark_connection_suspect()
+            print(f"[MySQL] Blad zamykania kursora: {e}")
+    
     def _configure_general_log(self, cursor) -> bool:
         """Włącz dziennik SQL wymagany do monitorowania ruchu bazy."""
-        cursor.execute("SHOW VARIABLES LIKE 'general_log'")
-        general_log = cursor.fetchone()
-        cursor.execute("SHOW VARIABLES LIKE 'log_output'")
-        log_output = cursor.fetchone()
+        # Wynik sprawdzenia jest cache'owany per polaczenie przez capability_ttl,
+        # zeby nie wysylac dwoch SHOW VARIABLES w kazdym cyklu.
+        if (self._general_log_configured and self._capabilities_checked_at is not None and
+                time.monotonic() - self._capabilities_checked_at < self.capability_ttl):
+            return True
+        self._execute(cursor, "SHOW VARIABLES WHERE Variable_name IN ('general_log', 'log_output')")
+        variables = {str(row.get('Variable_name', '')).lower(): row for row in cursor.fetchall()}
+        general_log = variables.get('general_log')
+        log_output = variables.get('log_output')
         enabled = general_log and str(general_log.get('Value', '')).upper() == 'ON'
         table_output = log_output and 'TABLE' in str(log_output.get('Value', '')).upper()
 
         if enabled and table_output:
             self._general_log_configured = True
+            self._capabilities_checked_at = time.monotonic()
             return True
         if not self.auto_enable_general_log:
             self.last_error = ("Dziennik zapytań MySQL jest wyłączony. Włącz general_log "
@@ -442,10 +697,11 @@ class MySQLSource(BaseSource):
             # Ustawienia są świadomie wykonywane tylko przy dodanym źródle SQL.
             # Wymagają konta z uprawnieniem SYSTEM_VARIABLES_ADMIN (root w XAMPP).
             if not table_output:
-                cursor.execute("SET GLOBAL log_output = 'TABLE'")
+                self._execute(cursor, "SET GLOBAL log_output = 'TABLE'")
             if not enabled:
-                cursor.execute("SET GLOBAL general_log = 'ON'")
+                self._execute(cursor, "SET GLOBAL general_log = 'ON'")
             self._general_log_configured = True
+            self._capabilities_checked_at = time.monotonic()
             return True
         except Exception as exc:
             self.last_error = ("Nie można włączyć monitorowania SQL. Połącz źródło kontem root "
@@ -517,8 +773,9 @@ class MySQLSource(BaseSource):
                 ORDER BY event_time ASC
                 LIMIT 1000
             """
-            cursor.execute(query, (self._last_event_time,))
+            self._execute(cursor, query, (self._last_event_time,))
             rows = cursor.fetchall()
+            self.backlog = len(rows) >= 1000
             for row in rows:
                 event_time = row.get('event_time')
                 if event_time and event_time > self._last_event_time:
@@ -552,7 +809,7 @@ class MySQLSource(BaseSource):
                     timestamp=event_time.isoformat() if isinstance(event_time, datetime) else str(event_time),
                     source=self.name, event_type=event_type, severity=severity,
                     message=argument[:500], raw=argument,
-                    user=str(row.get('user_host', ''))))
+                    user=str(row.get('user_host', '')), position=key))
 
             # Limit pamięci używanej do odrzucania zduplikowanych rekordów.
             if len(self._seen_events) > 10000:
@@ -562,28 +819,90 @@ class MySQLSource(BaseSource):
                 print(f"[MySQL] Zebrano {len(logs)} logow z bazy {self.database or 'wszystkie'}")
         except Exception as e:
             self.last_error = str(e)
+            self._mark_connection_suspect()
             print(f"[MySQL ERROR] {e}")
         finally:
             if cursor:
-                cursor.close()
+                self._close_cursor(cursor)
         return logs
 
 
 class MongoDBSource(BaseSource):
     """Zrodlo: MongoDB (w tym Atlas)"""
     
-    def __init__(self, name: str, config: Dict[str, Any]):
+    def __init__(self, name: str, config: Dict[str, Any], parent: Optional['MongoDBSource'] = None):
         super().__init__(name, config)
         self.uri = config.get('uri', 'mongodb://localhost:27017')
         self.database = config.get('database', '')
         self.collection = config.get('collection', '')
         
+        # Tryb bazy: wiele kolekcji (lista `collections` lub wzorzec glob w
+        # `collection`, np. "*" albo "orders_*") w jednym zrodle i polaczeniu
+        collections = config.get('collections')
+        if collections:
+            self.collection_patterns: List[str] = [collections] if isinstance(collections, str) else list(collections)
+        elif any(ch in self.collection for ch in '*?'):
+            self.collection_patterns = [self.collection]
+        else:
+            self.collection_patterns = []
+        # Cache listy kolekcji (sekundy)
+        self.metadata_ttl = float(config.get('metadata_ttl', 60))
+        
+        # Tryb zbierania z kolekcji: auto | change_stream | incremental | diff
+        # auto - change stream, a gdy niedostepny (standalone) skan przyrostowy
+        # (jesli podano watermark_field) albo porownywanie snapshotow
+        self.mode = config.get('mode', 'auto')
+        self.max_await_ms = int(config.get('max_await_ms', 200))
+        self.stream_batch = int(config.get('stream_batch', 1000))
+        
+        # Skan przyrostowy - rosnace pole (np. _id, updatedAt) z indeksem
+        self.watermark_field = config.get('watermark_field') or '_id'
+        self.batch_size = int(config.get('batch_size', 1000))
+        self.max_batches = int(config.get('max_batches_per_cycle', 20))
+        # Rekoncyliacja w tle wykrywajaca usuniete dokumenty (0 = wylaczona)
+        self.reconcile_interval = float(config.get('reconcile_interval', 300))
+        self.reconcile_batch = int(config.get('reconcile_batch', 5000))
+        self.reconcile_pause = float(config.get('reconcile_pause', 0.05))
+        # system.profile - co ile sekund sprawdzac poziom profilowania
+        self.profile_check_interval = float(config.get('profile_check_interval', 60))
+        
         self._client = None
         self._last_id = None
-        self._doc_hashes: Dict[str, str] = {}  # doc_id -> hash dla wykrywania zmian
+        self._doc_hashes: Dict[bytes, int] = {}  # element _id -> hash dla wykrywania zmian
+        self.diff_limit = int(config.get('diff_limit', 1000))
         self._initial_load_done = False
         
-        print(f"[MongoDB] URI: {self._mask_uri(self.uri)}")
+        # Change stream
+        self._stream = None
+        self._resume_token: Optional[Dict[str, Any]] = None
+        self._change_streams_supported: Optional[bool] = None
+        self._token_loaded = False  # resume token wczytany ze stanu
+        
+        # Skan przyrostowy: (wartosc pola, _id) ostatniego dokumentu
+        self._watermark: Optional[tuple] = None
+        self._watermark_loaded = False  # osobno od tokena - auto moze przejsc na skan po nieudanym watch()
+        # Rekoncyliacja po zakresach _id: [gorna granica, liczba, _id zakresu w BSON]
+        self._ranges: List[list] = []
+        self._recent_ids: Dict[Any, Any] = {}  # klucz -> _id widziane od ostatniego przebiegu
+        self._pending_deletes: List[Any] = []
+        self._reconcile_lock = threading.Lock()
+        self._reconcile_thread: Optional[threading.Thread] = None
+        self._reconcile_stop = threading.Event()
+        
+        # Tailable cursor na system.profile
+        self._profile_cursor = None
+        self._profile_last_ts: Optional[datetime] = None
+        self._profile_seen: set = set()  # hashe wpisow z ts == _profile_last_ts
+        self._profile_checked_at: Optional[float] = None
+        
+        # Metadane kolekcji i kolekcje w trybie bazy (bez change streams)
+        self._collection_names_cache: Optional[List[str]] = None
+        self._collection_names_at: Optional[float] = None
+        self._children: Dict[str, 'MongoDBSource'] = {}
+        self._parent = parent  # tracker kolekcji w trybie bazy - klient rodzica
+        
+        if parent is None:
+            print(f"[MongoDB] URI: {self._mask_uri(self.uri)}")
     
     def _mask_uri(self, uri: str) -> str:
         """Maskuj haslo w URI do wyswietlania"""
@@ -600,6 +919,9 @@ class MongoDBSource(BaseSource):
             from pymongo.mongo_client import MongoClient
             from pymongo.server_api import ServerApi
             
+            if self._parent is not None:
+                # Zawsze biezacy klient rodzica - takze po ponownym polaczeniu
+                return self._parent._get_client()
             if self._client is None:
                 # Sprawdz czy to Atlas (mongodb+srv)
                 if 'mongodb+srv' in self.uri or 'mongodb.net' in self.uri:
@@ -676,7 +998,7 @@ class MongoDBSource(BaseSource):
                 self.last_error = "Nie podano nazwy bazy danych (database)"
                 return []
             
-            if self.collection:
+            if self.collection or self.collection_patterns:
                 logs = self._collect_from_collection()
             else:
                 # Bez kolekcji - probuj z profiler lub wyswietl blad
@@ -699,15 +1021,565 @@ class MongoDBSource(BaseSource):
         self._last_id = None
         self._doc_hashes.clear()
         self._initial_load_done = False
+        self._close_stream()
+        self._close_profile_cursor()
+        self._profile_last_ts = None
+        self._profile_seen = set()
+        self._resume_token = None
+        self._watermark = None
+        with self._reconcile_lock:
+            self._ranges = []
+            self._recent_ids = {}
+            self._pending_deletes = []
+        self._token_loaded = True
+        self._watermark_loaded = True
+        self.save_state({})
         print(f"[MongoDB] Reset tracking dla {self.name}")
     
     def _collect_from_collection(self) -> List[ParsedLog]:
-        """Zbierz z kolekcji - wykrywa nowe dokumenty I zmiany w istniejacych"""
+        """Zbierz z kolekcji - change stream, a w razie braku wsparcia diff snapshotow"""
+        if self.mode in ('auto', 'change_stream') and self._change_streams_supported is not False:
+            logs = self._collect_from_change_stream()
+            if logs is not None:
+                return logs
+        if self.mode == 'change_stream':
+            return []
+        if self.collection_patterns:
+            return self._collect_from_children()
+        if self._incremental_enabled():
+            return self._collect_incremental()
+        return self._collect_by_diff()
+    
+    def _incremental_enabled(self) -> bool:
+        return self.mode == 'incremental' or (self.mode == 'auto' and bool(self.config.get('watermark_field')))
+    
+    # --- Metadane kolekcji / tryb bazy ---
+    
+    def _collection_names(self, db) -> List[str]:
+        """Lista kolekcji bazy (cache'owana przez metadata_ttl)"""
+        if self._parent is not None:
+            return self._parent._collection_names(db)
+        now = time.monotonic()
+        if (self._collection_names_cache is None or self._collection_names_at is None or
+                now - self._collection_names_at >= self.metadata_ttl):
+            self.round_trips += 1
+            self._collection_names_cache = db.list_collection_names()
+            self._collection_names_at = now
+        return self._collection_names_cache
+    
+    def _matching_collections(self, db) -> List[str]:
+        """Kolekcje pasujace do wzorcow trybu bazy (bez kolekcji systemowych)"""
+        return sorted(
+            name for name in self._collection_names(db)
+            if not name.startswith('system.') and
+            any(fnmatch.fnmatchcase(name, pattern) for pattern in self.collection_patterns)
+        )
+    
+    def _namespace_filter(self) -> List[Dict[str, Any]]:
+        """Pipeline $match dla change streamu calej bazy"""
+        if self.collection_patterns == ['*']:
+            return [{'$match': {'ns.coll': {'$not': {'$regex': '^system\\.'}}}}]
+        regex = '|'.join(
+            '^' + re.escape(pattern).replace('\\*', '.*').replace('\\?', '.') + '$'
+            for pattern in self.collection_patterns
+        )
+        return [{'$match': {'ns.coll': {'$regex': regex}}}]
+    
+    def _collect_from_children(self) -> List[ParsedLog]:
+        """Tryb bazy bez change streams - skan kazdej kolekcji na wspolnym kliencie"""
+        logs = []
+        client = self._get_client()
+        names = self._matching_collections(client[self.database])
+        
+        for name in set(self._children) - set(names):
+            # Kolekcja usunieta - wypada ze wspolnej rekoncyliacji
+            self._children.pop(name).enabled = False
+        
+        errors = []
+        self.backlog = False
+        for name in names:
+            child = self._children.get(name)
+            if child is None:
+                child = self._create_child(name)
+                self._children[name] = child
+            child.running = True
+            for log in child._collect_from_collection():
+                # Routing po przestrzeni nazw - zrodlo rodzica, kolekcja w table_name
+                log.source = self.name
+                log.table_name = name
+                logs.append(log)
+            self.round_trips += child.round_trips
+            child.round_trips = 0
+            self.backlog = self.backlog or child.backlog
+            if child.last_error:
+                errors.append(f"{name}: {child.last_error}")
+                child.last_error = None
+        
+        if errors:
+            self.last_error = '; '.join(errors)
+        return logs
+    
+    def _create_child(self, collection: str) -> 'MongoDBSource':
+        """Tracker pojedynczej kolekcji dzielacy klienta MongoDB z rodzicem"""
+        child_config = {k: v for k, v in self.config.items() if k != 'collections'}
+        child_config['collection'] = collection
+        child_config['mode'] = 'incremental' if self._incremental_enabled() else 'diff'
+        child = MongoDBSource(f"{self.name}.{collection}", child_config, parent=self)
+        child._change_streams_supported = False
+        return child
+    
+    # --- Skan przyrostowy (bez change streams) ---
+    
+    @staticmethod
+    def _id_key(value: Any) -> Any:
+        """Kompaktowy klucz _id do slownika widzianych dokumentow (12 bajtow dla ObjectId)"""
+        binary = getattr(value, 'binary', None)
+        return binary if isinstance(binary, bytes) else value
+    
+    @staticmethod
+    def _doc_position(collection: str, doc_id: Any, event_type: str, sequence: Any = None) -> str:
+        """Pozycja do deterministycznego _id: kolekcja, _id, typ zdarzenia i wartosc
+        rozrozniajaca kolejne zmiany (watermark, chwila wykrycia) - dokument
+        przywrocony do wczesniejszego stanu nie jest brany za duplikat"""
+        position = f"{collection}:{doc_id}:{event_type}"
+        return position if sequence is None else f"{position}:{sequence}"
+    
+    def _watermark_query(self) -> Dict[str, Any]:
+        """Zapytanie zakresowe po watermarku (wykorzystuje indeks {pole: 1, _id: 1})"""
+        if self._watermark is None:
+            return {}
+        value, last_id = self._watermark
+        if self.watermark_field == '_id':
+            return {'_id': {'$gt': value}}
+        # Keyset po (pole, _id) - dokumenty z ta sama wartoscia pola nie gina
+        return {'$or': [
+            {self.watermark_field: {'$gt': value}},
+            {self.watermark_field: value, '_id': {'$gt': last_id}},
+        ]}
+    
+    def _load_watermark(self) -> bool:
+        """Wczytaj watermark ze stanu. False = pierwsze uruchomienie."""
+        from bson import json_util
+        
+        self._watermark_loaded = True
+        saved = self.load_state().get('watermark')
+        if saved:
+            value, last_id = json_util.loads(saved)
+            self._watermark = (value, last_id)
+            return True
+        return False
+    
+    def _save_watermark(self):
+        from bson import json_util
+        
+        if self._watermark is not None:
+            self.save_state({'watermark': json_util.dumps(list(self._watermark))})
+    
+    def _collect_incremental(self) -> List[ParsedLog]:
+        """Zbierz nowe/zmienione dokumenty zapytaniem zakresowym po watermarku"""
         logs = []
         
         try:
+            coll = self._get_client()[self.database][self.collection]
+            
+            if not self._watermark_loaded and not self._load_watermark():
+                logs.extend(self._initial_load())
+                # Start od biezacego konca kolekcji
+                sort = [(self.watermark_field, -1), ('_id', -1)]
+                last = next(iter(coll.find({}, {self.watermark_field: 1}).sort(sort).limit(1)), None)
+                if last is not None:
+                    self._watermark = (last.get(self.watermark_field), last['_id'])
+                self._save_watermark()
+            
+            self._start_reconciliation()
+            
+            sort = [(self.watermark_field, 1), ('_id', 1)]
+            self.backlog = False
+            for _ in range(max(1, self.max_batches)):
+                cursor = (coll.find(self._watermark_query())
+                          .sort(sort).limit(self.batch_size).batch_size(self.batch_size))
+                fetched = 0
+                for doc in cursor:
+                    fetched += 1
+                    self._watermark = (doc.get(self.watermark_field), doc['_id'])
+                    with self._reconcile_lock:
+                        known = self._is_known(doc['_id'])
+                        self._recent_ids[self._id_key(doc['_id'])] = doc['_id']
+                    # Przy watermarku _id kazdy nowy dokument to INSERT
+                    event_type = 'UPDATE' if known and self.watermark_field != '_id' else 'INSERT'
+                    log = self._doc_to_log(doc, event_type)
+                    log.table_name = self.collection
+                    log.position = self._doc_position(self.collection, doc['_id'], event_type,
+                                                      doc.get(self.watermark_field))
+                    logs.append(log)
+                if fetched < self.batch_size:
+                    break
+            else:
+                self.backlog = True
+            
+            self._save_watermark()
+            
+            with self._reconcile_lock:
+                deleted, self._pending_deletes = self._pending_deletes, []
+            for doc_id in deleted:
+                logs.append(self._deleted_log(doc_id))
+        
+        except Exception as e:
+            self.last_error = str(e)
+            print(f"[MongoDB ERROR] {e}")
+        
+        return logs
+    
+    def _deleted_log(self, doc_id: Any) -> ParsedLog:
+        if isinstance(doc_id, bytes) and len(doc_id) == 12:
             from bson import ObjectId
-            from bson.json_util import dumps as bson_dumps
+            doc_id = ObjectId(doc_id)
+        return ParsedLog(
+            timestamp=datetime.now().isoformat(),
+            source=self.name,
+            event_type='DELETE',
+            severity='WARN',
+            message=f'Usuniety dokument: {doc_id}',
+            raw=f'{{"_id": "{doc_id}", "action": "deleted"}}',
+            table_name=self.collection
+        )
+    
+    def _is_known(self, doc_id: Any) -> bool:
+        """Dokument widziany wczesniej - skanem albo w zakresach rekoncyliacji.
+        Zakresy pokrywaja wszystko do ostatniej granicy, wiec wystarczy porownanie."""
+        if self._id_key(doc_id) in self._recent_ids:
+            return True
+        if not self._ranges:
+            return False
+        try:
+            return doc_id <= self._ranges[-1][0]
+        except TypeError:
+            return False
+    
+    def _start_reconciliation(self):
+        """Uruchom (raz) wspolny watek rekoncyliacji - jeden na rodzica i jego kolekcje"""
+        owner = self._parent or self
+        if owner.reconcile_interval <= 0:
+            return
+        if owner._reconcile_thread is not None and owner._reconcile_thread.is_alive():
+            return
+        owner._reconcile_thread = threading.Thread(
+            target=owner._reconcile_loop, name=f"reconcile-{owner.name}", daemon=True)
+        owner._reconcile_thread.start()
+    
+    def close(self):
+        """Zatrzymaj watek rekoncyliacji, zamknij strumien, kursor profilera,
+        trackery kolekcji i klienta (dzieci dziela klienta rodzica)"""
+        super().close()
+        self._reconcile_stop.set()
+        self._close_stream()
+        self._close_profile_cursor()
+        for child in list(self._children.values()):
+            child.close()
+        self._children.clear()
+        thread = self._reconcile_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        if self._parent is None and self._client is not None:
+            try:
+                self._client.close()
+            except Exception:
+                pass
+            self._client = None
+    
+    def _reconcile_loop(self):
+        while self.enabled and not self._reconcile_stop.is_set():
+            # Tryb bazy - kolejno kazda sledzona kolekcja, w przeciwnym razie wlasna
+            targets = list(self._children.values()) if self.collection_patterns else [self]
+            for source in targets:
+                if not (self.running and self.enabled and source.enabled):
+                    continue
+                try:
+                    source._reconcile_once()
+                except Exception as e:
+                    print(f"[MongoDB] Blad rekoncyliacji {source.name}: {e}")
+            # Przerywane przez close()
+            self._reconcile_stop.wait(self.reconcile_interval)
+    
+    @staticmethod
+    def _range_query(low: Any, high: Any) -> Dict[str, Any]:
+        bounds = {'$lte': high} if low is None else {'$gt': low, '$lte': high}
+        return {'_id': bounds}
+    
+    def _reconcile_once(self):
+        """Porownaj kolekcje z zakresami _id z poprzedniego przebiegu.
+        
+        Zakres z niezmieniona liczba dokumentow (count_documents po indeksie _id)
+        jest pomijany; _id listowane sa tylko dla zakresow ktore sie roznia i dla
+        nowego ogona kolekcji - w pamieci jest najwyzej jeden zakres naraz, a
+        znane _id trzymane sa w zwartym BSON zamiast zbiorow obiektow.
+        Wstawienie w srodek zakresu rownowazace usuniecie nie jest wykrywane
+        (przy rosnacych _id, np. ObjectId, nowe dokumenty trafiaja do ogona).
+        """
+        from bson import decode, encode
+        
+        coll = self._get_client()[self.database][self.collection]
+        with self._reconcile_lock:
+            ranges = list(self._ranges)
+            recent = dict(self._recent_ids)
+        
+        deleted: Dict[Any, Any] = {}
+        rebuilt: List[list] = []
+        low = None
+        for high, count, packed in ranges:
+            if not self.enabled:
+                return  # zrodlo zamkniete w trakcie przebiegu
+            query = self._range_query(low, high)
+            if coll.count_documents(query) == count:
+                rebuilt.append([high, count, packed])
+            else:
+                ids = [doc['_id'] for doc in coll.find(query, {'_id': 1}).sort([('_id', 1)])]
+                present = {self._id_key(doc_id) for doc_id in ids}
+                for doc_id in decode(packed)['ids']:
+                    if self._id_key(doc_id) not in present:
+                        deleted[self._id_key(doc_id)] = doc_id
+                for i in range(0, len(ids), self.reconcile_batch):
+                    part = ids[i:i + self.reconcile_batch]
+                    rebuilt.append([part[-1], len(part), encode({'ids': part})])
+            low = high
+            # Niski priorytet - oddaj czas serwerowi i innym zrodlom
+            if self.reconcile_pause:
+                time.sleep(self.reconcile_pause)
+        
+        # Ogon - dokumenty powyzej ostatniej granicy, porcjami po reconcile_batch
+        while True:
+            query = {} if low is None else {'_id': {'$gt': low}}
+            ids = [doc['_id'] for doc in
+                   coll.find(query, {'_id': 1}).sort([('_id', 1)]).limit(self.reconcile_batch)]
+            if not ids:
+                break
+            rebuilt.append([ids[-1], len(ids), encode({'ids': ids})])
+            low = ids[-1]
+            if len(ids) < self.reconcile_batch:
+                break
+            if self.reconcile_pause:
+                time.sleep(self.reconcile_pause)
+        
+        # Widziane skanem od ostatniego przebiegu - moga zniknac zanim trafia do zakresu
+        recent_ids = list(recent.values())
+        for i in range(0, len(recent_ids), self.reconcile_batch):
+            part = recent_ids[i:i + self.reconcile_batch]
+            found = {self._id_key(doc['_id'])
+                     for doc in coll.find({'_id': {'$in': part}}, {'_id': 1})}
+            for doc_id in part:
+                if self._id_key(doc_id) not in found:
+                    deleted[self._id_key(doc_id)] = doc_id
+        
+        with self._reconcile_lock:
+            self._ranges = rebuilt
+            for key in recent:
+                self._recent_ids.pop(key, None)
+            self._pending_deletes.extend(deleted.values())
+        if deleted:
+            print(f"[MongoDB] Rekoncyliacja {self.name}: {len(deleted)} usunietych dokumentow")
+    
+    # --- Change stream ---
+    
+    # Kody bledow gdy serwer nie obsluguje change streams (standalone, stary serwer)
+    _CHANGE_STREAM_UNSUPPORTED = (40573, 40324, 20, 115)
+    # Resume token wygasl z oplogu lub strumien nie moze byc wznowiony
+    _CHANGE_STREAM_LOST = (286, 280, 260)
+    
+    _CHANGE_EVENT_TYPES = {
+        'insert': ('INSERT', 'INFO'),
+        'update': ('UPDATE', 'INFO'),
+        'replace': ('UPDATE', 'INFO'),
+        'delete': ('DELETE', 'WARN'),
+        'drop': ('DROP', 'ERROR'),
+        'rename': ('DROP', 'WARN'),
+        'dropDatabase': ('DROP', 'ERROR'),
+    }
+    
+    def _close_stream(self):
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+        self._stream = None
+    
+    def _open_change_stream(self):
+        """Otworz change stream, wznawiajac od zapisanego resume tokena"""
+        from bson import json_util
+        
+        if not self._token_loaded:
+            token = self.load_state().get('resume_token')
+            self._resume_token = json_util.loads(token) if token else None
+            self._token_loaded = True
+        
+        db = self._get_client()[self.database]
+        kwargs = {'full_document': 'updateLookup', 'max_await_time_ms': self.max_await_ms}
+        if self._resume_token:
+            kwargs['resume_after'] = self._resume_token
+        if self.collection_patterns:
+            # Jeden strumien dla calej bazy, filtrowany po ns.coll
+            self._stream = db.watch(pipeline=self._namespace_filter(), **kwargs)
+            target = f"{self.database}.[{', '.join(self.collection_patterns)}]"
+        else:
+            self._stream = db[self.collection].watch(**kwargs)
+            target = f"{self.database}.{self.collection}"
+        self._change_streams_supported = True
+        print(f"[MongoDB] Change stream otwarty dla {target}"
+              f"{' (wznowiony)' if self._resume_token else ''}")
+    
+    def _persist_resume_token(self):
+        from bson import json_util
+        
+        token = self._stream.resume_token if self._stream is not None else None
+        if token and token != self._resume_token:
+            self._resume_token = token
+            self.save_state({'resume_token': json_util.dumps(token)})
+    
+    def _collect_from_change_stream(self) -> Optional[List[ParsedLog]]:
+        """Zbierz zdarzenia z change streamu. None = change streams niedostepne."""
+        from pymongo.errors import OperationFailure, PyMongoError
+        
+        logs = []
+        try:
+            first_run = self._stream is None and not self._token_loaded and not self._initial_load_done
+            if self._stream is None:
+                self._open_change_stream()
+                # Bez zapisanego tokena zachowaj dotychczasowe INITIAL_LOAD
+                if first_run and self._resume_token is None:
+                    logs.extend(self._initial_load())
+            
+            while len(logs) < self.stream_batch:
+                change = self._stream.try_next()
+                if change is None:
+                    break
+                log = self._change_to_log(change)
+                if log:
+                    logs.append(log)
+                if change.get('operationType') == 'invalidate':
+                    # Kolekcja usunieta/przemianowana - nowy strumien od teraz
+                    self._close_stream()
+                    self._resume_token = None
+                    self.save_state({})
+                    return logs
+            
+            self.backlog = len(logs) >= self.stream_batch
+            self._persist_resume_token()
+            return logs
+        
+        except OperationFailure as e:
+            self._close_stream()
+            if e.code in self._CHANGE_STREAM_UNSUPPORTED:
+                self._change_streams_supported = False
+                if self.mode == 'change_stream':
+                    self.last_error = f"Change streams niedostepne (wymagany replica set): {e}"
+                    return []
+                print(f"[MongoDB] Change streams niedostepne - tryb diff dla {self.name}")
+                return None
+            if e.code in self._CHANGE_STREAM_LOST:
+                # Token spoza oplogu - zacznij od biezacej chwili
+                print(f"[MongoDB] Resume token nieaktualny - nowy strumien dla {self.name}")
+                self._resume_token = None
+                self.save_state({})
+            self.last_error = str(e)
+            return logs
+        except PyMongoError as e:
+            # Blad sieci - strumien zostanie otwarty ponownie od ostatniego tokena
+            self._close_stream()
+            self.last_error = str(e)
+            print(f"[MongoDB ERROR] {e}")
+            return logs
+    
+    def _initial_load(self) -> List[ParsedLog]:
+        """Zaloguj istniejace dokumenty przy pierwszym uruchomieniu"""
+        db = self._get_client()[self.database]
+        names = self._matching_collections(db) if self.collection_patterns else [self.collection]
+        logs = []
+        for name in names:
+            for doc in db[name].find({}).limit(1000):
+                log = self._doc_to_log(doc, 'INITIAL_LOAD')
+                log.table_name = name
+                log.position = self._doc_position(name, doc.get('_id'), 'INITIAL_LOAD')
+                logs.append(log)
+        print(f"[MongoDB] Pierwsze uruchomienie - pobieram {len(logs)} dokumentow")
+        self._initial_load_done = True
+        return logs
+    
+    def _change_to_log(self, change: Dict[str, Any]) -> Optional[ParsedLog]:
+        """Konwertuj zdarzenie change streamu na ParsedLog"""
+        op = change.get('operationType')
+        if op not in self._CHANGE_EVENT_TYPES:
+            return None
+        event_type, severity = self._CHANGE_EVENT_TYPES[op]
+        
+        event_time = change.get('wallTime')
+        if event_time is None and change.get('clusterTime') is not None:
+            event_time = change['clusterTime'].as_datetime()
+        timestamp = event_time.isoformat() if isinstance(event_time, datetime) else datetime.now().isoformat()
+        
+        ns = change.get('ns', {})
+        doc_id = str(change.get('documentKey', {}).get('_id', ''))
+        doc = change.get('fullDocument')
+        
+        if doc is not None:
+            log = self._doc_to_log(doc, event_type)
+        elif op == 'delete' or op == 'update':
+            # Dokument juz nie istnieje (usuniety lub zmieniony i usuniety przed lookup)
+            log = ParsedLog(
+                timestamp=timestamp,
+                source=self.name,
+                event_type=event_type,
+                severity=severity,
+                message=f"{'Usuniety' if op == 'delete' else 'Zmieniony'} dokument: {doc_id}",
+                raw=f'{{"_id": "{doc_id}", "action": "{op}"}}'
+            )
+        else:
+            log = ParsedLog(
+                timestamp=timestamp,
+                source=self.name,
+                event_type=event_type,
+                severity=severity,
+                message=f"{op} na {ns.get('db', '')}.{ns.get('coll', '')}",
+                raw=str(change)
+            )
+        log.timestamp = timestamp
+        log.table_name = ns.get('coll') or self.collection
+        # Resume token jednoznacznie wskazuje zdarzenie w strumieniu
+        token = change.get('_id')
+        if isinstance(token, dict) and token.get('_data'):
+            log.position = str(token['_data'])
+        return log
+    
+    # --- Snapshot diff (fallback) ---
+    
+    @staticmethod
+    def _raw_id_element(raw_doc) -> bytes:
+        """Element BSON '_id' (typ + nazwa + wartosc) odczytany wprost z surowych bajtow"""
+        raw = raw_doc.raw
+        # MongoDB zapisuje _id jako pierwsze pole dokumentu
+        if raw[5:9] == b'_id\x00':
+            bson_type = raw[4]
+            size = {0x07: 12, 0x10: 4, 0x12: 8, 0x01: 8}.get(bson_type)
+            if size is None and bson_type == 0x02:
+                size = 4 + int.from_bytes(raw[9:13], 'little')
+            if size is not None:
+                return bytes(raw[4:9 + size])
+        # Nietypowe _id - zakoduj sam element
+        import bson
+        return bson.encode({'_id': raw_doc['_id']})[4:-1]
+    
+    @staticmethod
+    def _id_from_element(element: bytes) -> Any:
+        import bson
+        return bson.decode((len(element) + 5).to_bytes(4, 'little') + element + b'\x00')['_id']
+    
+    def _collect_by_diff(self) -> List[ParsedLog]:
+        """Zbierz z kolekcji - wykrywa nowe dokumenty I zmiany w istniejacych"""
+        logs = []
+        
+        try:
+            import bson
+            from bson.codec_options import CodecOptions
+            from bson.raw_bson import RawBSONDocument
             
             client = self._get_client()
             
@@ -721,60 +1593,60 @@ class MongoDBSource(BaseSource):
             
             db = client[self.database]
             
-            # Sprawdz czy kolekcja istnieje
-            if self.collection not in db.list_collection_names():
+            # Sprawdz czy kolekcja istnieje (lista kolekcji z cache)
+            if self.collection not in self._collection_names(db):
                 self.last_error = f"Kolekcja '{self.collection}' nie istnieje w bazie '{self.database}'"
                 return []
             
-            coll = db[self.collection]
+            # Surowe dokumenty BSON - bez budowania slownikow dla niezmienionych
+            coll = db[self.collection].with_options(
+                codec_options=CodecOptions(document_class=RawBSONDocument))
             
-            # Pobierz wszystkie dokumenty (limit 1000)
-            cursor = coll.find({}).limit(1000)
+            cursor = coll.find({}).limit(self.diff_limit)
             
+            # element _id -> (surowy dokument, 64-bitowy hash bajtow)
             current_docs = {}
-            for doc in cursor:
-                doc_id = str(doc['_id'])
-                # Utworz hash dokumentu (bez _id)
-                doc_copy = dict(doc)
-                del doc_copy['_id']
-                doc_hash = hashlib.md5(bson_dumps(doc_copy).encode()).hexdigest()
-                current_docs[doc_id] = (doc, doc_hash)
+            for raw_doc in cursor:
+                current_docs[self._raw_id_element(raw_doc)] = (raw_doc, _fast_hash(raw_doc.raw))
             
             # Pierwsze uruchomienie - zaloguj wszystkie dokumenty
             if not self._initial_load_done:
                 print(f"[MongoDB] Pierwsze uruchomienie - pobieram {len(current_docs)} dokumentow")
-                for doc_id, (doc, doc_hash) in current_docs.items():
-                    self._doc_hashes[doc_id] = doc_hash
-                    logs.append(self._doc_to_log(doc, 'INITIAL_LOAD'))
+                for doc_key, (raw_doc, doc_hash) in current_docs.items():
+                    self._doc_hashes[doc_key] = doc_hash
+                    doc = bson.decode(raw_doc.raw)
+                    log = self._doc_to_log(doc, 'INITIAL_LOAD')
+                    log.position = self._doc_position(self.collection, doc.get('_id'), 'INITIAL_LOAD')
+                    logs.append(log)
                 self._initial_load_done = True
                 return logs
             
-            # Sprawdz nowe i zmienione dokumenty
-            for doc_id, (doc, doc_hash) in current_docs.items():
-                if doc_id not in self._doc_hashes:
+            # Sprawdz nowe i zmienione dokumenty - dekodowanie tylko przy zmianie
+            for doc_key, (raw_doc, doc_hash) in current_docs.items():
+                previous = self._doc_hashes.get(doc_key)
+                if previous == doc_hash:
+                    continue
+                doc = bson.decode(raw_doc.raw)
+                if previous is None:
                     # Nowy dokument
-                    print(f"[MongoDB] Nowy dokument: {doc_id}")
-                    logs.append(self._doc_to_log(doc, 'INSERT'))
-                    self._doc_hashes[doc_id] = doc_hash
-                elif self._doc_hashes[doc_id] != doc_hash:
+                    print(f"[MongoDB] Nowy dokument: {doc['_id']}")
+                    log = self._doc_to_log(doc, 'INSERT')
+                else:
                     # Zmieniony dokument
-                    print(f"[MongoDB] Zmieniony dokument: {doc_id}")
-                    logs.append(self._doc_to_log(doc, 'UPDATE'))
-                    self._doc_hashes[doc_id] = doc_hash
+                    print(f"[MongoDB] Zmieniony dokument: {doc['_id']}")
+                    log = self._doc_to_log(doc, 'UPDATE')
+                # Chwila wykrycia jako sekwencja zmian - powrot do starego stanu to nowe zdarzenie
+                log.position = self._doc_position(self.collection, doc['_id'], log.event_type, log.timestamp)
+                logs.append(log)
+                self._doc_hashes[doc_key] = doc_hash
             
             # Sprawdz usuniete dokumenty
-            deleted_ids = set(self._doc_hashes.keys()) - set(current_docs.keys())
-            for doc_id in deleted_ids:
+            deleted_keys = self._doc_hashes.keys() - current_docs.keys()
+            for doc_key in deleted_keys:
+                doc_id = self._id_from_element(doc_key)
                 print(f"[MongoDB] Usuniety dokument: {doc_id}")
-                logs.append(ParsedLog(
-                    timestamp=datetime.now().isoformat(),
-                    source=self.name,
-                    event_type='DELETE',
-                    severity='WARN',
-                    message=f'Usuniety dokument: {doc_id}',
-                    raw=f'{{"_id": "{doc_id}", "action": "deleted"}}'
-                ))
-                del self._doc_hashes[doc_id]
+                logs.append(self._deleted_log(doc_id))
+                del self._doc_hashes[doc_key]
             
         except Exception as e:
             self.last_error = str(e)
@@ -820,8 +1692,61 @@ class MongoDBSource(BaseSource):
             raw=raw
         )
     
+    # Pola system.profile potrzebne do zbudowania logu
+    _PROFILE_PROJECTION = {
+        'op': 1, 'ns': 1, 'ts': 1, 'millis': 1, 'docsExamined': 1,
+        'nreturned': 1, 'user': 1, 'command': 1, 'planSummary': 1,
+    }
+    
+    _PROFILE_EVENT_TYPES = {
+        'query': 'SELECT',
+        'insert': 'INSERT',
+        'update': 'UPDATE',
+        'remove': 'DELETE',
+    }
+    
+    def _close_profile_cursor(self):
+        if self._profile_cursor is not None:
+            try:
+                self._profile_cursor.close()
+            except Exception:
+                pass
+        self._profile_cursor = None
+    
+    def _profiling_enabled(self, db) -> bool:
+        """Sprawdz poziom profilowania (wynik cache'owany przez profile_check_interval)"""
+        now = time.monotonic()
+        if (self._profile_checked_at is not None and
+                now - self._profile_checked_at < self.profile_check_interval):
+            return True
+        try:
+            self.round_trips += 1
+            profile = db.command('profile', -1)
+        except Exception:
+            self.last_error = "Nie mozna sprawdzic profiling level"
+            return False
+        if profile.get('was', 0) == 0:
+            self._profile_checked_at = None
+            self.last_error = "Profiling jest wylaczony. Uruchom w MongoDB: db.setProfilingLevel(2)"
+            return False
+        self._profile_checked_at = now
+        return True
+    
+    def _open_profile_cursor(self, db):
+        """Tailable-await cursor na system.profile (kolekcja capped, kolejnosc naturalna = ts)"""
+        from pymongo import CursorType
+        
+        # $gte - wpisy z tej samej milisekundy co ostatni nie gina; juz zebrane
+        # odrzuca _profile_seen_before
+        query = {'ts': {'$gte': self._profile_last_ts}} if self._profile_last_ts else {}
+        self.round_trips += 1
+        self._profile_cursor = db['system.profile'].find(
+            query, self._PROFILE_PROJECTION,
+            cursor_type=CursorType.TAILABLE_AWAIT
+        ).max_await_time_ms(self.max_await_ms)
+    
     def _collect_from_profiler(self) -> List[ParsedLog]:
-        """Zbierz z system.profile"""
+        """Zbierz z system.profile (tailable cursor z watermarkiem ts)"""
         logs = []
         
         try:
@@ -833,59 +1758,76 @@ class MongoDBSource(BaseSource):
             
             db = client[self.database]
             
-            # Sprawdz czy profiling jest wlaczony
-            try:
-                profile = db.command('profile', -1)
-                if profile.get('was', 0) == 0:
-                    self.last_error = "Profiling jest wylaczony. Uruchom w MongoDB: db.setProfilingLevel(2)"
-                    return []
-            except Exception:
-                self.last_error = "Nie mozna sprawdzic profiling level"
+            if not self._profiling_enabled(db):
+                self._close_profile_cursor()
                 return []
             
-            coll = db['system.profile']
-            
-            query = {}
-            if self._last_id:
-                from bson import ObjectId
-                try:
-                    query['_id'] = {'$gt': ObjectId(self._last_id)}
-                except Exception:
-                    pass
+            if self._profile_cursor is None or not self._profile_cursor.alive:
+                self._open_profile_cursor(db)
             
-            cursor = coll.find(query).sort('ts', 1).limit(1000)
+            # Iteracja konczy sie gdy brak nowych wpisow (po max_await_ms),
+            # kursor pozostaje otwarty na nastepny cykl
+            for doc in self._profile_cursor:
+                if self._profile_seen_before(doc):
+                    continue
+                # Numer wpisu w obrebie tej samej milisekundy ts
+                logs.append(self._profile_doc_to_log(doc, len(self._profile_seen) - 1))
+                if len(logs) >= self.stream_batch:
+                    break
+            self.backlog = len(logs) >= self.stream_batch
             
-            for doc in cursor:
-                if '_id' in doc:
-                    self._last_id = str(doc['_id'])
-                
-                op = doc.get('op', 'unknown')
-                ns = doc.get('ns', '')
-                
-                event_type = op.upper()
-                if op == 'query':
-                    event_type = 'SELECT'
-                elif op == 'insert':
-                    event_type = 'INSERT'
-                elif op == 'update':
-                    event_type = 'UPDATE'
-                elif op == 'remove':
-                    event_type = 'DELETE'
-                
-                ts = doc.get('ts', datetime.now())
-                timestamp = ts.isoformat() if isinstance(ts, datetime) else str(ts)
-                
-                parsed = ParsedLog(
-                    timestamp=timestamp,
-                    source=self.name,
-                    event_type=event_type,
-                    severity='INFO',
-                    message=f"{op} on {ns}",
-                    raw=str(doc)
-                )
-                logs.append(parsed)
+            if not self._profile_cursor.alive:
+                # Pusta kolekcja capped lub kursor wygasl - otworz ponownie od ts
+                self._close_profile_cursor()
             
         except Exception as e:
+            self._close_profile_cursor()
             self.last_error = str(e)
         
         return logs
+    
+    def _profile_seen_before(self, doc: Dict[str, Any]) -> bool:
+        """Wpis juz zebrany - po ponownym otwarciu od ts ($gte) wraca ostatnia milisekunda"""
+        ts = doc.get('ts')
+        if not isinstance(ts, datetime):
+            return False
+        digest = _fast_hash(str(doc).encode('utf-8', 'replace'))
+        if ts != self._profile_last_ts:
+            self._profile_seen = set()
+        elif digest in self._profile_seen:
+            return True
+        self._profile_seen.add(digest)
+        return False
+    
+    def _profile_doc_to_log(self, doc: Dict[str, Any], sequence: int = 0) -> ParsedLog:
+        """Konwertuj wpis system.profile na ParsedLog z metrykami zapytania"""
+        op = doc.get('op', 'unknown')
+        ns = doc.get('ns', '')
+        event_type = self._PROFILE_EVENT_TYPES.get(op, op.upper())
+        
+        ts = doc.get('ts')
+        if isinstance(ts, datetime):
+            self._profile_last_ts = ts
+            timestamp = ts.isoformat()
+        else:
+            timestamp = datetime.now().isoformat()
+        
+        millis = doc.get('millis')
+        message = f"{op} on {ns}"
+        if millis is not None:
+            message += f" ({millis} ms)"
+        
+        return ParsedLog(
+            timestamp=timestamp,
+            source=self.name,
+            event_type=event_type,
+            severity='INFO',
+            message=message,
+            raw=str(doc),
+            position=f"profile:{timestamp}:{sequence}",
+            table_name=ns.split('.', 1)[1] if '.' in ns else None,
+            user=doc.get('user'),
+            duration_ms=millis,
+            docs_examined=doc.get('docsExamined'),
+            docs_returned=doc.get('nreturned')
+        )
@@ -0,0 +1,313 @@
+"""
+Spool - Bufor dyskowy na czas niedostepnosci Elasticsearch
+Partie, ktorych nie udalo sie zapisac, trafiaja do plikow segmentow
+(append-only, kazdy rekord z CRC32). Po powrocie ES writer odtwarza je w
+kolejnosci zapisu; pozycja odczytu jest zapisywana na dysku, wiec restart
+procesu nie gubi ani nie duplikuje calych segmentow.
+
+Format rekordu: <dlugosc:uint32><crc32:uint32><partia JSON>
+
+DeadLetterStore trzyma dokumenty, ktorych ES nie przyjmie nigdy (np. blad
+mapowania) - ponawianie ich nie ma sensu, wiec nie trafiaja do spoola.
+"""
+
+import json
+import os
+import re
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+
+HEADER = struct.Struct('<II')
+SEGMENT_PATTERN = re.compile(r'^(\d{8})\.seg$')
+FSYNC_POLICIES = ('always', 'interval', 'never')
+
+
+class DiskSpool:
+    """Segmentowany spool partii dokumentow z limitem rozmiaru"""
+
+    def __init__(
+            self,
+            directory: str,
+            segment_bytes: int = 16 * 1024 * 1024,
+            max_bytes: int = 512 * 1024 * 1024,
+            fsync: str = 'interval',
+            fsync_interval: float = 1.0
+    ):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"Nieznana polityka fsync: {fsync} (dozwolone: {', '.join(FSYNC_POLICIES)})")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync = fsync
+        self.fsync_interval = fsync_interval
+
+        self._lock = threading.Lock()
+        self._segments: List[int] = []
+        self._active = None          # uchwyt do dopisywania
+        self._last_fsync = 0.0
+        self._pending: Optional[Tuple[int, int, int]] = None  # (segment, offset, dlugosc) po peek()
+
+        # Metryki
+        self.records_written = 0
+        self.docs_written = 0
+        self.records_replayed = 0
+        self.docs_replayed = 0
+        self.corrupt_records = 0
+        self.dropped_segments = 0
+        self.dropped_bytes = 0
+        self.rejected_docs = 0
+
+        os.makedirs(directory, exist_ok=True)
+        self._segments = sorted(
+            int(m.group(1)) for m in (SEGMENT_PATTERN.match(f) for f in os.listdir(directory)) if m
+        )
+        self._read_segment, self._read_offset = self._load_cursor()
+
+    # --- Sciezki i kursor ---
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:08d}.seg")
+
+    def _cursor_path(self) -> str:
+        return os.path.join(self.directory, 'cursor.json')
+
+    def _load_cursor(self) -> Tuple[int, int]:
+        try:
+            with open(self._cursor_path(), 'r', encoding='utf-8') as f:
+                cursor = json.load(f)
+            segment, offset = int(cursor['segment']), int(cursor['offset'])
+            if segment in self._segments:
+                return segment, offset
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"[SPOOL] Nie mozna wczytac kursora: {e}")
+        return (self._segments[0] if self._segments else 0), 0
+
+    def _save_cursor(self):
+        """Zapisz pozycje odczytu atomowo (plik tymczasowy + rename)"""
+        path = self._cursor_path()
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'segment': self._read_segment, 'offset': self._read_offset}, f)
+        os.replace(tmp_path, path)
+
+    def _size(self, segment: int) -> int:
+        try:
+            return os.path.getsize(self._segment_path(segment))
+        except FileNotFoundError:
+            return 0
+
+    # --- Zapis ---
+
+    def append(self, docs: List[Dict[str, Any]]) -> bool:
+        """Dopisz partie; False gdy nie miesci sie w limicie rozmiaru"""
+        payload = json.dumps(docs, default=str).encode('utf-8')
+        record = HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+        with self._lock:
+            if not self._make_room(len(record)):
+                self.rejected_docs += len(docs)
+                print(f"[SPOOL] Brak miejsca - odrzucono {len(docs)} logow")
+                return False
+
+            if self._active is None or self._active.tell() + len(record) > self.segment_bytes:
+                self._roll()
+            self._active.write(record)
+            self._active.flush()
+            now = time.monotonic()
+            if self.fsync == 'always' or (self.fsync == 'interval' and now - self._last_fsync >= self.fsync_interval):
+                os.fsync(self._active.fileno())
+                self._last_fsync = now
+
+            self.records_written += 1
+            self.docs_written += len(docs)
+        return True
+
+    def _roll(self):
+        """Zamknij aktywny segment i otworz nowy"""
+        if self._active is not None:
+            if self.fsync != 'never':
+                os.fsync(self._active.fileno())
+            self._active.close()
+        segment = (self._segments[-1] + 1) if self._segments else 1
+        self._segments.append(segment)
+        self._active = open(self._segment_path(segment), 'ab')
+        if len(self._segments) == 1:
+            self._read_segment, self._read_offset = segment, 0
+
+    def _make_room(self, size: int) -> bool:
+        """Usun najstarsze segmenty az nowy rekord zmiesci sie w max_bytes"""
+        while self._total_bytes() + size > self.max_bytes:
+            if len(self._segments) <= 1:
+                return False  # zostal tylko aktywny segment
+            oldest = self._segments[0]
+            dropped = self._size(oldest)
+            self._remove_segment(oldest)
+            self.dropped_segments += 1
+            self.dropped_bytes += dropped
+            print(f"[SPOOL] Limit {self.max_bytes} B - usunieto najstarszy segment ({dropped} B)")
+        return True
+
+    def _total_bytes(self) -> int:
+        return sum(self._size(segment) for segment in self._segments)
+
+    def _remove_segment(self, segment: int):
+        self._segments.remove(segment)
+        try:
+            os.remove(self._segment_path(segment))
+        except FileNotFoundError:
+            pass
+        if segment == self._read_segment:
+            self._read_segment = self._segments[0] if self._segments else 0
+            self._read_offset = 0
+            self._pending = None
+            self._save_cursor()
+
+    # --- Odczyt (replay) ---
+
+    def peek(self) -> Optional[List[Dict[str, Any]]]:
+        """Zwroc najstarsza nieodtworzona partie (bez przesuwania kursora)"""
+        with self._lock:
+            while self._segments:
+                if self._read_segment not in self._segments:
+                    self._read_segment, self._read_offset = self._segments[0], 0
+                segment = self._read_segment
+                docs, length = self._read_record(segment, self._read_offset)
+                if docs is not None:
+                    self._pending = (segment, self._read_offset, length)
+                    return docs
+                if length:
+                    continue  # uszkodzony rekord pominiety, czytaj dalej
+                if self._active is not None and segment == self._segments[-1]:
+                    return None  # aktywny segment przeczytany do konca
+                # Segment odtworzony w calosci - usun go
+                self._remove_segment(segment)
+            return None
+
+    def _read_record(self, segment: int, offset: int) -> Tuple[Optional[List[Dict[str, Any]]], int]:
+        """Przeczytaj rekord; (None, 0) na koncu segmentu, (None, n) gdy uszkodzony"""
+        try:
+            with open(self._segment_path(segment), 'rb') as f:
+                f.seek(offset)
+                header = f.read(HEADER.size)
+                if len(header) < HEADER.size:
+                    return None, 0
+                length, crc = HEADER.unpack(header)
+                payload = f.read(length)
+        except FileNotFoundError:
+            return None, 0
+
+        if len(payload) < length:
+            # Niedokonczony zapis (np. awaria w trakcie append) - koniec danych
+            if self._active is not None and segment == self._segments[-1]:
+                return None, 0
+            self.corrupt_records += 1
+            return None, 0
+        if zlib.crc32(payload) != crc:
+            self.corrupt_records += 1
+            print(f"[SPOOL] Uszkodzony rekord (CRC) w segmencie {segment} @ {offset} - pomijam")
+            self._read_offset = offset + HEADER.size + length
+            self._save_cursor()
+            return None, HEADER.size + length
+        return json.loads(payload), HEADER.size + length
+
+    def commit(self):
+        """Oznacz partie zwrocona przez peek() jako zapisana w ES"""
+        with self._lock:
+            if self._pending is None:
+                return
+            segment, offset, length = self._pending
+            self._pending = None
+            if segment != self._read_segment or offset != self._read_offset:
+                return  # segment usuniety w miedzyczasie (limit rozmiaru)
+            self._read_offset = offset + length
+            self.records_replayed += 1
+            self._save_cursor()
+
+    def record_replayed_docs(self, count: int):
+        self.docs_replayed += count
+
+    # --- Stan ---
+
+    @property
+    def has_pending(self) -> bool:
+        with self._lock:
+            if not self._segments:
+                return False
+            if len(self._segments) > 1:
+                return True
+            return self._size(self._segments[0]) > self._read_offset
+
+    def pending_bytes(self) -> int:
+        with self._lock:
+            return max(0, self._total_bytes() - (self._read_offset if self._read_segment in self._segments else 0))
+
+    def close(self):
+        with self._lock:
+            if self._active is not None:
+                if self.fsync != 'never':
+                    os.fsync(self._active.fileno())
+                self._active.close()
+                self._active = None
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "directory": self.directory,
+            "segments": len(self._segments),
+            "pending_bytes": self.pending_bytes(),
+            "records_written": self.records_written,
+            "docs_written": self.docs_written,
+            "records_replayed": self.records_replayed,
+            "docs_replayed": self.docs_replayed,
+            "corrupt_records": self.corrupt_records,
+            "dropped_segments": self.dropped_segments,
+            "dropped_bytes": self.dropped_bytes,
+            "rejected_docs": self.rejected_docs,
+            "fsync": self.fsync,
+        }
+
+
+class DeadLetterStore:
+    """Dokumenty trwale odrzucone przez ES (np. blad mapowania) - plik JSONL
+    z rotacja; nie sa ponawiane, sluza do diagnozy i recznego reimportu"""
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.count = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+
+    def add(self, doc: Dict[str, Any], status: Optional[int], error_type: str, reason: str):
+        entry = {
+            "failed_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "status": status,
+            "error_type": error_type,
+            "reason": reason,
+            "doc": doc,
+        }
+        line = json.dumps(entry, default=str) + '\n'
+        with self._lock:
+            try:
+                if os.path.getsize(self.path) + len(line) > self.max_bytes:
+                    os.replace(self.path, self.path + '.1')
+            except FileNotFoundError:
+                pass
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+            self.count += 1
+
+    def recent(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Ostatnie wpisy (najnowsze na koncu)"""
+        with self._lock:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    lines = f.readlines()[-limit:]
+            except FileNotFoundError:
+                return []
+        return [json.loads(line) for line in lines if line.strip()]
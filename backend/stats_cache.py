@@ -0,0 +1,193 @@
+"""
+Stats Cache - Statystyki ostatnich godzin liczone przy zbieraniu
+Etap buffer pipeline'u dopisuje kazdy log do kubelka swojej minuty
+(liczniki wg source, severity, event_type, source_type). Kubelki leza w
+pierscieniu o stalym rozmiarze, wiec pamiec nie rosnie z liczba logow.
+/api/stats odpowiada z cache dla okien, ktore cache w calosci pokrywa
+(od startu procesu, nie dluzej niz pierscien) - bez zapytania do ES.
+"""
+
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from elasticsearch_storage import parse_timestamp
+from es_query import auto_interval, auto_interval_minutes
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Pole w statystykach -> (pole loga, pole zastepcze, wartosc domyslna)
+DIMENSIONS = {
+    "by_source": ("source", None, "unknown"),
+    "by_severity": ("severity", "level", "INFO"),
+    "by_event_type": ("event_type", "operation", "OTHER"),
+    "by_source_type": ("source_type", None, None),
+}
+
+
+def _minute(dt: datetime) -> int:
+    """Minuta UTC od EPOCH (czas bez strefy - lokalny, jak z parse_timestamp)"""
+    if dt.tzinfo is None:
+        dt = dt.astimezone()
+    return int((dt - EPOCH).total_seconds() // 60)
+
+
+def _minute_label(minute: int) -> str:
+    """Jak key_as_string date_histogram w ES (kubelki w UTC)"""
+    return (EPOCH + timedelta(minutes=minute)).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+class _MinuteBucket:
+    __slots__ = ("minute", "total", "counts")
+
+    def __init__(self, minute: int):
+        self.minute = minute
+        self.total = 0
+        self.counts: Dict[str, Dict[str, int]] = {name: {} for name in DIMENSIONS}
+
+
+class StatsCache:
+    """Pierscien kubelkow minutowych z licznikami logow"""
+
+    def __init__(self, minutes: int = 1440, max_age: float = 1.0):
+        self.minutes = minutes
+        self.max_age = max_age
+        self._ring: List[Optional[_MinuteBucket]] = [None] * minutes
+        self._lock = threading.Lock()
+        self._version = 0  # zmienia sie przy kazdym add/clear
+        # hours -> (minuta konca okna, wersja, czas wyliczenia, wynik); wiele
+        # dashboardow odpytujacych naraz dostaje jeden wynik zamiast liczyc go osobno
+        self._memo: Dict[float, Tuple[int, int, float, Dict[str, Any]]] = {}
+        self.covered_since = _minute(datetime.now())  # wczesniejszych logow cache nie widzial
+
+        # Metryki
+        self.logs_added = 0
+        self.logs_skipped = 0
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, logs: List[Dict[str, Any]]):
+        """Dolicz logi (wywolywane przy zbieraniu)"""
+        now_minute = _minute(datetime.now())
+        oldest = now_minute - self.minutes + 1
+        with self._lock:
+            for log in logs:
+                event_time = parse_timestamp(log.get("timestamp"))
+                minute = _minute(event_time) if event_time else now_minute
+                if minute > now_minute:
+                    minute = now_minute  # zegar zrodla lekko do przodu
+                elif minute < oldest:
+                    self.logs_skipped += 1  # starsze niz pierscien - tylko w ES
+                    continue
+
+                slot = minute % self.minutes
+                bucket = self._ring[slot]
+                if bucket is None or bucket.minute != minute:
+                    bucket = self._ring[slot] = _MinuteBucket(minute)
+                bucket.total += 1
+                for name, (field, fallback, default) in DIMENSIONS.items():
+                    value = log.get(field) or (log.get(fallback) if fallback else None) or default
+                    if value is not None:
+                        counts = bucket.counts[name]
+                        counts[value] = counts.get(value, 0) + 1
+                self.logs_added += 1
+            self._version += 1
+
+    def clear(self):
+        with self._lock:
+            self._ring = [None] * self.minutes
+            # Po wyczyszczeniu cache znowu nie zna wczesniejszych minut
+            self.covered_since = _minute(datetime.now())
+            self._version += 1
+            self._memo.clear()
+
+    def covers(self, hours: float) -> bool:
+        """Czy okno ostatnich `hours` godzin jest w calosci w cache"""
+        if not hours or hours * 60 > self.minutes:
+            return False
+        start = _minute(datetime.now() - timedelta(hours=hours))
+        return start >= self.covered_since
+
+    def lookup(self, hours: float) -> Optional[Dict[str, Any]]:
+        """Statystyki z cache albo None, gdy okno wykracza poza cache"""
+        if not self.covers(hours):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self.stats(hours)
+
+    def stats(self, hours: float) -> Dict[str, Any]:
+        """Statystyki okna w formacie ElasticsearchStorage.get_stats.
+
+        Wynik jest wspoldzielony, dopoki nie przyszly nowe logi, a przy
+        ciaglym zbieraniu - najwyzej max_age sekund.
+        """
+        now = datetime.now()
+        end = _minute(now)
+        memo = self._memo.get(hours)
+        if memo is not None and memo[0] == end and (
+                memo[1] == self._version or time.monotonic() - memo[2] < self.max_age):
+            return memo[3]
+        version = self._version
+        start = max(_minute(now - timedelta(hours=hours)), end - self.minutes + 1)
+        interval = auto_interval(hours)
+        step = auto_interval_minutes(interval)
+
+        totals: Dict[str, Dict[str, int]] = {name: {} for name in DIMENSIONS}
+        first = start // step * step
+        slots = {first + i * step: [0, {}, {}] for i in range((end - first) // step + 1)}
+        total = 0
+        with self._lock:
+            for bucket in self._ring:
+                if bucket is None or not start <= bucket.minute <= end:
+                    continue
+                total += bucket.total
+                for name, counts in bucket.counts.items():
+                    merged = totals[name]
+                    for key, count in counts.items():
+                        merged[key] = merged.get(key, 0) + count
+                slot = slots[bucket.minute // step * step]
+                slot[0] += bucket.total
+                for target, name in ((slot[1], "by_severity"), (slot[2], "by_event_type")):
+                    for key, count in bucket.counts[name].items():
+                        target[key] = target.get(key, 0) + count
+
+        timeline, level_timeline, operation_timeline = [], [], []
+        for minute, (count, by_severity, by_event_type) in slots.items():
+            label = _minute_label(minute)
+            timeline.append({"timestamp": label, "count": count})
+            level_timeline.append({"timestamp": label, **by_severity})
+            operation_timeline.append({"timestamp": label, **by_event_type})
+
+        result = {
+            "total_logs": total,
+            "total": total,
+            "hours": hours,
+            "interval": interval,
+            "by_severity": totals["by_severity"],
+            "by_level": totals["by_severity"],
+            "by_source": totals["by_source"],
+            "by_source_type": totals["by_source_type"],
+            "by_event_type": totals["by_event_type"],
+            "by_operation": totals["by_event_type"],
+            "timeline": timeline,
+            "level_timeline": level_timeline,
+            "operation_timeline": operation_timeline,
+        }
+        self._memo[hours] = (end, version, time.monotonic(), result)
+        return result
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            buckets = sum(1 for bucket in self._ring if bucket is not None)
+        return {
+            "minutes": self.minutes,
+            "buckets": buckets,
+            "covered_since": _minute_label(self.covered_since),
+            "logs_added": self.logs_added,
+            "logs_skipped": self.logs_skipped,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -166,9 +166,15 @@ class TestSourcesEndpoint:
             "config": {"path": temp_log_file}
         })
         
+        import main
+        source = main.sources["to-delete"]
+
         # Usun zrodlo
         response = test_client.delete("/api/sources/to-delete")
         assert response.status_code == 200
+        # Zrodlo zamkniete, a nie tylko wypiete ze slownika
+        assert "to-delete" not in main.sources
+        assert not source.enabled and not source.running
 
 
 class TestFrontendLogsEndpoint:
@@ -0,0 +1,877 @@
+"""
+Testy warstwy Elasticsearch (elasticsearch_storage.py)
+Unit tests for per-item bulk retry, 413 splitting and the dead-letter store
+"""
+
+import pytest
+import sys
+import os
+import asyncio
+import fnmatch
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from elasticsearch import ApiError, ConnectionError as ESConnectionError
+from elastic_transport import ApiResponseMeta, HttpHeaders, NodeConfig
+
+from elasticsearch_storage import ElasticsearchStorage, document_id
+from sources import FileSource
+from es_writer import BulkWriter
+from spool import DiskSpool, DeadLetterStore
+
+
+def api_error(status):
+    meta = ApiResponseMeta(status=status, http_version='1.1', headers=HttpHeaders(), duration=0.0,
+                           node=NodeConfig('http', 'localhost', 9200))
+    return ApiError(f'status {status}', meta=meta, body={})
+
+
+class FakeIndices:
+    """indices.* z licznikiem zapytan"""
+
+    def __init__(self, existing=()):
+        self.existing = set(existing)
+        self.templates = {}
+        self.aliases = {}
+        self.calls = []
+
+    async def exists(self, index):
+        self.calls.append('exists')
+        return index in self.existing
+
+    async def create(self, index, body=None, aliases=None):
+        self.calls.append('create')
+        self.existing.add(index)
+        for alias in aliases or {}:
+            self.aliases[alias] = index
+
+    async def exists_alias(self, name):
+        self.calls.append('exists_alias')
+        return name in self.aliases
+
+    async def delete(self, index, **kwargs):
+        self.calls.append('delete')
+        removed = {name for name in self.existing if fnmatch.fnmatch(name, index)}
+        self.existing -= removed
+        self.aliases = {alias: name for alias, name in self.aliases.items() if name not in removed}
+
+    async def put_index_template(self, name, **body):
+        self.calls.append('put_index_template')
+        self.templates[name] = body
+
+    async def get_alias(self, index, **kwargs):
+        self.calls.append('get_alias')
+        return {name: {"aliases": {}} for name in self.existing}
+
+
+class FakeILM:
+    def __init__(self):
+        self.policies = {}
+
+    async def put_lifecycle(self, name, policy):
+        self.policies[name] = policy
+
+
+class FlakyBulkES:
+    """Fake AsyncElasticsearch: odrzuca losowy ulamek pozycji (429),
+    dokumenty z polem poison (400), zbyt duze zapytania (413); create
+    z istniejacym _id konczy sie 409"""
+
+    def __init__(self, reject_rate=0.0, max_items=None, seed=1, down=False):
+        self.indices = FakeIndices()
+        self.ilm = FakeILM()
+        self.rng = random.Random(seed)
+        self.reject_rate = reject_rate
+        self.max_items = max_items
+        self.down = down
+        self.stored = []
+        self.ids = {}
+        self.routed = {}
+        self.searches = []
+        self.bodies = []
+        self.hits = []
+        self.requests = 0
+
+    async def bulk(self, operations):
+        self.requests += 1
+        actions = [action["create"] for action in operations[0::2]]
+        self.indices.existing.update(action["_index"] for action in actions)
+        if self.down:
+            raise ESConnectionError("refused")
+        docs = operations[1::2]
+        for action, doc in zip(actions, docs):
+            self.routed[doc.get('seq', action["_id"])] = action["_index"]
+        if self.max_items and len(docs) > self.max_items:
+            raise api_error(413)
+        items = []
+        for action, doc in zip(actions, docs):
+            if doc.get('poison'):
+                items.append({"create": {"status": 400, "error": {
+                    "type": "mapper_parsing_exception", "reason": "failed to parse field [poison]"}}})
+            elif self.rng.random() < self.reject_rate:
+                items.append({"create": {"status": 429, "error": {
+                    "type": "es_rejected_execution_exception", "reason": "queue full"}}})
+            elif action["_id"] in self.ids:
+                items.append({"create": {"status": 409, "error": {
+                    "type": "version_conflict_engine_exception", "reason": "document already exists"}}})
+            else:
+                self.ids[action["_id"]] = doc
+                self.stored.append(doc.get('seq', action["_id"]))
+                items.append({"create": {"status": 201}})
+        return {"errors": any(i["create"]["status"] >= 300 for i in items), "items": items}
+
+    async def create(self, index, id, document):
+        if id in self.ids:
+            raise api_error(409)
+        self.ids[id] = document
+
+    async def search(self, index, body, **kwargs):
+        self.searches.append(index)
+        self.bodies.append(body)
+        return {"hits": {"hits": self.hits}}
+
+
+def make_storage(es, tmp_path, **kwargs):
+    storage = ElasticsearchStorage(["http://es:9200"], bulk_backoff=0.001, bulk_backoff_max=0.01,
+                                   dead_letter=DeadLetterStore(str(tmp_path / 'dead.jsonl')), **kwargs)
+    storage.es = es
+    storage.is_connected = True
+    return storage
+
+
+def docs(n, start=0):
+    return [{'seq': i, 'message': f'log {i}'} for i in range(start, start + n)]
+
+
+class TestBulkIndex:
+    """Ponawianie pozycji, podzial 413 i dead-letter"""
+
+    def test_random_rejections_eventually_delivered(self, tmp_path):
+        es = FlakyBulkES(reject_rate=0.3)
+        storage = make_storage(es, tmp_path, bulk_max_attempts=20)
+        result = asyncio.run(storage.bulk_index(docs(500)))
+
+        assert result.saved == 500
+        assert result.retryable == []
+        # Kazdy dokument dokladnie raz - ponawiane sa tylko odrzucone pozycje
+        assert sorted(es.stored) == list(range(500))
+        assert result.retried > 0
+        assert storage.bulk_metrics()['errors']['es_rejected_execution_exception'] == result.retried
+
+    def test_413_splits_request(self, tmp_path):
+        es = FlakyBulkES(max_items=10)
+        storage = make_storage(es, tmp_path)
+        result = asyncio.run(storage.bulk_index(docs(35)))
+
+        assert result.saved == 35
+        assert sorted(es.stored) == list(range(35))
+        assert storage.bulk_errors['request_too_large'] >= 1
+
+    def test_mapping_errors_go_to_dead_letter(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        batch = docs(10)
+        batch[3]['poison'] = {'nested': True}
+        batch[7]['poison'] = {'nested': True}
+        result = asyncio.run(storage.bulk_index(batch))
+
+        assert result.saved == 8
+        assert result.dead_lettered == 2
+        assert result.retryable == []
+        assert es.requests == 1
+        entries = storage.dead_letter.recent()
+        assert [e['doc']['seq'] for e in entries] == [3, 7]
+        assert entries[0]['error_type'] == 'mapper_parsing_exception'
+        assert storage.bulk_errors['mapper_parsing_exception'] == 2
+
+    def test_exhausted_retries_returned(self, tmp_path):
+        es = FlakyBulkES(reject_rate=1.0)
+        storage = make_storage(es, tmp_path, bulk_max_attempts=3)
+        result = asyncio.run(storage.bulk_index(docs(5)))
+
+        assert result.saved == 0
+        assert [d['seq'] for d in result.retryable] == list(range(5))
+        assert es.requests == 3
+        assert storage.bulk_errors['retry_exhausted'] == 5
+
+    def test_whole_request_429_retried(self, tmp_path):
+        class BusyOnce(FlakyBulkES):
+            async def bulk(self, operations):
+                if self.requests == 0:
+                    self.requests += 1
+                    raise api_error(429)
+                return await super().bulk(operations)
+
+        storage = make_storage(BusyOnce(), tmp_path)
+        result = asyncio.run(storage.bulk_index(docs(5)))
+        assert result.saved == 5
+        assert storage.bulk_errors['http_429'] == 1
+        assert storage.is_connected
+
+    def test_whole_request_500_retried_not_dead_lettered(self, tmp_path):
+        class FailingOnce(FlakyBulkES):
+            async def bulk(self, operations):
+                if self.requests == 0:
+                    self.requests += 1
+                    raise api_error(500)
+                return await super().bulk(operations)
+
+        storage = make_storage(FailingOnce(), tmp_path)
+        result = asyncio.run(storage.bulk_index(docs(5)))
+        assert result.saved == 5
+        assert result.dead_lettered == 0
+        assert storage.bulk_errors['http_500'] == 1
+
+    def test_whole_request_400_dead_lettered(self, tmp_path):
+        class BadRequest(FlakyBulkES):
+            async def bulk(self, operations):
+                self.requests += 1
+                raise api_error(400)
+
+        es = BadRequest()
+        storage = make_storage(es, tmp_path)
+        result = asyncio.run(storage.bulk_index(docs(3)))
+        assert result.dead_lettered == 3
+        assert result.retryable == []
+        assert es.requests == 1
+
+    def test_cluster_block_items_kept_for_retry(self, tmp_path):
+        class ReadOnly(FlakyBulkES):
+            async def bulk(self, operations):
+                self.requests += 1
+                block = {"create": {"status": 403, "error": {
+                    "type": "cluster_block_exception",
+                    "reason": "index [logs] blocked by: [TOO_MANY_REQUESTS/12/disk usage exceeded "
+                              "flood-stage watermark, index has read-only-allow-delete block];"}}}
+                return {"errors": True, "items": [block for _ in operations[0::2]]}
+
+        es = ReadOnly()
+        storage = make_storage(es, tmp_path, bulk_max_attempts=2)
+        result = asyncio.run(storage.bulk_index(docs(4)))
+        assert result.dead_lettered == 0
+        assert [d['seq'] for d in result.retryable] == list(range(4))
+        assert es.requests == 2
+        assert storage.bulk_errors['cluster_block_exception'] == 8
+
+    def test_transport_error_raises_and_disconnects(self, tmp_path):
+        storage = make_storage(FlakyBulkES(down=True), tmp_path)
+        with pytest.raises(ESConnectionError):
+            asyncio.run(storage.bulk_index(docs(5)))
+        assert not storage.is_connected
+        assert asyncio.run(storage.save_logs_bulk(docs(5))) == 0
+
+
+class TestWriterWithBulkRetry:
+    """Pozycje, ktorych nie udalo sie zapisac, trafiaja do spoola i wracaja"""
+
+    def test_eventual_delivery_through_spool(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('es_writer.REPLAY_IDLE', 0.01)
+        es = FlakyBulkES(reject_rate=0.5, seed=7)
+        storage = make_storage(es, tmp_path, bulk_max_attempts=2)
+        writer = BulkWriter(storage.bulk_index, flush_docs=50, flush_interval=0.02,
+                            spool=DiskSpool(str(tmp_path / 'spool')), replay_rate=0, replay_backoff=0.01)
+        writer.start()
+        for start in range(0, 400, 40):
+            writer.add(docs(40, start))
+
+        deadline = time.monotonic() + 10
+        while len(es.stored) < 400 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        writer.stop()
+
+        assert sorted(es.stored) == list(range(400))
+        metrics = writer.metrics()
+        assert metrics['docs_spooled'] > 0
+        assert metrics['docs_failed'] == 0
+
+
+class TestIndexTemplate:
+    """Szablon indeksow i cache istniejacych indeksow"""
+
+    def test_setup_installs_template(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, number_of_replicas=0, refresh_interval="10s")
+        assert asyncio.run(storage.setup_indices())
+
+        template = es.indices.templates['logs-template']
+        assert template['index_patterns'] == ['logs-*']
+        settings = template['template']['settings']
+        assert settings == {"number_of_shards": 1, "refresh_interval": "10s", "number_of_replicas": 0}
+        assert template['template']['mappings']['properties']['timestamp'] == {"type": "date"}
+
+    def test_one_request_per_batch_with_template(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        asyncio.run(storage.setup_indices())
+        es.indices.calls.clear()
+
+        async def ingest():
+            for start in range(0, 50, 10):
+                await storage.bulk_index(docs(10, start))
+
+        asyncio.run(ingest())
+        # Tylko bulk - ES tworzy dzienny index sam z szablonu
+        assert es.indices.calls == []
+        assert es.requests == 5
+
+    def test_without_template_index_checked_once(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+
+        async def ingest():
+            for start in range(0, 50, 10):
+                await storage.bulk_index(docs(10, start))
+
+        asyncio.run(ingest())
+        assert es.indices.calls.count('exists') == 1
+        assert es.indices.calls.count('create') == 1
+        assert es.requests == 5
+
+    def test_cache_refreshed_on_day_rollover(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        asyncio.run(storage.setup_indices())
+        es.indices.calls.clear()
+
+        storage._known_day = storage._known_day.replace(year=2000)
+        asyncio.run(storage.bulk_index(docs(1)))
+        assert es.indices.calls == ['get_alias']
+
+
+class TestEventTimeRouting:
+    """Index wg daty zdarzenia i zawezanie wyszukiwania do zakresu"""
+
+    def test_batch_routed_by_event_date(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        now = datetime.now()
+        days = [now - timedelta(days=d) for d in (0, 0, 3, 10)]
+        logs = [{'seq': i, 'timestamp': ts.isoformat()} for i, ts in enumerate(days)]
+
+        result = asyncio.run(storage.bulk_index(logs))
+        assert result.saved == 4
+        assert es.requests == 1  # rozne indeksy w jednym zapytaniu bulk
+        assert [es.routed[i] for i in range(4)] == [storage._get_index_name(ts) for ts in days]
+
+    def test_timezone_aware_timestamp(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        ts = datetime.now(timezone.utc) - timedelta(days=2)
+        asyncio.run(storage.bulk_index([{'seq': 0, 'timestamp': ts.strftime('%Y-%m-%dT%H:%M:%SZ')}]))
+        assert es.routed[0] == storage._get_index_name(ts.astimezone())
+
+    def test_absurd_timestamps_clamped(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, route_max_past_days=30, route_max_future_hours=1)
+        collected = datetime.now() - timedelta(days=1)
+        logs = [
+            {'seq': 0, 'timestamp': '1970-01-01T00:00:00', 'collected_at': collected.isoformat()},
+            {'seq': 1, 'timestamp': (datetime.now() + timedelta(days=400)).isoformat()},
+            {'seq': 2, 'timestamp': 'wczoraj o 12'},
+            {'seq': 3, 'timestamp': (datetime.now() - timedelta(days=20)).isoformat()},
+        ]
+        asyncio.run(storage.bulk_index(logs))
+
+        today = storage._get_index_name()
+        assert es.routed[0] == storage._get_index_name(collected)
+        assert es.routed[1] == today
+        assert es.routed[2] == today
+        assert es.routed[3] == storage._get_index_name(datetime.now() - timedelta(days=20))
+        assert storage.bulk_metrics()['clamped_timestamps'] == 3
+
+    def test_search_only_overlapping_indices(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        end = datetime(2026, 3, 10, 0, 30)
+        asyncio.run(storage.search_logs(start_time=end - timedelta(hours=1), end_time=end))
+        assert es.searches == ['logs-2026.03.09,logs-2026.03.10']
+
+        # Cache istniejacych indeksow odrzuca dni bez danych
+        storage._known_indices = {'logs-2026.03.01', 'logs-2026.03.05'}
+        asyncio.run(storage.search_logs(start_time=datetime(2026, 3, 1), end_time=datetime(2026, 3, 10)))
+        assert es.searches[-1] == 'logs-2026.03.01,logs-2026.03.05'
+
+    def test_long_range_uses_wildcard(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, search_max_indices=10)
+        asyncio.run(storage.search_logs(start_time=datetime(2026, 1, 1), end_time=datetime(2026, 3, 1)))
+        assert es.searches == ['logs-*']
+
+    def test_default_range_last_7_days(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        asyncio.run(storage.search_logs())
+        indices = es.searches[0].split(',')
+        assert len(indices) == 7
+        assert indices[-1] == storage._get_index_name()
+
+
+class TestIlmMode:
+    """Tryb ILM: polityka, alias zapisu i zapis przez alias"""
+
+    def test_setup_installs_policy_and_bootstraps_alias(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, index_mode='ilm', retention_days=14,
+                               ilm={"rollover_max_docs": 1000, "warm_replicas": 0})
+        asyncio.run(storage.setup_indices())
+
+        phases = es.ilm.policies['logs-policy']['phases']
+        assert phases['hot']['actions']['rollover'] == {
+            "max_primary_shard_size": "30gb", "max_docs": 1000, "max_age": "30d"}
+        assert phases['warm']['actions'] == {
+            "forcemerge": {"max_num_segments": 1}, "readonly": {}, "allocate": {"number_of_replicas": 0}}
+        assert phases['delete'] == {"min_age": "14d", "actions": {"delete": {}}}
+
+        settings = es.indices.templates['logs-template']['template']['settings']
+        assert settings['index.lifecycle.name'] == 'logs-policy'
+        assert settings['index.lifecycle.rollover_alias'] == 'logs-write'
+        assert es.indices.aliases == {'logs-write': 'logs-000001'}
+
+    def test_bulk_writes_through_alias(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, index_mode='ilm')
+        asyncio.run(storage.setup_indices())
+        es.indices.calls.clear()
+
+        old = (datetime.now() - timedelta(days=5)).isoformat()
+        result = asyncio.run(storage.bulk_index([{'seq': 0, 'timestamp': old}, {'seq': 1}]))
+        assert result.saved == 2
+        assert set(es.routed.values()) == {'logs-write'}
+        assert es.indices.calls == []  # alias juz sprawdzony przy setup
+
+    def test_alias_created_on_first_write_when_setup_missed(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, index_mode='ilm')
+        asyncio.run(storage.bulk_index(docs(3)))
+        asyncio.run(storage.bulk_index(docs(3, 3)))
+        assert es.indices.calls.count('create') == 1
+        assert es.indices.aliases == {'logs-write': 'logs-000001'}
+
+    def test_clear_all_bootstraps_alias_again(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, index_mode='ilm')
+        asyncio.run(storage.setup_indices())
+        asyncio.run(storage.bulk_index(docs(3)))
+        storage.rollup_late["1h"] = datetime(2026, 3, 1)
+
+        assert asyncio.run(storage.clear_all())
+        assert es.indices.aliases == {}
+        assert storage.rollup_late == {}
+
+        asyncio.run(storage.bulk_index(docs(3, 3)))
+        # Alias zapisu wskazuje znowu na index z rolloverem, nie na zwykly logs-write
+        assert es.indices.aliases == {'logs-write': 'logs-000001'}
+        assert es.indices.calls.count('create') == 2
+
+    def test_search_uses_prefix_wildcard(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, index_mode='ilm')
+        asyncio.run(storage.search_logs(start_time=datetime(2026, 3, 1), end_time=datetime(2026, 3, 2)))
+        assert es.searches == ['logs-*']
+
+    def test_unknown_mode_rejected(self, tmp_path):
+        with pytest.raises(ValueError):
+            make_storage(FlakyBulkES(), tmp_path, index_mode='weekly')
+
+
+class TestSearch:
+    """search_logs / get_log_by_id przez wspolny builder"""
+
+    def test_search_logs_uses_filter_context(self, tmp_path):
+        es = FlakyBulkES()
+        es.hits = [{"_id": "a1", "_source": {"message": "x"}}]
+        storage = make_storage(es, tmp_path)
+        logs = asyncio.run(storage.search_logs(query="x", level="ERROR", limit=10, source_fields=["message"]))
+
+        assert logs == [{"message": "x", "_id": "a1"}]
+        body = es.bodies[0]
+        assert body["query"]["bool"]["filter"] == [{"term": {"severity": "ERROR"}}]
+        assert body["query"]["bool"]["must"][0]["multi_match"]["fields"] == ["message", "raw"]
+        assert body["_source"] == ["message"]
+        assert body["track_total_hits"] is False
+
+    def test_get_log_by_id(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        assert asyncio.run(storage.get_log_by_id("missing")) is None
+
+        es.hits = [{"_id": "abc", "_source": {"message": "found"}}]
+        assert asyncio.run(storage.get_log_by_id("abc")) == {"message": "found", "_id": "abc"}
+        assert es.searches[-1] == 'logs-*'
+        assert es.bodies[-1]["query"] == {"bool": {"filter": [{"ids": {"values": ["abc"]}}]}}
+
+    def test_search_error_returns_empty_and_counts_failure(self, tmp_path):
+        es = FlakyBulkES()
+
+        async def broken(index, body, **kwargs):
+            raise ESConnectionError("refused")
+
+        es.search = broken
+        storage = make_storage(es, tmp_path)
+        assert asyncio.run(storage.search_logs(query="x")) == []
+        assert not storage.is_connected
+
+
+class TestMappingProfile:
+    """Profil lean: mapowanie, kodek i dokumenty bez zdublowanych pol"""
+
+    def test_lean_template(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, mapping_profile='lean')
+        asyncio.run(storage.setup_indices())
+
+        template = es.indices.templates['logs-template']['template']
+        assert template['settings']['codec'] == 'best_compression'
+        mappings = template['mappings']
+        assert mappings['dynamic'] is False
+        assert mappings['properties']['raw'] == {"type": "text", "index": False}
+        assert mappings['properties']['context'] == {"type": "object", "enabled": False}
+        assert 'level' not in mappings['properties'] and 'operation' not in mappings['properties']
+
+    def test_lean_docs_drop_redundant_fields(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, mapping_profile='lean')
+        logs = [
+            {'seq': 0, 'timestamp': '2026-03-01T10:00:00', 'level': 'WARNING', 'operation': 'SELECT',
+             'message': 'same', 'raw': 'same'},
+            {'seq': 1, 'timestamp': '2026-03-01T10:00:00', 'severity': 'ERROR', 'level': 'INFO',
+             'message': 'cut', 'raw': '2026-03-01 10:00:00 cut'},
+        ]
+        sent = []
+        original_bulk = es.bulk
+
+        async def bulk(operations):
+            sent.extend(operations[1::2])
+            return await original_bulk(operations)
+
+        es.bulk = bulk
+        asyncio.run(storage.bulk_index(logs))
+
+        assert sent[0] == {'seq': 0, 'timestamp': '2026-03-01T10:00:00', 'severity': 'WARNING',
+                           'event_type': 'SELECT', 'message': 'same'}
+        assert sent[1]['severity'] == 'ERROR' and 'level' not in sent[1]
+        assert sent[1]['raw'] == '2026-03-01 10:00:00 cut'
+        # Bufor w pamieci bez zmian
+        assert logs[0]['level'] == 'WARNING' and logs[0]['raw'] == 'same'
+
+    def test_lean_search_message_only_and_raw_restored(self, tmp_path):
+        es = FlakyBulkES()
+        es.hits = [{"_id": "a1", "_source": {"message": "x"}}]
+        storage = make_storage(es, tmp_path, mapping_profile='lean')
+        logs = asyncio.run(storage.search_logs(query="x", operation="SELECT"))
+
+        assert logs == [{"message": "x", "raw": "x", "_id": "a1"}]
+        query = es.bodies[0]["query"]["bool"]
+        assert query["must"][0]["multi_match"]["fields"] == ["message"]
+        assert query["filter"] == [{"term": {"event_type": "SELECT"}}]
+
+    def test_standard_docs_unchanged(self, tmp_path):
+        storage = make_storage(FlakyBulkES(), tmp_path)
+        log = {'level': 'INFO', 'message': 'x', 'raw': 'x'}
+        assert storage._prepare_doc(log) is log
+
+    def test_unknown_profile_rejected(self, tmp_path):
+        with pytest.raises(ValueError):
+            make_storage(FlakyBulkES(), tmp_path, mapping_profile='tiny')
+
+
+class TestIdempotentIds:
+    """Deterministyczne _id i create - ponowny zapis nie duplikuje"""
+
+    def test_replay_three_times_stored_once(self, tmp_path):
+        import main
+
+        log_file = tmp_path / 'app.log'
+        log_file.write_text(''.join(
+            f"2026-03-01 10:{i // 60:02d}:{i % 60:02d} ERROR request {i} failed\n" for i in range(300)))
+        es = FlakyBulkES(reject_rate=0.3)
+        storage = make_storage(es, tmp_path, bulk_max_attempts=30)
+
+        memory = []
+        for _ in range(3):
+            # Nowa instancja zrodla = restart: plik czytany ponownie od poczatku
+            source = FileSource('app', {'type': 'file', 'path': str(tmp_path), 'patterns': ['*.log']})
+            logs = main.normalize_logs('app', source, source.collect())
+            assert asyncio.run(storage.bulk_index(logs)).saved == 300
+            memory = logs
+        # sync-to-es z bufora w pamieci
+        asyncio.run(storage.bulk_index(list(memory)))
+
+        assert len(es.ids) == 300
+        assert len(es.stored) == 300
+        assert storage.duplicates == 900
+        assert {log['_id'] for log in memory} == set(es.ids)
+        assert all('_id' not in doc for doc in es.ids.values())
+
+    def test_appended_lines_keep_ids(self, tmp_path):
+        log_file = tmp_path / 'app.log'
+        log_file.write_text("first\n")
+        source = FileSource('app', {'type': 'file', 'path': str(tmp_path), 'patterns': ['*.log']})
+        first = source.collect()
+        with open(log_file, 'a') as f:
+            f.write("second\n")
+        second = source.collect()
+        assert [log.raw for log in second] == ['second']
+
+        replay = FileSource('app', {'type': 'file', 'path': str(tmp_path), 'patterns': ['*.log']}).collect()
+        assert [log.position for log in replay] == [first[0].position, second[0].position]
+
+    def test_id_depends_on_position_and_content(self):
+        log = {'source': 'app', 'timestamp': '2026-03-01T10:00:00', 'raw': 'x'}
+        assert document_id(log, '1:0') == document_id(dict(log), '1:0')
+        assert document_id(log, '1:0') != document_id(log, '1:2')
+        assert document_id(log, '1:0') != document_id({**log, 'raw': 'y'}, '1:0')
+        # Bez pozycji - timestamp
+        assert document_id(log) != document_id({**log, 'timestamp': '2026-03-01T10:00:01'})
+
+    def test_retryable_and_single_save_keep_id(self, tmp_path):
+        es = FlakyBulkES(down=False, reject_rate=1.0)
+        storage = make_storage(es, tmp_path, bulk_max_attempts=1)
+        result = asyncio.run(storage.bulk_index([{'seq': 1, '_id': 'fixed', 'message': 'x'}]))
+        assert result.retryable[0]['_id'] == 'fixed'
+
+        log = {'_id': 'front-1', 'message': 'hello'}
+        assert asyncio.run(storage.save_log(log))
+        assert asyncio.run(storage.save_log(log))
+        assert list(es.ids) == ['front-1'] and storage.duplicates == 1
+
+
+class TestStats:
+    """get_stats(hours) - okno czasu i os czasu"""
+
+    def test_stats_window_and_timelines(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        captured = {}
+
+        async def search(index, body, **kwargs):
+            captured.update(index=index, body=body)
+            return {
+                "hits": {"total": {"value": 3, "relation": "eq"}, "hits": []},
+                "aggregations": {
+                    "by_severity": {"buckets": [{"key": "ERROR", "doc_count": 1}, {"key": "INFO", "doc_count": 2}]},
+                    "by_source": {"buckets": [{"key": "app", "doc_count": 3}]},
+                    "by_source_type": {"buckets": []},
+                    "by_event_type": {"buckets": [{"key": "INSERT", "doc_count": 3}]},
+                    "timeline": {"buckets": [
+                        {"key_as_string": "2026-03-01T10:00:00", "key": 1, "doc_count": 3,
+                         "by_severity": {"buckets": [{"key": "ERROR", "doc_count": 1}, {"key": "INFO", "doc_count": 2}]},
+                         "by_event_type": {"buckets": [{"key": "INSERT", "doc_count": 3}]}},
+                        {"key_as_string": "2026-03-01T10:01:00", "key": 2, "doc_count": 0,
+                         "by_severity": {"buckets": []}, "by_event_type": {"buckets": []}},
+                    ]},
+                },
+            }
+
+        es.search = search
+        stats = asyncio.run(storage.get_stats(hours=1))
+
+        assert captured["body"]["size"] == 0
+        assert captured["body"]["aggs"]["timeline"]["date_histogram"]["fixed_interval"] == "1m"
+        # Okno 1h - tylko dzisiejszy index (albo dwa tuz po polnocy)
+        assert len(captured["index"].split(",")) <= 2
+        assert stats["total_logs"] == 3
+        assert stats["by_severity"] == {"ERROR": 1, "INFO": 2}
+        assert stats["timeline"] == [{"timestamp": "2026-03-01T10:00:00", "count": 3},
+                                     {"timestamp": "2026-03-01T10:01:00", "count": 0}]
+        assert stats["level_timeline"][0] == {"timestamp": "2026-03-01T10:00:00", "ERROR": 1, "INFO": 2}
+        assert stats["operation_timeline"][1] == {"timestamp": "2026-03-01T10:01:00"}
+
+    def test_30_day_window_index_count(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path)
+        asyncio.run(storage.get_stats(hours=24 * 30))
+        assert len(es.searches[0].split(",")) == 31
+        assert es.bodies[0]["aggs"]["timeline"]["date_histogram"]["fixed_interval"] == "12h"
+
+
+class RollupES:
+    """Fake ES: agregacja composite po surowych logach, bulk do indeksu rollup"""
+
+    def __init__(self, raw):
+        self.indices = FakeIndices()
+        self.raw = raw
+        self.rollup_docs = {}
+        self.searches = []
+        self.deleted_by_query = []
+
+    async def search(self, index, body, **kwargs):
+        self.searches.append((index, body))
+        composite = body["aggs"]["rollup"]["composite"]
+        bounds = body["query"]["bool"]["filter"][0]["range"]["timestamp"]
+        step_ms = {"1m": 60000, "1h": 3600000}[composite["sources"][0]["timestamp"]["date_histogram"]["fixed_interval"]]
+        fields = [next(iter(source)) for source in composite["sources"][1:]]
+        groups = {}
+        for doc in self.raw:
+            if not bounds["gte"] <= doc["timestamp"] < bounds["lt"]:
+                continue
+            ms = int((datetime.fromisoformat(doc["timestamp"]) - datetime(1970, 1, 1)).total_seconds() * 1000)
+            key = (ms // step_ms * step_ms,) + tuple(doc.get(f) or "" for f in fields)
+            groups[key] = groups.get(key, 0) + 1
+        keys = sorted(groups)
+        if "after" in composite:
+            after = composite["after"]
+            marker = (after["timestamp"],) + tuple(after.get(f) or "" for f in fields)
+            keys = [k for k in keys if k > marker]
+        page = keys[:composite["size"]]
+        buckets = [{"key": {"timestamp": k[0], **{f: (v or None) for f, v in zip(fields, k[1:])}},
+                    "doc_count": groups[k]} for k in page]
+        agg = {"buckets": buckets}
+        if buckets:
+            agg["after_key"] = buckets[-1]["key"]
+        return {"aggregations": {"rollup": agg}}
+
+    async def bulk(self, operations):
+        for action, doc in zip(operations[0::2], operations[1::2]):
+            self.rollup_docs[action["index"]["_id"]] = doc
+        return {"errors": False, "items": []}
+
+    async def delete_by_query(self, index, query, **kwargs):
+        self.deleted_by_query.append(query)
+
+
+class TestRollup:
+    """Kubelki rollup i wybor rollup / surowe logi w get_stats"""
+
+    def raw_logs(self, now):
+        logs = []
+        for minutes_ago in range(0, 180):
+            ts = (now - timedelta(minutes=minutes_ago)).replace(second=30, microsecond=0)
+            for i in range(3):
+                logs.append({"timestamp": ts.isoformat(), "source": "app" if i else "db",
+                             "severity": "ERROR" if minutes_ago % 10 == 0 else "INFO", "event_type": "INSERT"})
+        return logs
+
+    def test_rollup_counts_and_idempotent_rerun(self, tmp_path):
+        now = datetime(2026, 3, 10, 12, 5, 30)
+        es = RollupES(self.raw_logs(now))
+        storage = make_storage(es, tmp_path, rollup_enabled=True, rollup_backfill_days=1)
+
+        written = asyncio.run(storage.rollup("1h", now=now))
+        docs_1h = list(es.rollup_docs.values())
+        # Zamkniete godziny sprzed (now - opoznienie); trwajaca 12:xx jeszcze nie
+        assert {d["timestamp"] for d in docs_1h} >= {"2026-03-10T09:00:00", "2026-03-10T10:00:00",
+                                                     "2026-03-10T11:00:00"}
+        assert all("2026-03-10T12" not in d["timestamp"] for d in docs_1h)
+        hour_11 = [d for d in docs_1h if d["timestamp"] == "2026-03-10T11:00:00"]
+        assert sum(d["count"] for d in hour_11) == 180
+        assert {d["source"] for d in hour_11} == {"app", "db"}
+        assert "table_name" not in hour_11[0]  # brak wartosci - pole pominiete
+        assert storage.rollup_watermarks["1h"] == datetime(2026, 3, 10, 12, 0)
+        assert written == len(es.rollup_docs)
+
+        # Ponowne liczenie ostatnich kubelkow nadpisuje te same _id
+        asyncio.run(storage.rollup("1h", now=now + timedelta(minutes=5)))
+        assert len(es.rollup_docs) == written
+
+    def test_minute_rollup_respects_delay_and_pages(self, tmp_path, monkeypatch):
+        import elasticsearch_storage
+        monkeypatch.setattr(elasticsearch_storage, 'ROLLUP_PAGE_SIZE', 50)
+        now = datetime(2026, 3, 10, 12, 0, 30)
+        es = RollupES(self.raw_logs(now))
+        storage = make_storage(es, tmp_path, rollup_enabled=True, rollup_backfill_days=1)
+
+        asyncio.run(storage.rollup("1m", now=now))
+        minutes = {d["timestamp"] for d in es.rollup_docs.values()}
+        assert "2026-03-10T11:58:00" in minutes
+        assert "2026-03-10T11:59:00" not in minutes  # zamykana z opoznieniem ROLLUP_DELAY
+        assert sum(d["count"] for d in es.rollup_docs.values()) == 178 * 3
+        assert storage.rollup_watermarks["1m"] == datetime(2026, 3, 10, 11, 59)
+        assert len(es.searches) > 356 // 50  # 178 minut x 2 kombinacje, po 50 na strone
+
+    def test_minute_rollup_retention(self, tmp_path):
+        now = datetime(2026, 3, 10, 12, 0, 30)
+        es = RollupES([])
+        storage = make_storage(es, tmp_path, rollup_enabled=True, rollup_backfill_days=10, rollup_minute_days=7)
+        asyncio.run(storage.rollup("1m", now=now))
+        # Backfill minutowy tylko rollup_minute_days wstecz - nic do usuniecia
+        first = es.searches[0][1]["query"]["bool"]["filter"][0]["range"]["timestamp"]
+        assert first["gte"] == "2026-03-03T12:00:00"
+        assert storage.rollup_earliest["1m"] == datetime(2026, 3, 3, 12, 0)
+        assert es.deleted_by_query == []
+
+        asyncio.run(storage.rollup("1m", now=now + timedelta(days=1)))
+        assert len(es.deleted_by_query) == 1
+        assert storage.rollup_earliest["1m"] == datetime(2026, 3, 4, 12, 0)
+
+    def test_hourly_rollup_expires_with_retention(self, tmp_path):
+        now = datetime(2026, 3, 10, 12, 0, 30)
+        es = RollupES([])
+        storage = make_storage(es, tmp_path, rollup_enabled=True, retention_days=30)
+        asyncio.run(storage.rollup("1h", now=now))
+        assert storage.rollup_earliest["1h"] == datetime(2026, 2, 8, 12, 0)
+        assert es.deleted_by_query == []
+
+        asyncio.run(storage.rollup("1h", now=now + timedelta(days=2)))
+        query = es.deleted_by_query[0]["bool"]["filter"]
+        assert query == [{"term": {"granularity": "1h"}},
+                         {"range": {"timestamp": {"lt": "2026-02-10T12:00:00"}}}]
+        assert storage.rollup_earliest["1h"] == datetime(2026, 2, 10, 12, 0)
+
+    def test_late_logs_rerolled(self, tmp_path):
+        now = datetime(2026, 3, 10, 12, 5, 30)
+        raw = self.raw_logs(now)
+        es = RollupES(raw)
+        storage = make_storage(es, tmp_path, rollup_enabled=True, rollup_backfill_days=1)
+        asyncio.run(storage.rollup("1h", now=now))
+        hour_9 = sum(d["count"] for d in es.rollup_docs.values() if d["timestamp"] == "2026-03-10T09:00:00")
+
+        # Replay spoola: logi sprzed ROLLUP_LOOKBACK zapisane po policzeniu kubelka
+        late = [{"timestamp": "2026-03-10T09:15:00", "source": "app", "severity": "INFO",
+                 "event_type": "INSERT", "message": f"late {i}"} for i in range(4)]
+        storage._note_late_log(late[0]["timestamp"])
+        raw.extend(late)
+        assert storage.rollup_late["1h"] == datetime(2026, 3, 10, 9, 15)
+
+        asyncio.run(storage.rollup("1h", now=now + timedelta(hours=3)))
+        counts = {}
+        for doc in es.rollup_docs.values():
+            counts[doc["timestamp"]] = counts.get(doc["timestamp"], 0) + doc["count"]
+        assert counts["2026-03-10T09:00:00"] == hour_9 + 4
+        assert "1h" not in storage.rollup_late
+
+    def test_stats_picks_rollup_for_long_windows(self, tmp_path):
+        es = FlakyBulkES()
+        storage = make_storage(es, tmp_path, rollup_enabled=True)
+        now = datetime.now()
+        storage.rollup_earliest["1h"] = now - timedelta(days=40)
+        storage.rollup_watermarks["1h"] = now - timedelta(minutes=30)
+
+        asyncio.run(storage.get_stats(hours=24 * 30))
+        assert es.searches[0] == 'logs_rollup'
+        assert {"term": {"granularity": "1h"}} in es.bodies[0]["query"]["bool"]["filter"]
+        # Surowe logi tylko za koncowke po watermarku
+        raw_range = es.bodies[1]["query"]["bool"]["filter"][0]["range"]["timestamp"]
+        assert raw_range["gte"] == storage.rollup_watermarks["1h"].isoformat()
+        assert len(es.searches[1].split(",")) <= 2
+
+        # Krotkie okno albo brak pokrycia - surowe logi
+        es.searches.clear()
+        asyncio.run(storage.get_stats(hours=12))
+        assert es.searches[0] != 'logs_rollup'
+        storage.rollup_earliest["1h"] = now - timedelta(days=3)
+        es.searches.clear()
+        asyncio.run(storage.get_stats(hours=24 * 30))
+        assert es.searches == [es.searches[0]] and es.searches[0] != 'logs_rollup'
+
+    def test_merge_rollup_and_raw(self):
+        rollup = {"aggregations": {
+            "total": {"value": 100.0},
+            "by_severity": {"buckets": [{"key": "INFO", "doc_count": 3, "logs": {"value": 90.0}},
+                                        {"key": "ERROR", "doc_count": 1, "logs": {"value": 10.0}}]},
+            "timeline": {"buckets": [{"key": 1, "key_as_string": "t1", "doc_count": 4, "logs": {"value": 100.0},
+                                      "by_severity": {"buckets": [{"key": "INFO", "doc_count": 3, "logs": {"value": 90.0}}]}}]},
+        }}
+        raw = {"hits": {"total": {"value": 5, "relation": "eq"}}, "aggregations": {
+            "by_severity": {"buckets": [{"key": "INFO", "doc_count": 5}]},
+            "timeline": {"buckets": [{"key": 2, "key_as_string": "t2", "doc_count": 5,
+                                      "by_severity": {"buckets": [{"key": "INFO", "doc_count": 5}]}}]},
+        }}
+        stats = ElasticsearchStorage._merge_stats([rollup, raw])
+        assert stats["total_logs"] == 105
+        assert stats["by_severity"] == {"INFO": 95, "ERROR": 10}
+        assert stats["timeline"] == [{"timestamp": "t1", "count": 100}, {"timestamp": "t2", "count": 5}]
+        assert stats["level_timeline"][0] == {"timestamp": "t1", "INFO": 90}
@@ -0,0 +1,89 @@
+"""
+Testy buildera zapytan ES (es_query.py)
+Unit tests for the shared search query builder
+"""
+
+import pytest
+import sys
+import os
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from es_query import auto_interval, build_query, build_search, build_stats, total_hits
+
+
+class TestBuildQuery:
+    """Filtry w kontekscie filter, pelny tekst tylko w polach tekstowych"""
+
+    def test_empty_is_match_all(self):
+        assert build_query() == {"match_all": {}}
+        assert build_query(filters={"severity": None, "source": ""}) == {"match_all": {}}
+
+    def test_exact_conditions_in_filter_context(self):
+        q = build_query(filters={"severity": "ERROR", "source": ["app", "db"]},
+                        start_time=datetime(2026, 3, 1, 10), end_time=datetime(2026, 3, 1, 11))
+        assert "must" not in q["bool"]
+        assert q["bool"]["filter"] == [
+            {"term": {"severity": "ERROR"}},
+            {"terms": {"source": ["app", "db"]}},
+            {"range": {"timestamp": {"gte": "2026-03-01T10:00:00", "lte": "2026-03-01T11:00:00"}}},
+        ]
+
+    def test_full_text_only_on_text_fields(self):
+        q = build_query(query="timeout", filters={"severity": "ERROR"})
+        assert q["bool"]["must"] == [{"multi_match": {"query": "timeout", "fields": ["message", "raw"]}}]
+        assert q["bool"]["filter"] == [{"term": {"severity": "ERROR"}}]
+
+    def test_ids_filter(self):
+        assert build_query(ids=["abc"]) == {"bool": {"filter": [{"ids": {"values": ["abc"]}}]}}
+
+
+class TestBuildSearch:
+    """Body _search: rozmiar, projekcja _source, track_total_hits"""
+
+    def test_defaults_skip_total_count(self):
+        body = build_search(size=20)
+        assert body["size"] == 20
+        assert body["track_total_hits"] is False
+        assert body["sort"] == [{"timestamp": {"order": "desc", "unmapped_type": "date"}}]
+        assert "_source" not in body and "from" not in body
+
+    def test_projection_offset_and_total_limit(self):
+        body = build_search(source_fields=["timestamp", "message"], offset=40, track_total_hits=10000)
+        assert body["_source"] == ["timestamp", "message"]
+        assert body["from"] == 40
+        assert body["track_total_hits"] == 10000
+
+    def test_total_hits_formats(self):
+        assert total_hits({"hits": {"hits": []}}) is None
+        assert total_hits({"hits": {"total": {"value": 10000, "relation": "gte"}}}) == {"value": 10000, "relation": "gte"}
+        assert total_hits({"hits": {"total": 7}}) == {"value": 7, "relation": "eq"}
+
+
+class TestBuildStats:
+    """Agregacje statystyk z osia czasu"""
+
+    def test_auto_interval_keeps_bucket_count_bounded(self):
+        assert auto_interval(1) == "1m"
+        assert auto_interval(24) == "30m"
+        assert auto_interval(24 * 7) == "3h"
+        assert auto_interval(24 * 30) == "12h"
+        assert auto_interval(24 * 365 * 5) == "7d"
+
+    def test_size_zero_filter_range_and_histogram(self):
+        start, end = datetime(2026, 3, 1, 10), datetime(2026, 3, 1, 11)
+        body = build_stats(start, end, "1m")
+        assert body["size"] == 0
+        assert body["query"] == {"bool": {"filter": [
+            {"range": {"timestamp": {"gte": "2026-03-01T10:00:00", "lte": "2026-03-01T11:00:00"}}}]}}
+        histogram = body["aggs"]["timeline"]
+        assert histogram["date_histogram"]["fixed_interval"] == "1m"
+        assert histogram["date_histogram"]["extended_bounds"] == {
+            "min": "2026-03-01T10:00:00", "max": "2026-03-01T11:00:00"}
+        assert set(histogram["aggs"]) == {"by_severity", "by_event_type"}
+
+    def test_without_window_no_timeline(self):
+        body = build_stats()
+        assert body["query"] == {"match_all": {}}
+        assert "timeline" not in body["aggs"]
@@ -0,0 +1,119 @@
+"""
+Testy joba retencji (es_retention.py)
+Unit tests for the scheduled deletion of old daily indices
+"""
+
+import pytest
+import sys
+import os
+import asyncio
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from elasticsearch_storage import ElasticsearchStorage
+from es_retention import RetentionJob, RollupJob
+
+
+class DailyIndices:
+    """indices.* z lista indeksow dziennych"""
+
+    def __init__(self, names):
+        self.names = set(names)
+        self.deleted = []
+
+    async def get_alias(self, index, **kwargs):
+        return {name: {"aliases": {}} for name in self.names}
+
+    async def delete(self, index):
+        self.deleted.append(index)
+        self.names.discard(index)
+
+
+class FakeES:
+    def __init__(self, names):
+        self.indices = DailyIndices(names)
+
+
+def make_storage(names, connected=True):
+    storage = ElasticsearchStorage(["http://es:9200"], index_prefix="logs")
+    storage.es = FakeES(names)
+    storage.is_connected = connected
+    return storage
+
+
+def day_index(days_ago):
+    return f"logs-{(datetime.now() - timedelta(days=days_ago)).strftime('%Y.%m.%d')}"
+
+
+class TestRetentionJob:
+    """Usuwanie indeksow dziennych starszych niz retention_days"""
+
+    def test_deletes_only_indices_outside_window(self):
+        storage = make_storage([day_index(d) for d in (0, 1, 29, 30, 31, 45)] + ["logs-000001"])
+        job = RetentionJob(storage, retention_days=30, interval=600)
+
+        assert asyncio.run(job.step()) == 600
+        assert sorted(storage.es.indices.deleted) == sorted([day_index(31), day_index(45)])
+        # Dzien na granicy okna zostaje, indeksy ILM nie sa ruszane
+        assert day_index(30) in storage.es.indices.names
+        assert "logs-000001" in storage.es.indices.names
+        assert job.metrics()['deleted_indices'] == 2
+        assert job.metrics()['runs'] == 1
+
+    def test_waits_for_connection(self):
+        storage = make_storage([day_index(90)], connected=False)
+        job = RetentionJob(storage, retention_days=30, interval=3600)
+
+        assert asyncio.run(job.step()) == 60.0
+        assert storage.es.indices.deleted == []
+        assert job.runs == 0
+
+    def test_runs_in_background_until_stopped(self):
+        storage = make_storage([day_index(40)])
+        job = RetentionJob(storage, retention_days=30, interval=0.01)
+
+        async def scenario():
+            job.start()
+            await asyncio.sleep(0.05)
+            await job.stop()
+
+        asyncio.run(scenario())
+        assert storage.es.indices.deleted == [day_index(40)]
+        assert job.runs >= 2
+
+
+class RollupStorage(ElasticsearchStorage):
+    """Storage z licznikiem wywolan rollup()"""
+
+    def __init__(self):
+        super().__init__(["http://es:9200"], index_prefix="logs", rollup_enabled=True)
+        self.is_connected = True
+        self.calls = []
+
+    async def rollup(self, granularity, now=None):
+        self.calls.append(granularity)
+        return 1
+
+
+class TestRollupJob:
+    """Czestotliwosc kubelkow minutowych i godzinowych"""
+
+    def test_hourly_rollup_less_often(self):
+        storage = RollupStorage()
+        job = RollupJob(storage, interval=60, hourly_interval=900)
+
+        async def scenario():
+            for _ in range(3):
+                assert await job.step() == 60
+
+        asyncio.run(scenario())
+        assert storage.calls == ["1m", "1h", "1m", "1m"]
+        assert job.metrics()['runs'] == 3
+
+    def test_waits_for_connection(self):
+        storage = RollupStorage()
+        storage.is_connected = False
+        job = RollupJob(storage, interval=30)
+        assert asyncio.run(job.step()) == 30
+        assert storage.calls == []
@@ -0,0 +1,163 @@
+"""
+Testy supervisora polaczenia ES (es_supervisor.py)
+Unit tests for the Elasticsearch reconnection supervisor and connection state
+"""
+
+import pytest
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from elasticsearch import ConnectionError as ESConnectionError
+from elasticsearch_storage import ElasticsearchStorage
+from es_supervisor import ConnectionSupervisor
+
+
+class PingStorage(ElasticsearchStorage):
+    """Storage z kontrolowanym wynikiem ping()"""
+
+    def __init__(self, results, **kwargs):
+        super().__init__(["http://es:9200"], **kwargs)
+        self.results = list(results)
+        self.pings = 0
+        self.setups = 0
+
+    async def ping(self, timeout: float = 5) -> bool:
+        self.pings += 1
+        ok = self.results.pop(0) if self.results else True
+        if not ok:
+            self.last_error = "ConnectionError: refused"
+        return ok
+
+    async def setup_indices(self) -> bool:
+        self.setups += 1
+        return True
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class TestConnectionState:
+    """Stan polaczenia wynika z wynikow zapytan"""
+
+    def test_transport_error_disconnects_immediately(self):
+        storage = PingStorage([])
+        storage.mark_connected("test")
+        storage.record_failure(ESConnectionError("refused"))
+        assert not storage.is_connected
+        metrics = storage.connection_metrics()
+        assert metrics['disconnects'] == 1
+        assert [t['connected'] for t in metrics['transitions']] == [True, False]
+
+    def test_other_errors_need_threshold(self):
+        storage = PingStorage([], failure_threshold=3)
+        storage.mark_connected("test")
+        storage.record_failure(ValueError("bad response"))
+        storage.record_failure(ValueError("bad response"))
+        assert storage.is_connected
+        storage.record_failure(ValueError("bad response"))
+        assert not storage.is_connected
+
+    def test_success_resets_failures(self):
+        storage = PingStorage([], failure_threshold=2)
+        storage.mark_connected("test")
+        storage.record_failure(ValueError("x"))
+        storage.record_success()
+        storage.record_failure(ValueError("x"))
+        assert storage.is_connected
+
+    def test_repeated_marks_are_not_transitions(self):
+        storage = PingStorage([])
+        storage.mark_connected("a")
+        storage.mark_connected("b")
+        storage.mark_disconnected("c")
+        storage.mark_disconnected("d")
+        assert storage.connects == 1
+        assert storage.disconnects == 1
+
+
+class TestConnectionSupervisor:
+    """Backoff, laczenie w tle i health-check"""
+
+    def test_backoff_grows_until_connected(self):
+        storage = PingStorage([False, False, False, False, True])
+        supervisor = ConnectionSupervisor(storage, initial_backoff=1, max_backoff=4, health_interval=10)
+
+        delays = [run(supervisor.step()) for _ in range(4)]
+        assert not storage.is_connected
+        # 1, 2, 4, 4 (+/- jitter)
+        for delay, expected in zip(delays, [1, 2, 4, 4]):
+            assert expected * 0.9 <= delay <= expected * 1.1
+        assert supervisor.metrics()['next_attempt_in'] is not None
+
+        assert run(supervisor.step()) == 10
+        assert storage.is_connected
+        assert storage.setups == 1
+        assert supervisor.backoff == 1
+        assert supervisor.metrics()['connects'] == 1
+
+    def test_health_check_skipped_while_requests_succeed(self):
+        storage = PingStorage([])
+        storage.mark_connected("test")
+        supervisor = ConnectionSupervisor(storage, health_interval=10)
+        storage.record_success()
+        delay = run(supervisor.step())
+        assert storage.pings == 0
+        assert 9 < delay <= 10
+
+    def test_failed_health_check_disconnects(self):
+        storage = PingStorage([False])
+        storage.mark_connected("test")
+        storage.last_success_at -= 60
+        supervisor = ConnectionSupervisor(storage, initial_backoff=0.5, health_interval=10)
+        assert run(supervisor.step()) == 0.5
+        assert not storage.is_connected
+        assert supervisor.health_checks == 1
+        assert storage.connection_metrics()['transitions'][-1]['reason'].startswith('health-check')
+
+    def test_start_does_not_block(self):
+        storage = PingStorage([False] * 100)
+
+        async def scenario():
+            supervisor = ConnectionSupervisor(storage, initial_backoff=0.01, max_backoff=0.02)
+            supervisor.start()
+            await asyncio.sleep(0.1)
+            await supervisor.stop()
+            return supervisor
+
+        supervisor = run(scenario())
+        assert storage.pings > 1
+        assert supervisor.failed_attempts == storage.pings
+        assert not storage.is_connected
+
+    def test_failing_step_does_not_end_loop(self):
+        class SetupFailsOnce(PingStorage):
+            async def setup_indices(self) -> bool:
+                self.setups += 1
+                if self.setups == 1:
+                    raise RuntimeError("template install rejected")
+                return True
+
+        storage = SetupFailsOnce([])
+
+        async def scenario():
+            supervisor = ConnectionSupervisor(storage, initial_backoff=0.01, max_backoff=0.02,
+                                              health_interval=10)
+            supervisor.start()
+            for _ in range(100):
+                if storage.is_connected:
+                    break
+                await asyncio.sleep(0.01)
+            alive = not supervisor._task.done()
+            await supervisor.stop()
+            return supervisor, alive
+
+        supervisor, alive = run(scenario())
+        assert alive
+        assert supervisor.step_errors == 1
+        assert storage.setups == 2
+        assert storage.is_connected
+        assert storage.connection_metrics()['transitions'][1]['reason'].startswith('setup_indices')
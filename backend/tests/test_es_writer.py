@@ -0,0 +1,161 @@
+"""
+Testy writera Elasticsearch (es_writer.py)
+Unit tests for the cross-source batching bulk writer
+"""
+
+import pytest
+import sys
+import os
+import asyncio
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from es_writer import BulkWriter
+
+
+class FakeBulk:
+    """Bulk ES ze stalym opoznieniem zapytania"""
+
+    def __init__(self, delay=0.0, fail=False):
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+
+    async def __call__(self, docs):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail:
+                raise ConnectionError("es down")
+            self.calls.append(list(docs))
+            return len(docs)
+        finally:
+            self.active -= 1
+
+    @property
+    def written(self):
+        return sum(len(c) for c in self.calls)
+
+
+def docs(n, source='src'):
+    return [{'message': f'{source} {i}', 'source': source} for i in range(n)]
+
+
+class TestBulkWriter:
+    """Warunki flush i metryki"""
+
+    def test_flush_by_docs(self):
+        bulk = FakeBulk()
+        writer = BulkWriter(bulk, flush_docs=100, flush_interval=60)
+        writer.start()
+        writer.add(docs(250))
+        time.sleep(0.2)
+        # Dwie pelne partie od razu, reszta czeka na wiek/stop
+        assert [len(c) for c in bulk.calls] == [100, 100]
+        writer.stop()
+        assert bulk.written == 250
+        assert writer.metrics()['flush_reasons'] == {'docs': 2, 'shutdown': 1}
+
+    def test_flush_by_bytes(self):
+        bulk = FakeBulk()
+        writer = BulkWriter(bulk, flush_docs=10000, flush_bytes=2000, flush_interval=60)
+        writer.start()
+        writer.add([{'message': 'x' * 500} for _ in range(10)])
+        writer.stop()
+        assert all(len(c) <= 3 for c in bulk.calls)
+        assert bulk.written == 10
+        assert writer.metrics()['flush_reasons'].get('bytes', 0) >= 1
+
+    def test_flush_by_age(self):
+        bulk = FakeBulk()
+        writer = BulkWriter(bulk, flush_docs=1000, flush_interval=0.1)
+        writer.start()
+        writer.add(docs(5))
+        time.sleep(0.3)
+        assert bulk.written == 5
+        writer.stop()
+        assert writer.metrics()['flush_reasons'] == {'age': 1}
+
+    def test_batches_across_sources(self):
+        bulk = FakeBulk()
+        writer = BulkWriter(bulk, flush_docs=1000, flush_interval=0.2)
+        writer.start()
+        for s in range(20):
+            writer.add(docs(3, source=f's{s}'))
+        time.sleep(0.4)
+        writer.stop()
+        # 20 malych partii -> jeden bulk
+        assert len(bulk.calls) == 1
+        assert len({d['source'] for d in bulk.calls[0]}) == 20
+
+    def test_in_flight_window(self):
+        bulk = FakeBulk(delay=0.1)
+        writer = BulkWriter(bulk, flush_docs=10, flush_interval=60, max_in_flight=3)
+        writer.start()
+        writer.add(docs(100))
+        writer.stop()
+        assert bulk.written == 100
+        assert 1 < bulk.max_active <= 3
+
+    def test_failed_send_counted(self):
+        writer = BulkWriter(FakeBulk(fail=True), flush_docs=10, flush_interval=60)
+        writer.start()
+        writer.add(docs(20))
+        writer.stop()
+        metrics = writer.metrics()
+        assert metrics['docs_failed'] == 20
+        assert metrics['docs_written'] == 0
+        assert metrics['flush_latency_ms']['max'] is not None
+
+    def test_add_blocks_when_buffer_full(self):
+        bulk = FakeBulk(delay=0.2)
+        writer = BulkWriter(bulk, flush_docs=10, flush_interval=60, max_in_flight=1, max_buffer_docs=20)
+        writer.start()
+        writer.add(docs(20))
+        time.sleep(0.05)
+        # Jedna partia w locie, bufor znowu pelny
+        writer.add(docs(10))
+        blocked = threading.Thread(target=writer.add, args=(docs(10),), daemon=True)
+        blocked.start()
+        blocked.join(0.05)
+        assert blocked.is_alive()
+        blocked.join(2)
+        assert not blocked.is_alive()
+        writer.stop()
+        assert bulk.written == 40
+
+    def test_runs_in_external_loop(self):
+        bulk = FakeBulk()
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, daemon=True)
+        thread.start()
+        try:
+            writer = BulkWriter(bulk, flush_docs=10, flush_interval=60)
+            writer.start(loop=loop)
+            writer.add(docs(25))
+            writer.stop()
+            assert bulk.written == 25
+            assert writer._thread is None
+        finally:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join(1)
+
+    def test_wait_closed_from_own_loop(self):
+        bulk = FakeBulk()
+
+        async def scenario():
+            writer = BulkWriter(bulk, flush_docs=100, flush_interval=60)
+            writer.start(loop=asyncio.get_running_loop())
+            await asyncio.sleep(0.01)
+            writer.add(docs(5))
+            # stop() z loopu writera nie moze blokowac - czekamy przez wait_closed()
+            writer.stop()
+            await writer.wait_closed()
+
+        asyncio.run(scenario())
+        assert bulk.written == 5
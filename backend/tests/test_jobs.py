@@ -0,0 +1,240 @@
+"""
+Testy zadan w tle (jobs.py)
+Unit tests for the background job manager and the chunked sync-to-es job
+"""
+
+import pytest
+import sys
+import os
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from jobs import JobLimitError, JobManager
+from elasticsearch_storage import BulkResult
+
+
+async def wait_done(job):
+    while not job.done:
+        await asyncio.sleep(0.001)
+
+
+class TestJobManager:
+    """Postep, anulowanie, limity i historia zadan"""
+
+    def test_progress_and_completion(self):
+        async def scenario():
+            manager = JobManager()
+
+            async def runner(job):
+                for _ in range(4):
+                    await asyncio.sleep(0)
+                    job.progress(processed=25, saved=25)
+
+            job = manager.submit('test', runner, total=100)
+            assert job.status == 'pending'
+            await wait_done(job)
+            return job.to_dict()
+
+        state = asyncio.run(scenario())
+        assert state['status'] == 'completed'
+        assert state['processed'] == 100 and state['saved'] == 100
+        assert state['percent'] == 100.0
+        assert state['eta_sec'] is None
+
+    def test_cancel_stops_after_current_chunk(self):
+        async def scenario():
+            manager = JobManager()
+            chunks = []
+
+            async def runner(job):
+                while not job.cancel_requested:
+                    chunks.append(1)
+                    job.progress(processed=1)
+                    await asyncio.sleep(0.001)
+
+            job = manager.submit('test', runner, total=1000)
+            while len(chunks) < 3:
+                await asyncio.sleep(0.001)
+            manager.cancel(job.id)
+            await wait_done(job)
+            return job, len(chunks)
+
+        job, chunks = asyncio.run(scenario())
+        assert job.status == 'cancelled'
+        assert job.processed == chunks < 1000
+
+    def test_concurrency_limit_and_queue(self):
+        async def scenario():
+            manager = JobManager(max_running=1, max_queued=1)
+            release = asyncio.Event()
+            running = []
+
+            async def runner(job):
+                running.append(job.id)
+                await release.wait()
+
+            first = manager.submit('test', runner)
+            await asyncio.sleep(0.01)
+            second = manager.submit('test', runner)
+            await asyncio.sleep(0.01)
+            # Pierwsze dziala, drugie czeka, trzecie nie miesci sie w kolejce
+            assert first.status == 'running' and second.status == 'pending'
+            assert running == [first.id]
+            with pytest.raises(JobLimitError):
+                manager.submit('test', runner)
+
+            # Anulowane przed startem nie zaczyna pracy
+            manager.cancel(second.id)
+            release.set()
+            await wait_done(first)
+            await wait_done(second)
+            return first, second, running, manager.metrics()
+
+        first, second, running, metrics = asyncio.run(scenario())
+        assert first.status == 'completed' and second.status == 'cancelled'
+        assert running == [first.id]
+        assert metrics['completed'] == 1 and metrics['cancelled'] == 1
+
+    def test_failure_recorded(self):
+        async def scenario():
+            manager = JobManager()
+
+            async def runner(job):
+                job.progress(processed=10)
+                raise RuntimeError("ES nie polaczony")
+
+            job = manager.submit('test', runner, total=20)
+            await wait_done(job)
+            return job
+
+        job = asyncio.run(scenario())
+        assert job.status == 'failed'
+        assert job.error == "ES nie polaczony"
+        assert job.processed == 10
+
+    def test_history_trimmed(self):
+        async def scenario():
+            manager = JobManager(max_queued=100, history=3)
+
+            async def runner(job):
+                pass
+
+            for _ in range(6):
+                await wait_done(manager.submit('test', runner))
+            return manager
+
+        manager = asyncio.run(scenario())
+        assert len(manager.list()) == 3
+
+
+class FakeStorage:
+    """bulk_index zapamietuje wielkosc porcji; _id juz zapisane daje duplikat,
+    status 'bad' - dead-letter, 'busy' - do ponowienia"""
+
+    def __init__(self):
+        self.is_connected = True
+        self.chunks = []
+        self.ids = set()
+
+    async def bulk_index(self, logs):
+        self.chunks.append(len(logs))
+        result = BulkResult()
+        for log in logs:
+            if log.get('status') == 'bad':
+                result.dead_lettered += 1
+                continue
+            if log.get('status') == 'busy':
+                result.retryable.append(log)
+                continue
+            result.saved += 1
+            if log['_id'] in self.ids:
+                result.duplicates += 1
+            self.ids.add(log['_id'])
+        return result
+
+
+class TestSyncToEsJob:
+    """Zadanie sync-to-es z main.py"""
+
+    def test_chunked_and_idempotent(self, monkeypatch):
+        import main
+
+        storage = FakeStorage()
+        monkeypatch.setattr(main, 'es_storage', storage)
+        logs = [{'_id': str(i), 'message': f'log {i}'} for i in range(2500)]
+
+        async def scenario():
+            manager = JobManager()
+            first = manager.submit('sync-to-es', lambda job: main.sync_logs_to_es(job, logs, 1000),
+                                   total=len(logs))
+            await wait_done(first)
+            second = manager.submit('sync-to-es', lambda job: main.sync_logs_to_es(job, logs, 1000),
+                                    total=len(logs))
+            await wait_done(second)
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert storage.chunks == [1000, 1000, 500] * 2
+        assert first.status == 'completed' and first.saved == 2500 and first.duplicates == 0
+        assert second.duplicates == 2500
+        assert len(storage.ids) == 2500
+
+    def test_dead_lettered_and_retryable_counted_separately(self, monkeypatch):
+        import main
+
+        class FakeWriter:
+            def __init__(self, accept):
+                self.accept = accept
+                self.requeued = []
+
+            async def requeue(self, docs):
+                taken = docs[:self.accept]
+                self.requeued.extend(taken)
+                return len(taken)
+
+        storage = FakeStorage()
+        writer = FakeWriter(accept=3)
+        monkeypatch.setattr(main, 'es_storage', storage)
+        monkeypatch.setattr(main, 'es_writer', writer)
+        logs = ([{'_id': str(i)} for i in range(10)] + [{'_id': f'b{i}', 'status': 'bad'} for i in range(2)]
+                + [{'_id': f'r{i}', 'status': 'busy'} for i in range(4)])
+
+        async def scenario():
+            job = JobManager().submit('sync-to-es', lambda job: main.sync_logs_to_es(job, logs, 100),
+                                      total=len(logs))
+            await wait_done(job)
+            return job.to_dict()
+
+        state = asyncio.run(scenario())
+        assert state['status'] == 'completed'
+        assert (state['saved'], state['dead_lettered'], state['requeued'], state['failed']) == (10, 2, 3, 1)
+        # Nieudane po wyczerpaniu prob nie gina - trafiaja do writera
+        assert [log['_id'] for log in writer.requeued] == ['r0', 'r1', 'r2']
+
+    def test_disconnect_fails_job(self, monkeypatch):
+        import main
+
+        storage = FakeStorage()
+        monkeypatch.setattr(main, 'es_storage', storage)
+        logs = [{'_id': str(i)} for i in range(30)]
+
+        original = storage.bulk_index
+
+        async def bulk_then_drop(batch):
+            result = await original(batch)
+            storage.is_connected = len(storage.chunks) < 2
+            return result
+
+        storage.bulk_index = bulk_then_drop
+
+        async def scenario():
+            job = JobManager().submit('sync-to-es', lambda job: main.sync_logs_to_es(job, logs, 10),
+                                      total=len(logs))
+            await wait_done(job)
+            return job
+
+        job = asyncio.run(scenario())
+        assert job.status == 'failed'
+        assert job.processed == 20
+        assert 'ES nie polaczony' in job.error
@@ -0,0 +1,192 @@
+"""
+Testy etapowego pipeline (pipeline.py)
+Unit tests for the bounded ingest pipeline and its backpressure
+"""
+
+import pytest
+import sys
+import os
+import threading
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pipeline import IngestPipeline
+from scheduler import SourceScheduler
+
+
+class FakeSource:
+    """Zrodlo zwracajace zawsze pelna partie (ciagly burst)"""
+
+    def __init__(self, batch=200):
+        self.config = {'type': 'fake', 'interval': 0.0, 'min_interval': 0.0}
+        self.enabled = True
+        self.running = True
+        self.last_error = None
+        self.last_check = None
+        self.backlog = True
+        self.batch = batch
+        self.produced = 0
+
+    def collect(self):
+        start = self.produced
+        self.produced += self.batch
+        return [{'message': f'log {i} ' + 'x' * 200} for i in range(start, self.produced)]
+
+
+class ThrottledSink:
+    """Wolny Elasticsearch - staly czas na kazdy bulk"""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.written = 0
+        self.calls = 0
+
+    def __call__(self, docs):
+        time.sleep(self.delay)
+        self.calls += 1
+        self.written += len(docs)
+
+
+def normalize(name, source, logs):
+    return [dict(log, source=name) for log in logs]
+
+
+def make_pipeline(sink, buffer=None, **kwargs):
+    return IngestPipeline(normalize, buffer or (lambda docs: None), sink, **kwargs)
+
+
+class TestIngestPipeline:
+    """Przeplyw danych przez etapy"""
+
+    def test_all_batches_reach_sink(self):
+        sink = ThrottledSink(delay=0.0)
+        buffered = []
+        pipeline = make_pipeline(sink, buffer=buffered.extend, queue_docs=40)
+        pipeline.start()
+        for i in range(20):
+            pipeline.submit('src', None, [{'message': str(i)}] * 10)
+        pipeline.stop()
+
+        assert sink.written == 200
+        assert len(buffered) == 200
+        assert all(doc['source'] == 'src' for doc in buffered)
+        stages = pipeline.metrics()['stages']
+        assert stages['collect']['items'] == stages['sink']['items'] == 200
+
+    def test_sink_merges_pending_batches(self):
+        sink = ThrottledSink(delay=0.05)
+        pipeline = make_pipeline(sink, queue_docs=500, sink_batch=100)
+        pipeline.start()
+        for _ in range(30):
+            pipeline.submit('src', None, [{'message': 'm'}] * 10)
+        pipeline.stop()
+
+        assert sink.written == 300
+        # Oczekujace partie sklejane w wiekszy bulk
+        assert sink.calls < 30
+
+    def test_sink_error_does_not_stop_pipeline(self):
+        calls = []
+
+        def flaky(docs):
+            calls.append(len(docs))
+            if len(calls) == 1:
+                raise ConnectionError("es down")
+
+        pipeline = make_pipeline(flaky, queue_docs=1)
+        pipeline.start()
+        pipeline.submit('src', None, [{'message': 'a'}])
+        time.sleep(0.3)
+        pipeline.submit('src', None, [{'message': 'b'}])
+        pipeline.stop()
+
+        assert len(calls) == 2
+        assert pipeline.metrics()['stages']['sink']['errors'] == 1
+
+    def test_submit_blocks_when_full(self):
+        pipeline = make_pipeline(ThrottledSink(), queue_docs=2)
+        # Etapy nie wystartowaly - kolejka normalize zapelnia sie
+        pipeline.submit('src', None, [1])
+        pipeline.submit('src', None, [2])
+        blocked = threading.Thread(target=pipeline.submit, args=('src', None, [3]), daemon=True)
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive()
+        assert pipeline.paused
+
+        pipeline.start()
+        blocked.join(2)
+        assert not blocked.is_alive()
+        pipeline.stop()
+
+    def test_paused_hysteresis(self):
+        pipeline = make_pipeline(ThrottledSink(), queue_docs=10, high_watermark=0.8, low_watermark=0.3)
+        for i in range(8):
+            pipeline.normalize_queue.put(('src', None, [i]), 1)
+        assert pipeline.paused
+        # Spadek ponizej high, ale powyzej low - nadal wstrzymane
+        for _ in range(3):
+            pipeline.normalize_queue.get_nowait()
+        assert pipeline.paused
+        for _ in range(3):
+            pipeline.normalize_queue.get_nowait()
+        assert not pipeline.paused
+        assert pipeline.paused_count == 1
+
+    def test_capacity_counts_documents(self):
+        pipeline = make_pipeline(ThrottledSink(), queue_docs=100)
+        # Jedna duza partia - 1 na 100 partii, ale 90% dokumentow
+        pipeline.submit('src', None, [{'message': 'm'}] * 90)
+        assert pipeline.paused
+        assert pipeline.metrics()['queues']['normalize'] == {'docs': 90, 'batches': 1, 'capacity': 100}
+
+        blocked = threading.Thread(target=pipeline.submit, args=('src', None, [{'message': 'm'}] * 20),
+                                   daemon=True)
+        blocked.start()
+        blocked.join(0.2)
+        assert blocked.is_alive()
+
+        pipeline.start()
+        blocked.join(2)
+        assert not blocked.is_alive()
+        pipeline.stop()
+
+
+class TestBackpressureSoak:
+    """Burst szybszy niz sink - pamiec pozostaje ograniczona"""
+
+    def test_burst_memory_is_bounded(self):
+        source = FakeSource(batch=200)
+        sink = ThrottledSink(delay=0.02)
+        pipeline = make_pipeline(sink, queue_docs=1000, sink_batch=1000)
+        scheduler = SourceScheduler(
+            lambda: {'burst': source}, pipeline.submit, tick=0.001, is_paused=lambda: pipeline.paused
+        )
+
+        max_depth = 0
+        tracemalloc.start()
+        try:
+            pipeline.start()
+            scheduler.start()
+            deadline = time.monotonic() + 1.5
+            while time.monotonic() < deadline:
+                metrics = pipeline.metrics()['queues']
+                max_depth = max(max_depth, metrics['normalize']['docs'], metrics['sink']['docs'])
+                time.sleep(0.005)
+            scheduler.stop()
+            pipeline.stop()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        assert max_depth <= 1000
+        assert pipeline.paused_count >= 1
+        assert sink.written > 0
+        # W locie co najwyzej ~2 kolejki * 1000 logow + partie w
+        # obrobce; wszystko co wyprodukowano trzymane w pamieci zajeloby
+        # wielokrotnie wiecej.
+        in_flight = source.produced - sink.written
+        assert in_flight <= 2 * 1000 + 4 * source.batch
+        assert peak < 8 * 1024 * 1024
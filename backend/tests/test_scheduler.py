@@ -0,0 +1,186 @@
+"""
+Testy harmonogramu zrodel (scheduler.py)
+Unit tests for the concurrent per-source scheduler
+"""
+
+import pytest
+import sys
+import os
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from scheduler import SourceScheduler
+
+
+class FakeSource:
+    """Zrodlo rejestrujace czasy wywolan collect()"""
+
+    def __init__(self, interval=0.05, delay=0.0, timeout=30, fail=False):
+        self.config = {'type': 'fake', 'interval': interval, 'timeout': timeout}
+        self.enabled = True
+        self.running = True
+        self.last_error = None
+        self.last_check = None
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def collect(self):
+        with self._lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        self.calls.append(time.monotonic())
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            if self.fail:
+                raise RuntimeError("boom")
+            return ['log']
+        finally:
+            with self._lock:
+                self.active -= 1
+
+
+def run_scheduler(sources, seconds, handle_logs=None, **kwargs):
+    scheduler = SourceScheduler(lambda: sources, handle_logs or (lambda *a: None), tick=0.01, **kwargs)
+    scheduler.start()
+    time.sleep(seconds)
+    scheduler.stop()
+    return scheduler
+
+
+class TestSourceScheduler:
+    """Testy izolacji i harmonogramu zrodel"""
+
+    def test_slow_source_does_not_delay_others(self):
+        fast = FakeSource(interval=0.05)
+        slow = FakeSource(interval=0.05, delay=2.0)
+        run_scheduler({'slow': slow, 'fast': fast}, 0.8, max_workers=4)
+
+        gaps = [b - a for a, b in zip(fast.calls, fast.calls[1:])]
+        assert len(fast.calls) >= 8
+        # Odstepy szybkiego zrodla pozostaja bliskie jego intervalowi
+        assert max(gaps) < 0.3
+        assert len(slow.calls) == 1
+
+    def test_no_overlapping_runs(self):
+        slow = FakeSource(interval=0.0, delay=0.1)
+        run_scheduler({'slow': slow}, 0.5)
+        assert slow.max_active == 1
+        assert len(slow.calls) >= 3
+
+    def test_per_source_interval(self):
+        often = FakeSource(interval=0.02)
+        rarely = FakeSource(interval=0.3)
+        run_scheduler({'often': often, 'rarely': rarely}, 0.5)
+        assert len(often.calls) > 3 * len(rarely.calls)
+
+    def test_timeout_marks_source(self):
+        hung = FakeSource(interval=0.05, delay=0.5, timeout=0.1)
+        scheduler = run_scheduler({'hung': hung}, 0.3)
+        assert 'Timeout' in hung.last_error
+        assert scheduler.get_schedule('hung').timeouts == 1
+
+    def test_hung_source_releases_pool_slot(self):
+        hung = FakeSource(interval=0.05, delay=1.0, timeout=0.1)
+        fast = FakeSource(interval=0.02)
+        sources = {'hung': hung, 'fast': fast}
+        scheduler = SourceScheduler(lambda: sources, lambda *a: None, max_workers=1, tick=0.01)
+        scheduler.start()
+        time.sleep(0.5)
+        hung_workers = scheduler.hung_workers
+        schedule = scheduler.get_schedule('hung').to_dict()
+        scheduler.stop()
+
+        # Jedyny watek puli jest zawieszony, a szybkie zrodlo nadal zbiera
+        assert hung_workers == 1
+        assert schedule['hung'] is True
+        assert len(hung.calls) == 1
+        assert len(fast.calls) >= 5
+
+    def test_errors_are_isolated(self):
+        broken = FakeSource(fail=True)
+        healthy = FakeSource()
+        handled = []
+        run_scheduler({'broken': broken, 'healthy': healthy}, 0.3,
+                      handle_logs=lambda name, source, logs: handled.append(name))
+        assert broken.last_error == 'boom'
+        assert set(handled) == {'healthy'}
+
+    def test_disabled_source_skipped(self):
+        stopped = FakeSource()
+        stopped.running = False
+        run_scheduler({'stopped': stopped}, 0.1)
+        assert stopped.calls == []
+
+    def test_paused_pipeline_stops_dispatch(self):
+        source = FakeSource(interval=0.01)
+        paused = threading.Event()
+        paused.set()
+        run_scheduler({'src': source}, 0.2, is_paused=paused.is_set)
+        assert source.calls == []
+
+
+class TestAdaptiveInterval:
+    """Testy adaptacyjnego intervalu (backlog / bezczynnosc / bledy)"""
+
+    def make_schedule(self, **kwargs):
+        from scheduler import SourceSchedule
+        return SourceSchedule(interval=kwargs.pop('interval', 2.0), timeout=30, **kwargs)
+
+    def test_backlog_runs_immediately(self):
+        schedule = self.make_schedule()
+        schedule.backlog = True
+        assert SourceScheduler._next_interval(schedule, 1000, failed=False) == 0.0
+        assert schedule.current_interval == 0.0
+
+    def test_idle_backs_off_to_max(self):
+        schedule = self.make_schedule(max_interval=10.0)
+        delays = [SourceScheduler._next_interval(schedule, 0, failed=False) for _ in range(10)]
+
+        assert delays[0] > 2.0
+        assert schedule.current_interval == 10.0
+        # Jitter +/- 10%
+        assert all(d <= 11.0 for d in delays)
+
+    def test_activity_resets_interval(self):
+        schedule = self.make_schedule()
+        for _ in range(5):
+            SourceScheduler._next_interval(schedule, 0, failed=False)
+        SourceScheduler._next_interval(schedule, 5, failed=False)
+        assert schedule.current_interval == 2.0
+
+    def test_errors_back_off_exponentially(self):
+        schedule = self.make_schedule(interval=1.0, max_interval=60.0)
+        for _ in range(3):
+            SourceScheduler._next_interval(schedule, 0, failed=True)
+        assert schedule.current_interval == 8.0
+        assert schedule.error_streak == 3
+
+    def test_long_error_streak_stays_at_max(self):
+        schedule = self.make_schedule(interval=1.0, max_interval=60.0)
+        schedule.error_streak = 5000
+        delay = SourceScheduler._next_interval(schedule, 0, failed=True)
+        assert schedule.current_interval == 60.0
+        assert delay <= 66.0
+        assert schedule.error_streak == 5001
+
+    def test_non_adaptive(self):
+        schedule = self.make_schedule(adaptive=False)
+        assert SourceScheduler._next_interval(schedule, 0, failed=True) == 2.0
+
+    def test_backlog_source_drains_quickly(self):
+        class BacklogSource(FakeSource):
+            def collect(self):
+                logs = super().collect()
+                self.backlog = len(self.calls) < 5
+                return logs
+
+        source = BacklogSource(interval=1.0)
+        run_scheduler({'busy': source}, 0.3)
+        assert len(source.calls) == 5
@@ -0,0 +1,849 @@
+"""
+Testy zrodel logow (MySQL / MongoDB) na atrapach polaczen
+Unit tests for database sources with fake drivers
+"""
+
+import pytest
+import sys
+import os
+import threading
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from sources import MySQLSource, MongoDBSource
+
+
+class FakeCursor:
+    """Atrapa niebuforowanego kursora mysql.connector nad lista wierszy"""
+
+    def __init__(self, table, key):
+        self.table = table
+        self.key = key
+        self.queries = []
+        self._pending = []
+
+    def execute(self, query, params=()):
+        self.queries.append((query, params))
+        limit = int(query.rsplit('LIMIT', 1)[1])
+        last = params[0]
+        self._pending = [r for r in self.table if r[self.key] > last][:limit]
+
+    def fetchmany(self, size=1):
+        batch, self._pending = self._pending[:size], self._pending[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self.cursor_kwargs = None
+
+    def cursor(self, **kwargs):
+        self.cursor_kwargs = kwargs
+        return self._cursor
+
+    def is_connected(self):
+        return True
+
+
+def make_audit_rows(count):
+    return [
+        {
+            'id': i,
+            'created_at': datetime(2024, 1, 26, 20, 30, i % 60),
+            'action': 'insert' if i % 2 else 'delete',
+            'login': f'user{i % 3}',
+            'details': f'Audit entry {i}',
+        }
+        for i in range(1, count + 1)
+    ]
+
+
+class TestMySQLCustomTable:
+    """Testy zbierania z custom tabeli (keyset pagination)"""
+
+    @pytest.fixture
+    def source(self):
+        source = MySQLSource("audit", {
+            "type": "mysql",
+            "monitor_table": "audit_log",
+            "batch_size": 10,
+            "fetch_size": 4,
+            "column_map": {"event_type": "action", "user": "login"},
+        })
+        cursor = FakeCursor(make_audit_rows(35), 'id')
+        source._connection = FakeConnection(cursor)
+        return source, cursor
+
+    def test_drains_backlog_in_one_cycle(self, source):
+        """Wszystkie strony sa pobierane w jednym collect()"""
+        src, cursor = source
+        logs = src.collect()
+
+        assert len(logs) == 35
+        assert src._last_id == 35
+        # 3 pelne strony + 1 niepelna
+        assert [params for _, params in cursor.queries] == [(0,), (10,), (20,), (30,)]
+
+    def test_unbuffered_cursor(self, source):
+        src, _ = source
+        src.collect()
+        assert src._connection.cursor_kwargs == {'dictionary': True, 'buffered': False}
+
+    def test_columns_mapped_without_reparse(self, source):
+        """Kolumny trafiaja wprost do pol ParsedLog"""
+        src, _ = source
+        log = src.collect()[0]
+
+        assert log.event_type == 'INSERT'
+        assert log.user == 'user1'
+        assert log.message == 'Audit entry 1'
+        assert log.table_name == 'audit_log'
+        assert log.timestamp == '2024-01-26T20:30:01'
+
+    def test_max_batches_limits_cycle(self, source):
+        src, _ = source
+        src.max_batches = 2
+        assert len(src.collect()) == 20
+        assert len(src.collect()) == 15
+
+    def test_column_projection(self, source):
+        src, cursor = source
+        src.monitor_columns = ['details']
+        src.collect()
+
+        query = cursor.queries[0][0]
+        assert query.startswith("SELECT `details`, `id`, `created_at`, `action`, `login` FROM `audit_log`")
+        assert "WHERE `id` > %s ORDER BY `id` ASC LIMIT 10" in query
+
+
+    def test_error_mid_result_keeps_unreturned_rows(self, source, monkeypatch):
+        src, cursor = source
+
+        class UnreadResultCursor(FakeCursor):
+            """close() z nieprzeczytanymi wierszami rzuca jak mysql.connector"""
+            with_rows = True
+
+            def fetchall(self):
+                rows, self._pending = self._pending, []
+                return rows
+
+            def close(self):
+                if self._pending:
+                    raise RuntimeError("Unread result found")
+
+        cursor = UnreadResultCursor(cursor.table, 'id')
+        src._connection = FakeConnection(cursor)
+        convert = src._row_to_log
+
+        def broken_row(row):
+            if row['id'] == 7:
+                raise ValueError("bad row")
+            return convert(row)
+
+        monkeypatch.setattr(src, '_row_to_log', broken_row)
+        logs = src.collect()
+        # Porcja fetchmany z bledem nie przesuwa klucza
+        assert [l.message for l in logs] == [f'Audit entry {i}' for i in range(1, 5)]
+        assert src._last_id == 4
+        assert src.last_error == "bad row"
+
+        monkeypatch.setattr(src, '_row_to_log', convert)
+        assert len(src.collect()) == 31
+
+
+class GeneralLogCursor:
+    """Atrapa kursora dla general_log z wlaczonym logowaniem do tabeli"""
+
+    def __init__(self):
+        self.queries = []
+        self._rows = []
+
+    def execute(self, query, params=()):
+        self.queries.append(query)
+        if query.startswith('SHOW VARIABLES'):
+            self._rows = [{'Variable_name': 'general_log', 'Value': 'ON'},
+                          {'Variable_name': 'log_output', 'Value': 'TABLE'}]
+        else:
+            self._rows = []
+
+    def fetchall(self):
+        return self._rows
+
+    def close(self):
+        pass
+
+
+class TestMySQLCapabilityCache:
+    """Testy cache sprawdzen serwera i backoffu polaczenia"""
+
+    @pytest.fixture
+    def source(self):
+        source = MySQLSource("general", {"type": "mysql", "capability_ttl": 300,
+                                         "health_check_interval": 30})
+        cursor = GeneralLogCursor()
+        conn = FakeConnection(cursor)
+        conn.pings = 0
+
+        def is_connected():
+            conn.pings += 1
+            return True
+        conn.is_connected = is_connected
+        source._connection = conn
+        return source, cursor
+
+    def test_show_variables_cached(self, source):
+        src, cursor = source
+        for _ in range(5):
+            src.collect()
+
+        show_queries = [q for q in cursor.queries if q.startswith('SHOW')]
+        assert len(show_queries) == 1
+        # 1x SHOW VARIABLES + 5x SELECT z general_log + 1 ping
+        assert src.round_trips == 7
+        assert src._connection.pings == 1
+
+    def test_error_forces_revalidation(self, source):
+        src, cursor = source
+        src.collect()
+        src._mark_connection_suspect()
+        src.collect()
+
+        assert len([q for q in cursor.queries if q.startswith('SHOW')]) == 2
+
+    def test_reconnect_backoff(self, monkeypatch):
+        import mysql.connector
+
+        attempts = []
+
+        def failing_connect(**kwargs):
+            attempts.append(kwargs)
+            raise mysql.connector.Error("Can't connect")
+
+        monkeypatch.setattr(mysql.connector, 'connect', failing_connect)
+        src = MySQLSource("down", {"type": "mysql", "reconnect_backoff": 60})
+
+        for _ in range(5):
+            src.collect()
+
+        assert len(attempts) == 1
+        assert src._reconnect_delay == 60
+        assert 'ponowna proba' in src.last_error
+
+
+class FakeChangeStream:
+    """Atrapa ChangeStream z pymongo (try_next + resume_token)"""
+
+    def __init__(self, events):
+        self.events = list(events)
+        self.resume_token = None
+        self.closed = False
+
+    def try_next(self):
+        if not self.events:
+            return None
+        change = self.events.pop(0)
+        self.resume_token = change['_id']
+        return change
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCollection:
+    def __init__(self, docs=None, stream=None, watch_error=None):
+        self.docs = docs or []
+        self.stream = stream
+        self.watch_error = watch_error
+        self.watch_kwargs = None
+
+    def watch(self, **kwargs):
+        self.watch_kwargs = kwargs
+        if self.watch_error:
+            raise self.watch_error
+        return self.stream
+
+    def find(self, *args, **kwargs):
+        return FakeFindCursor(self.docs)
+
+    def with_options(self, codec_options=None):
+        return RawCollection(self, codec_options)
+
+
+class RawCollection:
+    """Widok kolekcji zwracajacy dokumenty jako RawBSONDocument"""
+
+    def __init__(self, collection, codec_options):
+        self.collection = collection
+        self.codec_options = codec_options
+
+    def find(self, *args, **kwargs):
+        import bson
+        return FakeFindCursor(self.codec_options.document_class(bson.encode(d))
+                              for d in self.collection.docs)
+
+
+class FakeFindCursor(list):
+    def limit(self, n):
+        return FakeFindCursor(self[:n])
+
+
+class FakeMongoClient(dict):
+    """client[db][coll] -> FakeCollection"""
+
+    def __init__(self, database, collections):
+        super().__init__({database: FakeDatabase(collections)})
+
+
+class FakeDatabase(dict):
+    listings = 0
+    stream = None
+    watch_kwargs = None
+
+    def list_collection_names(self):
+        self.listings += 1
+        return list(self.keys())
+
+    def watch(self, pipeline=None, **kwargs):
+        self.watch_kwargs = dict(kwargs, pipeline=pipeline)
+        return self.stream
+
+
+def change_event(n, op, doc=None):
+    event = {
+        '_id': {'_data': f'token-{n}'},
+        'operationType': op,
+        'wallTime': datetime(2024, 1, 26, 20, 30, n),
+        'ns': {'db': 'app', 'coll': 'orders'},
+        'documentKey': {'_id': n},
+    }
+    if doc is not None:
+        event['fullDocument'] = doc
+    return event
+
+
+class TestMongoChangeStream:
+    """Testy trybu change stream w MongoDBSource"""
+
+    def make_source(self, tmp_path, collection, **config):
+        source = MongoDBSource("mongo", {"type": "mongodb", "database": "app",
+                                         "collection": "orders",
+                                         "state_dir": str(tmp_path), **config})
+        source._client = FakeMongoClient("app", {"orders": collection})
+        return source
+
+    def test_emits_change_events(self, tmp_path):
+        stream = FakeChangeStream([
+            change_event(1, 'insert', {'_id': 1, 'message': 'created'}),
+            change_event(2, 'update', {'_id': 1, 'message': 'paid'}),
+            change_event(3, 'delete'),
+        ])
+        source = self.make_source(tmp_path, FakeCollection(stream=stream))
+        source._token_loaded = True
+        source._initial_load_done = True
+
+        logs = source.collect()
+
+        assert [log.event_type for log in logs] == ['INSERT', 'UPDATE', 'DELETE']
+        assert logs[1].message == 'paid'
+        assert logs[2].timestamp == '2024-01-26T20:30:03'
+        assert all(log.table_name == 'orders' for log in logs)
+        # Resume token zdarzenia jest jego pozycja (deterministyczne _id w ES)
+        assert [log.position for log in logs] == ['token-1', 'token-2', 'token-3']
+
+    def test_resume_token_persisted(self, tmp_path):
+        stream = FakeChangeStream([change_event(1, 'insert', {'_id': 1})])
+        source = self.make_source(tmp_path, FakeCollection(stream=stream))
+        source.collect()
+
+        # Nowa instancja (restart) wznawia od zapisanego tokena
+        collection = FakeCollection(stream=FakeChangeStream([]))
+        restarted = self.make_source(tmp_path, collection)
+        assert restarted.collect() == []
+        assert collection.watch_kwargs['resume_after'] == {'_data': 'token-1'}
+
+    def test_initial_load_without_token(self, tmp_path):
+        collection = FakeCollection(docs=[{'_id': 1, 'name': 'a'}, {'_id': 2, 'name': 'b'}],
+                                    stream=FakeChangeStream([]))
+        source = self.make_source(tmp_path, collection)
+
+        logs = source.collect()
+        assert [log.event_type for log in logs] == ['INITIAL_LOAD', 'INITIAL_LOAD']
+        assert source.collect() == []
+
+    def test_fallback_to_diff_on_standalone(self, tmp_path):
+        from pymongo.errors import OperationFailure
+
+        error = OperationFailure("The $changeStream stage is only supported on replica sets",
+                                 code=40573)
+        collection = FakeCollection(docs=[{'_id': 1, 'name': 'a'}], watch_error=error)
+        source = self.make_source(tmp_path, collection)
+
+        logs = source.collect()
+        assert source._change_streams_supported is False
+        assert [log.event_type for log in logs] == ['INITIAL_LOAD']
+
+        collection.docs.append({'_id': 2, 'name': 'b'})
+        assert [log.event_type for log in source.collect()] == ['INSERT']
+
+    def test_change_stream_mode_without_fallback(self, tmp_path):
+        from pymongo.errors import OperationFailure
+
+        error = OperationFailure("not supported", code=40573)
+        source = self.make_source(tmp_path, FakeCollection(docs=[{'_id': 1}], watch_error=error),
+                                  mode='change_stream')
+
+        assert source.collect() == []
+        assert 'replica set' in source.last_error
+
+
+def match_query(doc, query):
+    """Minimalny matcher zapytan uzywanych przez skan przyrostowy"""
+    for key, cond in query.items():
+        if key == '$or':
+            if not any(match_query(doc, sub) for sub in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = doc.get(key)
+            if '$gt' in cond and not value > cond['$gt']:
+                return False
+            if '$lte' in cond and not value <= cond['$lte']:
+                return False
+            if '$in' in cond and value not in cond['$in']:
+                return False
+        elif doc.get(key) != cond:
+            return False
+    return True
+
+
+class QueryCursor(list):
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            self.sort_in_place(field, direction)
+        return self
+
+    def sort_in_place(self, field, direction):
+        list.sort(self, key=lambda d: d.get(field), reverse=direction < 0)
+
+    def limit(self, n):
+        return QueryCursor(self[:n])
+
+    def batch_size(self, n):
+        return self
+
+
+class QueryCollection(FakeCollection):
+    """Kolekcja z obsluga zapytan zakresowych i projekcji"""
+
+    def __init__(self, docs):
+        super().__init__(docs=docs)
+        self.finds = 0
+        self.counts = 0
+
+    def find(self, query=None, projection=None):
+        self.finds += 1
+        docs = [d for d in self.docs if match_query(d, query or {})]
+        if projection:
+            docs = [{k: d[k] for k in d if k in projection or k == '_id'} for d in docs]
+        return QueryCursor(docs)
+
+    def count_documents(self, query):
+        self.counts += 1
+        return sum(1 for d in self.docs if match_query(d, query))
+
+
+class TestMongoIncremental:
+    """Testy skanu przyrostowego po watermarku"""
+
+    def make_source(self, tmp_path, docs, **config):
+        source = MongoDBSource("mongo", {"type": "mongodb", "database": "app",
+                                         "collection": "orders", "mode": "incremental",
+                                         "reconcile_interval": 0, "state_dir": str(tmp_path),
+                                         **config})
+        collection = QueryCollection(docs)
+        source._client = FakeMongoClient("app", {"orders": collection})
+        return source, collection
+
+    def test_new_documents_by_id(self, tmp_path):
+        source, coll = self.make_source(tmp_path, [{'_id': i, 'name': f'd{i}'} for i in range(1, 4)],
+                                        batch_size=2)
+        assert [l.event_type for l in source.collect()] == ['INITIAL_LOAD'] * 3
+
+        coll.docs.extend({'_id': i, 'name': f'd{i}'} for i in range(4, 9))
+        logs = source.collect()
+        assert [l.message for l in logs] == [f'd{i}' for i in range(4, 9)]
+        assert all(l.event_type == 'INSERT' for l in logs)
+        assert source.collect() == []
+
+    def test_watermark_survives_restart(self, tmp_path):
+        source, coll = self.make_source(tmp_path, [{'_id': 1, 'name': 'a'}])
+        source.collect()
+
+        restarted, coll = self.make_source(tmp_path, [{'_id': 1, 'name': 'a'}, {'_id': 2, 'name': 'b'}])
+        assert [l.message for l in restarted.collect()] == ['b']
+
+    def test_updated_at_watermark_detects_updates(self, tmp_path):
+        docs = [{'_id': 1, 'name': 'a', 'updatedAt': 10}, {'_id': 2, 'name': 'b', 'updatedAt': 10}]
+        source, coll = self.make_source(tmp_path, docs, watermark_field='updatedAt')
+        source.collect()
+        source._reconcile_once()
+
+        coll.docs[0].update(name='a2', updatedAt=11)
+        coll.docs.append({'_id': 3, 'name': 'c', 'updatedAt': 11})
+        logs = source.collect()
+        assert [(l.event_type, l.message) for l in logs] == [('UPDATE', 'a2'), ('INSERT', 'c')]
+
+    def test_positions_distinguish_reverted_updates(self, tmp_path):
+        docs = [{'_id': 1, 'name': 'a', 'updatedAt': 10}]
+        source, coll = self.make_source(tmp_path, docs, watermark_field='updatedAt')
+        source.collect()
+        source._reconcile_once()
+
+        positions = []
+        for name, updated in (('b', 11), ('a', 12)):
+            coll.docs[0].update(name=name, updatedAt=updated)
+            positions += [l.position for l in source.collect()]
+        assert positions == ['orders:1:UPDATE:11', 'orders:1:UPDATE:12']
+
+    def test_auto_fallback_restart_resumes_from_watermark(self, tmp_path):
+        from pymongo.errors import OperationFailure
+
+        def standalone(docs):
+            source, coll = self.make_source(tmp_path, docs, mode='auto', watermark_field='_id')
+            coll.watch_error = OperationFailure("replica sets only", code=40573)
+            return source, coll
+
+        docs = [{'_id': i, 'name': f'd{i}'} for i in range(1, 6)]
+        source, coll = standalone(docs)
+        assert [l.event_type for l in source.collect()] == ['INITIAL_LOAD'] * 5
+        assert source._change_streams_supported is False
+
+        # Restart: nieudany watch() nie moze pominac wczytania watermarku
+        restarted, coll = standalone(docs + [{'_id': 6, 'name': 'd6'}])
+        logs = restarted.collect()
+        assert [(l.event_type, l.message) for l in logs] == [('INSERT', 'd6')]
+
+    def test_reconciliation_detects_deletes(self, tmp_path):
+        source, coll = self.make_source(tmp_path, [{'_id': i} for i in range(1, 6)])
+        source.collect()
+        source._reconcile_once()
+
+        del coll.docs[1:3]
+        source._reconcile_once()
+        logs = source.collect()
+        assert sorted(l.message for l in logs) == ['Usuniety dokument: 2', 'Usuniety dokument: 3']
+        assert all(l.event_type == 'DELETE' for l in logs)
+
+    def test_reconciliation_lists_only_changed_ranges(self, tmp_path):
+        source, coll = self.make_source(tmp_path, [{'_id': i} for i in range(1, 11)],
+                                        reconcile_batch=3, reconcile_pause=0)
+        source.collect()
+        source._reconcile_once()
+        assert [r[:2] for r in source._ranges] == [[3, 3], [6, 3], [9, 3], [10, 1]]
+
+        # Usuniecie w jednym zakresie i nowe dokumenty w ogonie
+        coll.docs.remove({'_id': 5})
+        coll.docs.extend({'_id': i} for i in (11, 12))
+        coll.finds = coll.counts = 0
+        source._reconcile_once()
+        # 4 liczenia, listowane tylko zmieniony zakres i ogon
+        assert coll.counts == 4
+        assert coll.finds == 2
+        assert [r[:2] for r in source._ranges] == [[3, 3], [6, 2], [9, 3], [10, 1], [12, 2]]
+        logs = source.collect()
+        assert [l.message for l in logs if l.event_type == 'DELETE'] == ['Usuniety dokument: 5']
+
+    def test_recently_seen_deleted_before_reconcile(self, tmp_path):
+        source, coll = self.make_source(tmp_path, [{'_id': 1}])
+        source.collect()
+        source._reconcile_once()
+
+        coll.docs.append({'_id': 2})
+        source.collect()
+        coll.docs.pop()
+        source._reconcile_once()
+        assert source._recent_ids == {}
+        assert [l.message for l in source.collect()] == ['Usuniety dokument: 2']
+
+
+class TestMongoSnapshotDiff:
+    """Testy trybu diff na surowych dokumentach BSON"""
+
+    @pytest.fixture
+    def source(self, tmp_path):
+        from bson import ObjectId
+
+        docs = [{'_id': ObjectId(), 'name': 'a'}, {'_id': 7, 'name': 'b'}, {'_id': 'k', 'name': 'c'}]
+        collection = FakeCollection(docs=docs)
+        source = MongoDBSource("mongo", {"type": "mongodb", "database": "app",
+                                         "collection": "orders", "mode": "diff",
+                                         "state_dir": str(tmp_path)})
+        source._client = FakeMongoClient("app", {"orders": collection})
+        return source, collection
+
+    def test_detects_insert_update_delete(self, source):
+        src, coll = source
+        assert len(src.collect()) == 3
+
+        removed = coll.docs.pop(0)
+        coll.docs[0]['name'] = 'b2'
+        coll.docs.append({'_id': 8, 'name': 'd'})
+        logs = {l.event_type: l for l in src.collect()}
+
+        assert logs['UPDATE'].message == 'b2'
+        assert logs['INSERT'].message == 'd'
+        assert logs['DELETE'].message == f"Usuniety dokument: {removed['_id']}"
+        assert src.collect() == []
+
+    def test_reverted_document_gets_new_id(self, source):
+        from elasticsearch_storage import document_id
+
+        src, coll = source
+        src.collect()
+        ids = []
+        for name in ('b2', 'b', 'b2'):
+            coll.docs[1]['name'] = name
+            log = src.collect()[0]
+            ids.append(document_id(log.to_dict(), log.position))
+        # Powrot do wczesniejszego stanu to nowe zdarzenie, nie duplikat
+        assert len(set(ids)) == 3
+
+    def test_hashes_are_compact(self, source):
+        src, _ = source
+        src.collect()
+        assert all(isinstance(k, bytes) and isinstance(v, int) for k, v in src._doc_hashes.items())
+
+    def test_id_element_roundtrip(self):
+        import bson
+        from bson import ObjectId
+        from bson.raw_bson import RawBSONDocument
+
+        for value in (ObjectId(), 42, 2 ** 40, 'key', {'a': 1}):
+            raw_doc = RawBSONDocument(bson.encode({'_id': value, 'x': 1}))
+            element = MongoDBSource._raw_id_element(raw_doc)
+            assert MongoDBSource._id_from_element(element) == value
+
+
+class FakeTailableCursor:
+    """Atrapa tailable cursora - iteracja konczy sie gdy brak nowych wpisow"""
+
+    def __init__(self, profile, query, projection):
+        self.profile = profile
+        self.query = query
+        self.projection = projection
+        self.position = 0
+        self.alive = True
+
+    def max_await_time_ms(self, ms):
+        return self
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        while self.position < len(self.profile.docs):
+            doc = self.profile.docs[self.position]
+            self.position += 1
+            if 'ts' in self.query and not doc['ts'] >= self.query['ts']['$gte']:
+                continue
+            return {k: v for k, v in doc.items() if k in self.projection or k == '_id'}
+        raise StopIteration
+
+    def close(self):
+        self.alive = False
+
+
+class FakeProfileCollection:
+    def __init__(self):
+        self.docs = []
+        self.cursors = []
+
+    def find(self, query, projection, cursor_type=None):
+        cursor = FakeTailableCursor(self, query, projection)
+        self.cursors.append((cursor, cursor_type))
+        return cursor
+
+
+class ProfilingDatabase(FakeDatabase):
+    def __init__(self, profile):
+        super().__init__({'system.profile': profile})
+        self.profile_checks = 0
+
+    def command(self, name, level):
+        self.profile_checks += 1
+        return {'was': 2}
+
+
+class TestMongoProfiler:
+    """Testy tailable cursora na system.profile"""
+
+    @pytest.fixture
+    def source(self):
+        profile = FakeProfileCollection()
+        source = MongoDBSource("profiler", {"type": "mongodb", "database": "app"})
+        db = ProfilingDatabase(profile)
+        source._client = {"app": db}
+        return source, profile, db
+
+    def profile_entry(self, second, op='query', **extra):
+        return {'_id': second, 'op': op, 'ns': 'app.orders',
+                'ts': datetime(2024, 1, 26, 20, 30, second), 'millis': 12,
+                'docsExamined': 500, 'nreturned': 3, 'execStats': {'big': 'x' * 100}, **extra}
+
+    def test_tails_without_reopening(self, source):
+        from pymongo import CursorType
+
+        src, profile, db = source
+        profile.docs.append(self.profile_entry(1))
+        first = src.collect()
+        profile.docs.append(self.profile_entry(2, op='insert'))
+        second = src.collect()
+
+        assert [l.event_type for l in first + second] == ['SELECT', 'INSERT']
+        assert len(profile.cursors) == 1
+        assert profile.cursors[0][1] == CursorType.TAILABLE_AWAIT
+        assert db.profile_checks == 1
+
+    def test_emits_query_metrics(self, source):
+        src, profile, _ = source
+        profile.docs.append(self.profile_entry(1))
+        log = src.collect()[0]
+
+        assert (log.duration_ms, log.docs_examined, log.docs_returned) == (12, 500, 3)
+        assert log.table_name == 'orders'
+        assert 'execStats' not in log.raw
+
+    def test_reopens_from_ts_watermark(self, source):
+        src, profile, _ = source
+        profile.docs.append(self.profile_entry(1))
+        src.collect()
+        src._profile_cursor.alive = False
+        profile.docs.append(self.profile_entry(2))
+
+        assert len(src.collect()) == 1
+        assert profile.cursors[-1][0].query == {'ts': {'$gte': datetime(2024, 1, 26, 20, 30, 1)}}
+
+    def test_reopen_keeps_entries_from_same_millisecond(self, source):
+        src, profile, _ = source
+        profile.docs.append(self.profile_entry(1))
+        src.collect()
+        src._profile_cursor.alive = False
+        # Drugi wpis z tym samym ts dopisany po zamknieciu kursora
+        profile.docs.append({**self.profile_entry(1), '_id': 'b', 'op': 'insert'})
+        profile.docs.append(self.profile_entry(2))
+
+        logs = src.collect()
+        assert [l.event_type for l in logs] == ['INSERT', 'SELECT']
+        assert src.collect() == []
+        # Wpisy z tego samego ts rozroznia numer kolejny
+        assert logs[0].position == f"profile:{datetime(2024, 1, 26, 20, 30, 1).isoformat()}:1"
+
+
+class TestMongoDatabaseMode:
+    """Testy monitorowania wielu kolekcji jednym zrodlem"""
+
+    def make_source(self, tmp_path, existing, **config):
+        source = MongoDBSource("appdb", {"type": "mongodb", "database": "app",
+                                         "state_dir": str(tmp_path), **config})
+        client = FakeMongoClient("app", existing)
+        source._client = client
+        return source, client["app"]
+
+    def test_single_stream_routes_by_namespace(self, tmp_path):
+        source, db = self.make_source(tmp_path, {'orders': FakeCollection(), 'users': FakeCollection(),
+                                                 'audit': FakeCollection()},
+                                      collection='*')
+        events = [change_event(1, 'insert', {'_id': 1}), change_event(2, 'insert', {'_id': 2})]
+        events[1]['ns']['coll'] = 'users'
+        db.stream = FakeChangeStream(events)
+        source._token_loaded = True
+        source._initial_load_done = True
+
+        logs = source.collect()
+        assert [l.table_name for l in logs] == ['orders', 'users']
+        assert db.watch_kwargs['pipeline'] == [{'$match': {'ns.coll': {'$not': {'$regex': '^system\\.'}}}}]
+
+    def test_glob_patterns_filter_stream(self, tmp_path):
+        source, db = self.make_source(tmp_path, {}, collections=['orders_*', 'users'])
+        db.stream = FakeChangeStream([])
+        source._token_loaded = True
+        source._initial_load_done = True
+        source.collect()
+
+        assert db.watch_kwargs['pipeline'] == [{'$match': {'ns.coll': {'$regex': '^orders_.*$|^users$'}}}]
+
+    def test_fallback_scans_matching_collections(self, tmp_path):
+        collections = {
+            'orders_2024': FakeCollection(docs=[{'_id': 1, 'name': 'a'}]),
+            'orders_2025': FakeCollection(docs=[{'_id': 1, 'name': 'b'}]),
+            'users': FakeCollection(docs=[{'_id': 1, 'name': 'c'}]),
+        }
+        source, db = self.make_source(tmp_path, collections, collection='orders_*', mode='diff')
+
+        logs = source.collect()
+        assert sorted((l.table_name, l.message) for l in logs) == [('orders_2024', 'a'), ('orders_2025', 'b')]
+        assert all(l.source == 'appdb' for l in logs)
+        assert all(c._get_client() is source._client for c in source._children.values())
+
+        collections['orders_2024'].docs.append({'_id': 2, 'name': 'new'})
+        for _ in range(3):
+            logs = source.collect() or logs
+        assert [(l.table_name, l.event_type) for l in logs] == [('orders_2024', 'INSERT')]
+        # Lista kolekcji pobierana raz w ciagu metadata_ttl
+        assert db.listings == 1
+
+    def test_children_share_one_reconcile_worker(self, tmp_path):
+        collections = {f'orders_{i}': QueryCollection([{'_id': 1}]) for i in range(3)}
+        source, db = self.make_source(tmp_path, collections, collection='orders_*',
+                                      mode='incremental', reconcile_interval=3600)
+        source.running = True
+        source.collect()
+        try:
+            assert len(source._children) == 3
+            assert source._reconcile_thread is not None and source._reconcile_thread.is_alive()
+            assert all(c._reconcile_thread is None for c in source._children.values())
+            names = [t.name for t in threading.enumerate() if t.name.startswith('reconcile-appdb')]
+            assert names == ['reconcile-appdb']
+        finally:
+            source.enabled = False
+
+    def test_close_stops_reconcile_worker(self, tmp_path):
+        collections = {f'orders_{i}': QueryCollection([{'_id': 1}]) for i in range(2)}
+        source, db = self.make_source(tmp_path, collections, collection='orders_*',
+                                      mode='incremental', reconcile_interval=3600)
+        source.running = True
+        source.collect()
+        thread = source._reconcile_thread
+        children = list(source._children.values())
+
+        source.close()
+        # Watek czekajacy reconcile_interval konczy sie od razu
+        assert not thread.is_alive()
+        assert not source.enabled and not source.running
+        assert all(not child.enabled for child in children)
+        assert source._children == {} and source._client is None
+
+    def test_children_follow_parent_client(self, tmp_path, capsys):
+        collections = {f'orders_{i}': FakeCollection(docs=[{'_id': 1}]) for i in range(3)}
+        source, db = self.make_source(tmp_path, collections, collection='orders_*', mode='diff')
+        capsys.readouterr()
+        source.collect()
+        # Adres serwera logowany raz, przez rodzica - nie dla kazdej kolekcji
+        assert 'URI:' not in capsys.readouterr().out
+
+        # Rodzic polaczyl sie ponownie - dzieci uzywaja nowego klienta
+        reconnected = FakeMongoClient("app", collections)
+        source._client = reconnected
+        assert all(c._get_client() is reconnected for c in source._children.values())
+        assert all(c._client is None for c in source._children.values())
+
+    def test_collection_existence_cached(self, tmp_path):
+        source, db = self.make_source(tmp_path, {'orders': FakeCollection(docs=[{'_id': 1}])},
+                                      collection='orders', mode='diff')
+        for _ in range(5):
+            source.collect()
+        assert db.listings == 1
@@ -0,0 +1,184 @@
+"""
+Testy spoola dyskowego (spool.py) i odtwarzania w BulkWriter
+Unit tests for the disk-backed spool used during Elasticsearch outages
+"""
+
+import pytest
+import sys
+import os
+import asyncio
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from spool import DiskSpool, HEADER
+from es_writer import BulkWriter
+
+
+def batch(start, n=10):
+    return [{'seq': i, 'message': f'log {i}'} for i in range(start, start + n)]
+
+
+def drain(spool):
+    out = []
+    while True:
+        docs = spool.peek()
+        if docs is None:
+            return out
+        out.extend(d['seq'] for d in docs)
+        spool.commit()
+
+
+class TestDiskSpool:
+    """Zapis, odczyt, segmenty i odpornosc na uszkodzenia"""
+
+    def test_roundtrip_in_order(self, tmp_path):
+        spool = DiskSpool(str(tmp_path), segment_bytes=1024)
+        for start in range(0, 100, 10):
+            assert spool.append(batch(start))
+        assert spool.has_pending
+        assert drain(spool) == list(range(100))
+        assert not spool.has_pending
+        # Odtworzone segmenty (poza aktywnym) sa usuwane
+        assert len([f for f in os.listdir(tmp_path) if f.endswith('.seg')]) == 1
+
+    def test_peek_without_commit_repeats(self, tmp_path):
+        spool = DiskSpool(str(tmp_path))
+        spool.append(batch(0))
+        first = spool.peek()
+        assert spool.peek() == first
+        spool.commit()
+        assert spool.peek() is None
+
+    def test_cursor_survives_restart(self, tmp_path):
+        spool = DiskSpool(str(tmp_path), segment_bytes=1024)
+        for start in range(0, 60, 10):
+            spool.append(batch(start))
+        for _ in range(2):
+            spool.peek()
+            spool.commit()
+        spool.close()
+
+        reopened = DiskSpool(str(tmp_path), segment_bytes=1024)
+        assert drain(reopened) == list(range(20, 60))
+        reopened.append(batch(60))
+        assert drain(reopened) == list(range(60, 70))
+
+    def test_corrupt_record_skipped(self, tmp_path):
+        spool = DiskSpool(str(tmp_path), fsync='always')
+        for start in (0, 10, 20):
+            spool.append(batch(start))
+        spool.close()
+        path = os.path.join(str(tmp_path), '00000001.seg')
+        with open(path, 'r+b') as f:
+            f.seek(0)
+            length, _ = HEADER.unpack(f.read(HEADER.size))
+            f.seek(HEADER.size + length + HEADER.size + 5)
+            f.write(b'#')
+
+        reopened = DiskSpool(str(tmp_path))
+        assert drain(reopened) == list(range(0, 10)) + list(range(20, 30))
+        assert reopened.corrupt_records == 1
+
+    def test_truncated_tail_ignored(self, tmp_path):
+        spool = DiskSpool(str(tmp_path))
+        spool.append(batch(0))
+        spool.append(batch(10))
+        spool.close()
+        path = os.path.join(str(tmp_path), '00000001.seg')
+        with open(path, 'r+b') as f:
+            f.truncate(os.path.getsize(path) - 7)
+
+        assert drain(DiskSpool(str(tmp_path))) == list(range(10))
+
+    def test_size_cap_drops_oldest_segment(self, tmp_path):
+        spool = DiskSpool(str(tmp_path), segment_bytes=1024, max_bytes=3000)
+        for start in range(0, 300, 10):
+            spool.append(batch(start))
+        assert spool.dropped_segments > 0
+        remaining = drain(spool)
+        # Zostaja najnowsze dane, w kolejnosci
+        assert remaining == sorted(remaining)
+        assert remaining[-1] == 299
+        assert spool.metrics()['pending_bytes'] == 0
+
+    def test_rejects_record_larger_than_cap(self, tmp_path):
+        spool = DiskSpool(str(tmp_path), max_bytes=100)
+        assert not spool.append(batch(0, n=50))
+        assert spool.rejected_docs == 50
+
+    def test_invalid_fsync_policy(self, tmp_path):
+        with pytest.raises(ValueError):
+            DiskSpool(str(tmp_path), fsync='sometimes')
+
+
+class FlakyES:
+    """Fake ES, ktory mozna wylaczyc i wlaczyc w trakcie testu"""
+
+    def __init__(self):
+        self.up = True
+        self.received = []
+        self._lock = threading.Lock()
+
+    async def bulk(self, docs):
+        await asyncio.sleep(0.002)
+        if not self.up:
+            raise ConnectionError("es down")
+        with self._lock:
+            self.received.extend(d['seq'] for d in docs)
+        return len(docs)
+
+
+class TestWriterOutage:
+    """ES znika i wraca - zaden log nie ginie"""
+
+    def test_zero_loss_across_outage(self, tmp_path, monkeypatch):
+        monkeypatch.setattr('es_writer.REPLAY_IDLE', 0.01)
+        es = FlakyES()
+        spool = DiskSpool(str(tmp_path), segment_bytes=4096)
+        writer = BulkWriter(
+            es.bulk, flush_docs=50, flush_interval=0.05, spool=spool, replay_rate=0, replay_backoff=0.05
+        )
+        writer.start()
+        produced = 0
+        for step in range(60):
+            if step == 15:
+                es.up = False
+            if step == 40:
+                es.up = True
+            writer.add(batch(produced, n=20))
+            produced += 20
+            time.sleep(0.01)
+
+        deadline = time.monotonic() + 5
+        while len(set(es.received)) < produced and time.monotonic() < deadline:
+            time.sleep(0.05)
+        writer.stop()
+
+        assert set(es.received) == set(range(produced))
+        metrics = writer.metrics()
+        assert metrics['docs_spooled'] > 0
+        assert metrics['spool']['docs_replayed'] == metrics['docs_spooled']
+        assert metrics['docs_failed'] == 0
+
+    def test_unavailable_goes_straight_to_spool(self, tmp_path):
+        es = FlakyES()
+        spool = DiskSpool(str(tmp_path))
+        writer = BulkWriter(es.bulk, flush_docs=10, flush_interval=60, spool=spool, is_available=lambda: False)
+        writer.start()
+        writer.add(batch(0, n=30))
+        writer.stop()
+
+        assert es.received == []
+        assert drain(DiskSpool(str(tmp_path))) == list(range(30))
+
+    def test_requeue_from_job_goes_to_spool(self, tmp_path):
+        es = FlakyES()
+        spool = DiskSpool(str(tmp_path))
+        writer = BulkWriter(es.bulk, spool=spool, is_available=lambda: False)
+
+        accepted = asyncio.run(writer.requeue(batch(0, n=5)))
+        assert accepted == 5
+        assert writer.metrics()['docs_spooled'] == 5
+        assert drain(spool) == list(range(5))
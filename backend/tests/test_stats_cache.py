@@ -0,0 +1,135 @@
+"""
+Testy cache statystyk (stats_cache.py)
+Unit tests for the per-minute stats ring maintained at ingest time
+"""
+
+import pytest
+import sys
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from stats_cache import StatsCache
+
+
+def log(minutes_ago=0, severity='INFO', event_type='INSERT', source='app', **extra):
+    ts = datetime.now() - timedelta(minutes=minutes_ago)
+    return {'timestamp': ts.isoformat(), 'severity': severity, 'event_type': event_type,
+            'source': source, 'source_type': 'file', **extra}
+
+
+def warm(cache, hours):
+    """Udaj, ze proces dziala dluzej niz okno"""
+    cache.covered_since -= hours * 60 + 1
+
+
+class TestStatsCache:
+    """Liczniki minutowe i odpowiedzi dla okien"""
+
+    def test_counts_by_dimension(self):
+        cache = StatsCache(minutes=120)
+        cache.add([log(1), log(2, severity='ERROR', source='db'), log(30, event_type='DELETE')])
+        cache.add([{'timestamp': datetime.now().isoformat(), 'level': 'WARNING', 'operation': 'SELECT'}])
+
+        stats = cache.stats(1)
+        assert stats['total_logs'] == 4
+        assert stats['by_severity'] == {'INFO': 2, 'ERROR': 1, 'WARNING': 1}
+        assert stats['by_event_type'] == {'INSERT': 2, 'DELETE': 1, 'SELECT': 1}
+        assert stats['by_source'] == {'app': 2, 'db': 1, 'unknown': 1}
+        assert stats['by_source_type'] == {'file': 3}
+
+    def test_window_excludes_older_minutes(self):
+        cache = StatsCache(minutes=1440)
+        cache.add([log(5), log(90), log(600)])
+        assert cache.stats(1)['total_logs'] == 1
+        assert cache.stats(2)['total_logs'] == 2
+        assert cache.stats(24)['total_logs'] == 3
+
+    def test_timeline_buckets(self):
+        cache = StatsCache(minutes=120)
+        now = datetime.now().isoformat()
+        cache.add([log(severity='ERROR', timestamp=now), log(timestamp=now), log(3)])
+        stats = cache.stats(1)
+
+        assert stats['interval'] == '1m'
+        assert len(stats['timeline']) in (61, 62)  # pelne minuty okna (bez dziur)
+        assert sum(point['count'] for point in stats['timeline']) == 3
+        errors = [point for point in stats['level_timeline'] if 'ERROR' in point]
+        assert len(errors) == 1 and errors[0]['INFO'] == 1
+        assert stats['timeline'][-1]['timestamp'].endswith(':00.000Z')
+
+    def test_labels_are_utc(self, monkeypatch):
+        # Strefa inna niz UTC - etykiety nie moga byc czasem lokalnym z "Z"
+        monkeypatch.setenv('TZ', 'XXX-02')
+        time.tzset()
+        try:
+            cache = StatsCache(minutes=120)
+            event = datetime.now(timezone(timedelta(hours=5))) - timedelta(minutes=5)
+            cache.add([log(timestamp=event.isoformat())])
+            stats = cache.stats(1)
+        finally:
+            monkeypatch.undo()
+            time.tzset()
+
+        expected = event.astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:00.000Z')
+        assert [point['timestamp'] for point in stats['timeline'] if point['count']] == [expected]
+
+    def test_ring_reuses_slots(self):
+        cache = StatsCache(minutes=60)
+        cache.add([log(70)])   # starsze niz pierscien - pominiete
+        assert cache.metrics()['logs_skipped'] == 1
+
+        # Kubelek sprzed godziny w tym samym slocie jest nadpisywany, a nie sumowany
+        cache.add([log(0)])
+        for bucket in cache._ring:
+            if bucket is not None:
+                bucket.minute -= 60
+        cache.add([log(0)])
+        assert cache.stats(1)['total_logs'] == 1
+        assert cache.metrics()['buckets'] == 1
+
+    def test_future_timestamps_count_as_now(self):
+        cache = StatsCache(minutes=60)
+        cache.add([log(-5)])
+        assert cache.stats(1)['total_logs'] == 1
+
+    def test_lookup_only_when_window_covered(self):
+        cache = StatsCache(minutes=1440)
+        cache.add([log(1)])
+        assert cache.lookup(1) is None        # proces dziala krocej niz okno
+        warm(cache, 1)
+        assert cache.lookup(1)['total_logs'] == 1
+        assert cache.lookup(48) is None       # dluzej niz pierscien
+        assert cache.metrics()['hits'] == 1
+        assert cache.metrics()['misses'] == 2
+
+    def test_result_shared_until_new_logs(self):
+        cache = StatsCache(minutes=60, max_age=0)
+        cache.add([log(1)])
+        first = cache.stats(1)
+        assert cache.stats(1) is first          # bez nowych logow - ten sam wynik
+        cache.add([log(0)])
+        assert cache.stats(1)['total_logs'] == 2  # max_age=0 - zawsze aktualny
+
+        cache = StatsCache(minutes=60, max_age=60)
+        cache.add([log(1)])
+        cache.stats(1)
+        cache.add([log(0)])
+        assert cache.stats(1)['total_logs'] == 1  # w granicach max_age
+
+    def test_clear(self):
+        cache = StatsCache(minutes=60)
+        cache.add([log(1)])
+        cache.clear()
+        assert cache.stats(1)['total_logs'] == 0
+
+    def test_clear_resets_coverage(self):
+        cache = StatsCache(minutes=120)
+        warm(cache, 1)
+        cache.add([log(1)])
+        assert cache.lookup(1)['total_logs'] == 1
+        cache.clear()
+        # Pusty pierscien nie moze odpowiadac za okno sprzed czyszczenia
+        assert cache.lookup(1) is None
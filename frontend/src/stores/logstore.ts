@@ -29,6 +29,9 @@ export interface SourceStatus {
   last_check: string | null
   logs_collected: number
   last_error: string | null
+  round_trips?: number
+  interval?: number
+  backlog?: boolean
 }
 
 export interface AgentStatus {